@@ -0,0 +1,178 @@
+# admission.py
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+class Overloaded(Exception):
+    """
+    Raised instead of queueing a call the limiter cannot admit in time.
+    retry_after is a suggested client back-off in whole seconds.
+    """
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Upstream is overloaded ({reason}), retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit with a bounded wait queue, adjusted by AIMD on observed latency.
+
+    Every completed call reports its latency. A call is "slow" when it takes longer than
+    `tolerance` times the no-load baseline: the lowest successful latency seen over the
+    last one to two `window`s, so a permanently slower upstream becomes the new normal.
+    Slow or failed calls shrink the limit by `backoff` (at most once per latency period,
+    so one bad burst counts once); fast calls while the limit is in use grow it by
+    1/limit, i.e. about one slot per round trip. Callers beyond the limit wait in FIFO
+    order; when the queue is full, or a caller waited `queue_timeout` seconds, Overloaded
+    is raised right away instead of letting work pile up behind a slow upstream.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 32,
+        min_limit: int = 1,
+        max_limit: int = 256,
+        queue_size: int = 128,
+        queue_timeout: float = 5.0,
+        tolerance: float = 2.0,
+        backoff: float = 0.9,
+        window: float = 30.0,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self._limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.window = window
+
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # windowed minimum: lowest latency of the previous and of the current window
+        self._previous_min: Optional[float] = None
+        self._current_min: Optional[float] = None
+        self._window_start = time.monotonic()
+        # smoothed latency, for Retry-After estimates
+        self._latency = 0.0
+        self._last_decrease = 0.0
+        self.rejected: Dict[str, int] = {"queue_full": 0, "queue_timeout": 0}
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def baseline(self) -> Optional[float]:
+        candidates = [v for v in (self._previous_min, self._current_min) if v is not None]
+        return min(candidates) if candidates else None
+
+    def _observe_baseline(self, latency: float, now: float) -> None:
+        if now - self._window_start >= self.window:
+            self._previous_min, self._current_min = self._current_min, None
+            self._window_start = now
+        if self._current_min is None or latency < self._current_min:
+            self._current_min = latency
+
+    def retry_after(self) -> int:
+        """
+        Seconds until the current queue should have drained, at least 1.
+        """
+        drain = (self.queued + 1) / max(self.limit, 1) * (self._latency or 1.0)
+        return max(1, min(60, math.ceil(drain)))
+
+    async def acquire(self) -> None:
+        if self._in_flight < self.limit and not self._waiters:
+            self._in_flight += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            self.rejected["queue_full"] += 1
+            raise Overloaded("queue full", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._forget(future)
+            self.rejected["queue_timeout"] += 1
+            raise Overloaded("queue timeout", self.retry_after())
+        except BaseException:
+            self._forget(future)
+            raise
+
+    def _forget(self, future: asyncio.Future) -> None:
+        if future.done() and not future.cancelled():
+            # the slot was handed over just as the caller gave up; pass it on
+            self._in_flight -= 1
+            self._wake()
+            return
+        future.cancel()
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+
+    def _wake(self) -> None:
+        while self._waiters and self._in_flight < self.limit:
+            future = self._waiters.popleft()
+            if future.done():
+                continue
+            # the slot is taken on the waiter's behalf before it runs
+            self._in_flight += 1
+            future.set_result(None)
+
+    def release(self, latency: float, ok: bool = True) -> None:
+        """
+        Free a slot and feed the call's outcome into the limit. ok=False for failures
+        that indicate upstream distress (timeouts, connection errors, 5xx, 429).
+        """
+        self._in_flight -= 1
+        now = time.monotonic()
+        self._latency = latency if not self._latency else 0.8 * self._latency + 0.2 * latency
+
+        baseline = self.baseline
+        if ok:
+            self._observe_baseline(latency, now)
+
+        slow = baseline is not None and latency > baseline * self.tolerance
+        if not ok or slow:
+            if now - self._last_decrease >= max(latency, baseline or 0.0):
+                self._limit = max(self.min_limit, self._limit * self.backoff)
+                self._last_decrease = now
+        elif self._in_flight + 1 >= self.limit or self._waiters:
+            # only grow while the limit is actually what holds calls back
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+        self._wake()
+
+    def cancel(self) -> None:
+        """
+        Free a slot whose call was abandoned (e.g. the losing half of a hedged pair)
+        without feeding it into the limit.
+        """
+        self._in_flight -= 1
+        self._wake()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "queued": self.queued,
+            "baseline_latency": round(self.baseline, 4) if self.baseline is not None else None,
+            "rejected_queue_full": self.rejected["queue_full"],
+            "rejected_queue_timeout": self.rejected["queue_timeout"],
+        }
@@ -0,0 +1,206 @@
+# backends.py
+import abc
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from metrics import REGISTRY, Gauge, stage
+from microbatch import MicroBatcher
+from upstream import UpstreamError, close_client, roboflow_detect, start_client, warm_up_client
+from utils import ImageData, load_class_names
+from config import (
+    DETECTION_BACKEND,
+    ROBOFLOW_API_URL,
+    ROBOFLOW_CLASS_NAMES,
+    ONNX_MODEL_PATH,
+    ONNX_CLASS_NAMES,
+    ONNX_WORKERS,
+    ONNX_INTRA_OP_THREADS,
+    ONNX_BATCH_SIZE,
+    ONNX_CONF_THRESHOLD,
+    ONNX_IOU_THRESHOLD,
+    ONNX_MAX_DETECTIONS,
+    ONNX_INPUT_SIZE,
+    ONNX_OUTPUT_FORMAT,
+    MICROBATCH_ENABLED,
+    MICROBATCH_MAX_SIZE,
+    MICROBATCH_MAX_WAIT_MS,
+    MICROBATCH_MAX_IN_FLIGHT,
+    WARMUP_CONNECTIONS,
+    WARMUP_TIMEOUT,
+)
+
+# (image, filename, content_type)
+ImageItem = Tuple[ImageData, str, str]
+
+
+class DetectionBackend(abc.ABC):
+    """
+    Turns an image into a Roboflow-style response ({"predictions": [...], "image": {...}}),
+    the shape normalize_roboflow_response consumes. Failures raise UpstreamError.
+    """
+
+    name = ""
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def warm_up(self) -> None:
+        """
+        Called after start(), before the worker takes traffic.
+        """
+        pass
+
+    def labels(self) -> List[str]:
+        """
+        Class names the backend can return, when known up front.
+        """
+        return []
+
+    @abc.abstractmethod
+    def signature(self) -> str:
+        """
+        Identifies the model, so cached results of different models are not mixed up.
+        """
+
+    @abc.abstractmethod
+    async def detect(self, image: ImageData, filename: str, content_type: str) -> Dict[str, Any]:
+        """
+        The Roboflow-style response for one image.
+        """
+
+    async def detect_many(self, items: List[ImageItem]) -> List[Union[Dict[str, Any], UpstreamError]]:
+        """
+        One response or UpstreamError per item. Backends that batch natively override this.
+        """
+        results = await asyncio.gather(*(self.detect(*item) for item in items), return_exceptions=True)
+        for r in results:
+            if isinstance(r, BaseException) and not isinstance(r, UpstreamError):
+                raise r
+        return results
+
+
+class RoboflowBackend(DetectionBackend):
+    """
+    The hosted Roboflow model, through the pooled client in upstream.py
+    (admission control, retries, hedging and circuit breaker included).
+    """
+
+    name = "roboflow"
+
+    async def start(self) -> None:
+        await start_client()
+
+    async def close(self) -> None:
+        await close_client()
+
+    async def warm_up(self) -> None:
+        if WARMUP_CONNECTIONS > 0:
+            await warm_up_client(WARMUP_CONNECTIONS, WARMUP_TIMEOUT)
+
+    def labels(self) -> List[str]:
+        return load_class_names(ROBOFLOW_CLASS_NAMES)
+
+    def signature(self) -> str:
+        return ROBOFLOW_API_URL
+
+    async def detect(self, image: ImageData, filename: str, content_type: str) -> Dict[str, Any]:
+        return await roboflow_detect(image, filename, content_type)
+
+
+class OnnxBackend(DetectionBackend):
+    """
+    An exported YOLO model run locally on CPU with ONNX Runtime (see onnx_backend.py).
+    Concurrent single-image calls are coalesced into micro-batches (MICROBATCH_*),
+    so one forward pass serves several requests.
+    """
+
+    name = "onnx"
+
+    def __init__(self):
+        from onnx_backend import OnnxRunner
+
+        self.runner = OnnxRunner(
+            model_path=ONNX_MODEL_PATH,
+            class_names=load_class_names(ONNX_CLASS_NAMES),
+            workers=ONNX_WORKERS,
+            intra_op_threads=ONNX_INTRA_OP_THREADS,
+            batch_size=ONNX_BATCH_SIZE,
+            conf_threshold=ONNX_CONF_THRESHOLD,
+            iou_threshold=ONNX_IOU_THRESHOLD,
+            max_detections=ONNX_MAX_DETECTIONS,
+            input_size=ONNX_INPUT_SIZE,
+            output_format=ONNX_OUTPUT_FORMAT,
+        )
+        self.batcher: Optional[MicroBatcher] = None
+        if MICROBATCH_ENABLED:
+            self.batcher = MicroBatcher(
+                self._run_batch,
+                max_batch_size=MICROBATCH_MAX_SIZE,
+                max_wait=MICROBATCH_MAX_WAIT_MS / 1000,
+                max_in_flight=MICROBATCH_MAX_IN_FLIGHT,
+            )
+            batcher = self.batcher
+            REGISTRY.register(Gauge(
+                "roadsign_microbatch_config", "Micro-batching limits: max batch size and max wait in seconds.", ("setting",),
+                callback=lambda: {("max_batch_size",): batcher.max_batch_size, ("max_wait_seconds",): batcher.max_wait},
+            ))
+            REGISTRY.register(Gauge(
+                "roadsign_microbatch_pending", "Images waiting to be batched.",
+                callback=lambda: {(): batcher.stats()["pending"]},
+            ))
+
+    async def start(self) -> None:
+        await self.runner.start()
+
+    async def close(self) -> None:
+        self.runner.close()
+
+    def labels(self) -> List[str]:
+        return list(self.runner.info.get("names") or [])
+
+    def signature(self) -> str:
+        r = self.runner
+        return f"onnx:{r.digest}:{r.conf_threshold}:{r.iou_threshold}:{r.max_detections}"
+
+    async def detect(self, image: ImageData, filename: str, content_type: str) -> Dict[str, Any]:
+        if self.batcher is not None:
+            return await self.batcher.submit(await read_image_bytes(image))
+        result = (await self.detect_many([(image, filename, content_type)]))[0]
+        if isinstance(result, UpstreamError):
+            raise result
+        return result
+
+    async def detect_many(self, items: List[ImageItem]) -> List[Union[Dict[str, Any], UpstreamError]]:
+        return await self._run_batch([await read_image_bytes(image) for image, _, _ in items])
+
+    async def _run_batch(self, images: List[bytes]) -> List[Union[Dict[str, Any], UpstreamError]]:
+        try:
+            with stage("inference"):
+                results = await self.runner.infer(images)
+        except Exception as e:
+            raise UpstreamError(500, f"Local inference failed: {e}")
+        return [UpstreamError(400, r) if isinstance(r, str) else r for r in results]
+
+
+async def read_image_bytes(image: ImageData) -> bytes:
+    if isinstance(image, bytes):
+        return image
+    # worker processes need the bytes themselves
+    image.seek(0)
+    return await asyncio.to_thread(image.read)
+
+
+_BACKENDS = {"roboflow": RoboflowBackend, "onnx": OnnxBackend}
+
+
+def create_backend(name: str = DETECTION_BACKEND) -> DetectionBackend:
+    """
+    The backend selected by DETECTION_BACKEND.
+    """
+    try:
+        return _BACKENDS[name]()
+    except KeyError:
+        raise RuntimeError(f"Unknown detection backend {name!r}; expected one of {', '.join(_BACKENDS)}")
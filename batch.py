@@ -0,0 +1,167 @@
+# batch.py
+import asyncio
+import mimetypes
+import tarfile
+import zipfile
+from collections import deque
+from typing import IO, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, NamedTuple, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".gif", ".tif", ".tiff")
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+class BatchItem(NamedTuple):
+    name: str
+    data: bytes
+    content_type: str
+    # set instead of data when the item could not be read (e.g. a broken archive)
+    error: Optional[str] = None
+    error_status: int = 400
+
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def is_image_name(name: str) -> bool:
+    base = name.rsplit("/", 1)[-1]
+    # skip hidden files and macOS resource forks (__MACOSX/._foo.jpg)
+    return not base.startswith(".") and "__MACOSX/" not in name and name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def guess_type(name: str) -> str:
+    return mimetypes.guess_type(name)[0] or "image/jpeg"
+
+
+def iter_archive(filename: str, fileobj: IO[bytes], max_items: int, max_member_bytes: Optional[int] = None) -> Iterator[BatchItem]:
+    """
+    Yield the image members of a zip or tar archive one at a time as BatchItems,
+    named by their path inside the archive. Non-image members are ignored; members
+    larger than max_member_bytes are yielded with an error instead of being read.
+    Blocking; drive it from a thread. Raises ValueError for unreadable archives
+    or when more than max_items images are found.
+    """
+    too_big = f"File exceeds the {max_member_bytes} byte limit"
+    count = 0
+    try:
+        if filename.lower().endswith(".zip"):
+            with zipfile.ZipFile(fileobj) as zf:
+                for info in zf.infolist():
+                    if info.is_dir() or not is_image_name(info.filename):
+                        continue
+                    count += 1
+                    if count > max_items:
+                        raise ValueError(f"Archive contains more than {max_items} images")
+                    if max_member_bytes is not None and info.file_size > max_member_bytes:
+                        yield BatchItem(info.filename, b"", guess_type(info.filename), error=too_big, error_status=413)
+                        continue
+                    yield BatchItem(info.filename, zf.read(info), guess_type(info.filename))
+        else:
+            # stream mode: members are read sequentially, never the whole archive at once
+            with tarfile.open(fileobj=fileobj, mode="r|*") as tf:
+                for member in tf:
+                    if not member.isfile() or not is_image_name(member.name):
+                        continue
+                    count += 1
+                    if count > max_items:
+                        raise ValueError(f"Archive contains more than {max_items} images")
+                    if max_member_bytes is not None and member.size > max_member_bytes:
+                        yield BatchItem(member.name, b"", guess_type(member.name), error=too_big, error_status=413)
+                        continue
+                    f = tf.extractfile(member)
+                    if f is not None:
+                        yield BatchItem(member.name, f.read(), guess_type(member.name))
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        raise ValueError(f"Could not read archive {filename}: {e}")
+
+
+async def aiter_archive(
+    filename: str, fileobj: IO[bytes], max_items: int, max_member_bytes: Optional[int] = None
+) -> AsyncIterator[BatchItem]:
+    """
+    Async wrapper around iter_archive: each member is read in a worker thread.
+    """
+    members = iter_archive(filename, fileobj, max_items, max_member_bytes)
+    done = object()
+    while True:
+        item = await asyncio.to_thread(next, members, done)
+        if item is done:
+            return
+        yield item
+
+
+async def as_completed_bounded(
+    items: AsyncIterator[T], worker: Callable[[T], Awaitable[R]], limit: int
+) -> AsyncIterator[Tuple[T, R]]:
+    """
+    Run worker(item) for every item with at most `limit` calls in flight and yield
+    (item, result) pairs in completion order. Items are pulled from the source only
+    when a slot frees up, so memory stays flat regardless of the number of items.
+    """
+    pending: Dict[asyncio.Task, T] = {}
+    source = items.__aiter__()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < limit:
+                try:
+                    item = await source.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                pending[asyncio.ensure_future(worker(item))] = item
+            if not pending:
+                return
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield pending.pop(task), task.result()
+    finally:
+        # client went away or the source failed: do not leave upstream calls running
+        for task in pending:
+            task.cancel()
+
+
+async def ordered_bounded(
+    items: AsyncIterator[T], worker: Callable[[T], Awaitable[R]], limit: int
+) -> AsyncIterator[Tuple[T, R]]:
+    """
+    Like as_completed_bounded, but (item, result) pairs are yielded in source order:
+    up to `limit` calls run ahead while the oldest one is awaited.
+    """
+    pending: Deque[Tuple[T, asyncio.Future]] = deque()
+    source = items.__aiter__()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < limit:
+                try:
+                    item = await source.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                pending.append((item, asyncio.ensure_future(worker(item))))
+            if not pending:
+                return
+            item, task = pending.popleft()
+            yield item, await task
+    finally:
+        for _, task in pending:
+            task.cancel()
+
+
+def unique_name(name: str, seen: set) -> str:
+    """
+    Results are keyed by filename; disambiguate repeated names as name#2, name#3, ...
+    """
+    if name not in seen:
+        seen.add(name)
+        return name
+    n = 2
+    while f"{name}#{n}" in seen:
+        n += 1
+    name = f"{name}#{n}"
+    seen.add(name)
+    return name
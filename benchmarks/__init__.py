@@ -0,0 +1,10 @@
+# benchmarks/__init__.py
+"""
+Local benchmarks: a stub Roboflow server, load scenarios against the API, and
+normalization microbenchmarks. Results are written as JSON for comparing commits.
+
+    python -m benchmarks.stub_server --port 9000 --latency 50
+    python -m benchmarks.load --spawn --scenario all --out load.json
+    python -m benchmarks.micro --out micro.json
+    python -m benchmarks.compare base.json head.json
+"""
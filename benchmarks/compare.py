@@ -0,0 +1,75 @@
+# benchmarks/compare.py
+import argparse
+import json
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# metric path -> True when higher is better
+_LOAD_METRICS = {
+    ("throughput_rps",): True,
+    ("images_per_s",): True,
+    ("latency_ms", "p50"): False,
+    ("latency_ms", "p90"): False,
+    ("latency_ms", "p99"): False,
+}
+_MICRO_METRICS = {("best_us",): False}
+
+
+def _get(result: Dict[str, Any], path: Tuple[str, ...]) -> Optional[float]:
+    value: Any = result
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value if isinstance(value, (int, float)) else None
+
+
+def compare(base: Dict[str, Any], head: Dict[str, Any], threshold: float) -> Iterator[Tuple[str, float, float, float, bool]]:
+    """
+    Yield (metric, base, head, relative change, regressed) for every metric present
+    in both result documents. A change counts as a regression when it is worse than
+    threshold (e.g. 0.1 = 10%).
+    """
+    metrics = _MICRO_METRICS if base.get("kind") == "micro" else _LOAD_METRICS
+    for name, base_result in base["results"].items():
+        head_result = head["results"].get(name)
+        if head_result is None:
+            continue
+        for path, higher_is_better in metrics.items():
+            old, new = _get(base_result, path), _get(head_result, path)
+            if old is None or new is None or old == 0:
+                continue
+            change = (new - old) / old
+            regressed = -change > threshold if higher_is_better else change > threshold
+            yield f"{name}:{'.'.join(path)}", old, new, change, regressed
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args(argv)
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.head, encoding="utf-8") as f:
+        head = json.load(f)
+    if base.get("kind") != head.get("kind"):
+        parser.error(f"cannot compare {base.get('kind')} results with {head.get('kind')} results")
+
+    print(f"base {base.get('commit')}  head {head.get('commit')}")
+    regressions: List[str] = []
+    for metric, old, new, change, regressed in compare(base, head, args.threshold):
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{metric:50s} {old:12.3f} -> {new:12.3f}  {change:+7.1%}{flag}")
+        if regressed:
+            regressions.append(metric)
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+# benchmarks/load.py
+import argparse
+import asyncio
+import io
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import aiohttp
+from PIL import Image
+
+from benchmarks.results import ROOT, percentiles, write_results
+
+SCENARIOS = ("sustained", "burst", "large", "duplicates", "batch", "batch_stream")
+
+
+def make_jpeg(width: int, height: int, seed: int = 0, quality: int = 90) -> bytes:
+    """
+    A noisy JPEG (noise does not compress, so the size is realistic for camera frames).
+    """
+    rng = random.Random(seed)
+    img = Image.frombytes("RGB", (width, height), rng.randbytes(width * height * 3))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=quality)
+    return out.getvalue()
+
+
+class ImagePool:
+    """
+    Hands out request bodies. With distinct=None every image is unique (a counter is
+    appended after the JPEG end marker, which decoders ignore), so each request misses
+    the result cache; otherwise images are drawn from a pool of `distinct` variants.
+    Each pool has its own random prefix, so scenarios never hit each other's cache entries.
+    """
+
+    def __init__(self, base: bytes, distinct: Optional[int] = None, seed: int = 0):
+        self.base = base + b"bench" + os.urandom(8)
+        self.distinct = distinct
+        self.rng = random.Random(seed)
+        self.counter = 0
+
+    def next(self) -> bytes:
+        if self.distinct is None:
+            self.counter += 1
+            n = self.counter
+        else:
+            n = self.rng.randrange(self.distinct)
+        return self.base + n.to_bytes(8, "big")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.items = 0
+
+    def add(self, status: Any, latency: float, items: int = 1) -> None:
+        self.statuses[str(status)] += 1
+        if status == 200:
+            self.latencies.append(latency)
+        self.items += items
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        total = sum(self.statuses.values())
+        return {
+            "requests": total,
+            "ok": self.statuses.get("200", 0),
+            "statuses": dict(self.statuses),
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+            "images_per_s": round(self.items / elapsed, 2) if elapsed else None,
+            "latency_ms": percentiles(self.latencies),
+        }
+
+
+async def _post_image(session: aiohttp.ClientSession, url: str, image: bytes, rec: Recorder, start: Optional[float] = None) -> None:
+    form = aiohttp.FormData()
+    form.add_field("file", image, filename="bench.jpg", content_type="image/jpeg")
+    start = time.perf_counter() if start is None else start
+    try:
+        async with session.post(url, data=form) as resp:
+            await resp.read()
+            status = resp.status
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        status = type(e).__name__
+    rec.add(status, time.perf_counter() - start)
+
+
+async def _post_batch(session: aiohttp.ClientSession, url: str, images: List[bytes], rec: Recorder) -> None:
+    form = aiohttp.FormData()
+    for i, image in enumerate(images):
+        form.add_field("files", image, filename=f"bench{i}.jpg", content_type="image/jpeg")
+    start = time.perf_counter()
+    try:
+        async with session.post(url, data=form) as resp:
+            await resp.read()
+            status = resp.status
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        status = type(e).__name__
+    rec.add(status, time.perf_counter() - start, items=len(images))
+
+
+async def _closed_loop(requests: int, concurrency: int, send: Callable[[], Any]) -> None:
+    remaining = iter(range(requests))
+
+    async def client():
+        for _ in remaining:
+            await send()
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+
+
+async def sustained(session, base_url: str, args) -> Dict[str, Any]:
+    """
+    Open-loop constant arrival rate: a request is started every 1/rps seconds whether
+    or not earlier ones have finished. Latency is measured from the scheduled start,
+    so server stalls are not hidden by the client slowing down.
+    """
+    rec = Recorder()
+    pool = ImagePool(make_jpeg(640, 480, args.seed), seed=args.seed)
+    url = f"{base_url}/detect"
+    tasks = set()
+    dropped = 0
+    total = int(args.rps * args.duration)
+    t0 = time.perf_counter()
+    for i in range(total):
+        scheduled = t0 + i / args.rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(tasks) >= args.max_in_flight:
+            dropped += 1
+            continue
+        task = asyncio.ensure_future(_post_image(session, url, pool.next(), rec, start=scheduled))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    result = rec.summary(time.perf_counter() - t0)
+    result.update(target_rps=args.rps, dropped=dropped)
+    return result
+
+
+async def burst(session, base_url: str, args) -> Dict[str, Any]:
+    """
+    `bursts` rounds of `burst_size` simultaneous requests, `burst_interval` seconds apart.
+    """
+    rec = Recorder()
+    pool = ImagePool(make_jpeg(640, 480, args.seed), seed=args.seed)
+    url = f"{base_url}/detect"
+    t0 = time.perf_counter()
+    for n in range(args.bursts):
+        await asyncio.gather(*(_post_image(session, url, pool.next(), rec) for _ in range(args.burst_size)))
+        if n + 1 < args.bursts:
+            await asyncio.sleep(args.burst_interval)
+    result = rec.summary(time.perf_counter() - t0)
+    result.update(burst_size=args.burst_size, bursts=args.bursts)
+    return result
+
+
+async def large(session, base_url: str, args) -> Dict[str, Any]:
+    """
+    Closed loop with large camera-sized images (upload, hashing and preprocessing cost).
+    """
+    rec = Recorder()
+    width, height = (int(v) for v in args.large_size.split("x"))
+    base = make_jpeg(width, height, args.seed)
+    pool = ImagePool(base, seed=args.seed)
+    url = f"{base_url}/detect"
+    t0 = time.perf_counter()
+    await _closed_loop(args.requests, args.concurrency, lambda: _post_image(session, url, pool.next(), rec))
+    result = rec.summary(time.perf_counter() - t0)
+    result.update(image_bytes=len(base), concurrency=args.concurrency)
+    return result
+
+
+async def duplicates(session, base_url: str, args) -> Dict[str, Any]:
+    """
+    Closed loop drawing from a small pool of distinct images, so most requests repeat
+    an earlier one (exercises the result cache and request coalescing).
+    """
+    rec = Recorder()
+    pool = ImagePool(make_jpeg(640, 480, args.seed), distinct=args.distinct, seed=args.seed)
+    url = f"{base_url}/detect"
+    t0 = time.perf_counter()
+    await _closed_loop(args.requests, args.concurrency, lambda: _post_image(session, url, pool.next(), rec))
+    result = rec.summary(time.perf_counter() - t0)
+    result.update(distinct_images=args.distinct, concurrency=args.concurrency)
+    return result
+
+
+async def _batch(session, base_url: str, args, path: str) -> Dict[str, Any]:
+    rec = Recorder()
+    pool = ImagePool(make_jpeg(640, 480, args.seed), seed=args.seed)
+    url = f"{base_url}{path}"
+    requests = max(1, args.requests // args.batch_size)
+    t0 = time.perf_counter()
+    await _closed_loop(
+        requests, args.concurrency,
+        lambda: _post_batch(session, url, [pool.next() for _ in range(args.batch_size)], rec),
+    )
+    result = rec.summary(time.perf_counter() - t0)
+    result.update(batch_size=args.batch_size, concurrency=args.concurrency)
+    return result
+
+
+async def batch(session, base_url: str, args) -> Dict[str, Any]:
+    """
+    Closed loop of /detect/batch requests with batch_size images each.
+    """
+    return await _batch(session, base_url, args, "/detect/batch")
+
+
+async def batch_stream(session, base_url: str, args) -> Dict[str, Any]:
+    """
+    Same as batch, against the NDJSON streaming endpoint (latency is until the last line).
+    """
+    return await _batch(session, base_url, args, "/detect/batch/stream")
+
+
+_RUNNERS = {
+    "sustained": sustained,
+    "burst": burst,
+    "large": large,
+    "duplicates": duplicates,
+    "batch": batch,
+    "batch_stream": batch_stream,
+}
+
+
+async def _stub_stats(session, stub_url: Optional[str], reset: bool = False) -> Optional[Dict[str, Any]]:
+    if not stub_url:
+        return None
+    try:
+        if reset:
+            async with session.post(f"{stub_url}/_stats/reset") as resp:
+                return await resp.json()
+        async with session.get(f"{stub_url}/_stats") as resp:
+            return await resp.json()
+    except aiohttp.ClientError:
+        return None
+
+
+async def run(base_url: str, scenarios: List[str], args, stub_url: Optional[str] = None) -> Dict[str, Any]:
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    # no client-side pool limit: the server, not the load generator, should be the bottleneck
+    connector = aiohttp.TCPConnector(limit=0)
+    results: Dict[str, Any] = {}
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        for name in scenarios:
+            print(f"running {name} ...", file=sys.stderr, flush=True)
+            await _stub_stats(session, stub_url, reset=True)
+            result = await _RUNNERS[name](session, base_url, args)
+            stats = await _stub_stats(session, stub_url)
+            if stats is not None:
+                # upstream calls actually made, e.g. far fewer than requests with duplicates
+                result["upstream_requests"] = stats["requests"]
+                result["upstream_max_in_flight"] = stats["max_in_flight"]
+            results[name] = result
+            print(
+                f"  {result['ok']}/{result['requests']} ok, {result['throughput_rps']} req/s, "
+                f"p50 {result['latency_ms'].get('p50')} ms, p99 {result['latency_ms'].get('p99')} ms",
+                file=sys.stderr, flush=True,
+            )
+    return results
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url: str, proc: subprocess.Popen, timeout: float = 30) -> None:
+    import urllib.request
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"process exited with {proc.returncode} before {url} came up")
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"timed out waiting for {url}")
+
+
+@contextmanager
+def spawn(args) -> Iterator[Tuple[str, str]]:
+    """
+    Start the stub Roboflow server and the API (uvicorn, pointed at the stub) as
+    subprocesses; yields (api_url, stub_url) and stops both afterwards.
+    """
+    stub_port, api_port = _free_port(), _free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    api_url = f"http://127.0.0.1:{api_port}"
+    stub_cmd = [
+        sys.executable, "-m", "benchmarks.stub_server", "--port", str(stub_port),
+        "--latency", str(args.stub_latency), "--jitter", str(args.stub_jitter),
+        "--error-rate", str(args.stub_error_rate), "--predictions", str(args.stub_predictions),
+        "--format", args.stub_format,
+    ]
+    env = dict(os.environ, ROBOFLOW_API_URL=f"{stub_url}/model/1", ROBOFLOW_API_KEY="bench")
+    api_cmd = [
+        sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(api_port),
+        "--log-level", "warning", "--no-access-log",
+    ]
+    procs: List[subprocess.Popen] = []
+    try:
+        procs.append(subprocess.Popen(stub_cmd, cwd=ROOT, stdout=subprocess.DEVNULL))
+        _wait_for(f"{stub_url}/_stats", procs[0])
+        procs.append(subprocess.Popen(api_cmd, cwd=ROOT, env=env))
+        _wait_for(f"{api_url}/health", procs[1])
+        yield api_url, stub_url
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Load scenarios against the road sign API.")
+    parser.add_argument("--scenario", default="all", help=f"comma-separated: {', '.join(SCENARIOS)} or all")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="API base URL (ignored with --spawn)")
+    parser.add_argument("--stub-url", default=None, help="stub server base URL, to report upstream call counts")
+    parser.add_argument("--spawn", action="store_true", help="start the stub server and the API locally")
+    parser.add_argument("--out", default="-", help="JSON output path (default: stdout)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60, help="per-request client timeout, seconds")
+
+    load = parser.add_argument_group("load shape")
+    load.add_argument("--rps", type=float, default=50, help="sustained: arrival rate")
+    load.add_argument("--duration", type=float, default=10, help="sustained: seconds")
+    load.add_argument("--max-in-flight", type=int, default=1000, help="sustained: drop arrivals beyond this")
+    load.add_argument("--burst-size", type=int, default=100)
+    load.add_argument("--bursts", type=int, default=3)
+    load.add_argument("--burst-interval", type=float, default=1.0)
+    load.add_argument("--requests", type=int, default=200, help="closed-loop scenarios: total images")
+    load.add_argument("--concurrency", type=int, default=16, help="closed-loop scenarios: parallel clients")
+    load.add_argument("--large-size", default="4000x3000", help="large: image WIDTHxHEIGHT")
+    load.add_argument("--distinct", type=int, default=10, help="duplicates: distinct images in the pool")
+    load.add_argument("--batch-size", type=int, default=20, help="batch scenarios: images per request")
+
+    stub = parser.add_argument_group("stub server (with --spawn)")
+    stub.add_argument("--stub-latency", type=float, default=50, help="milliseconds")
+    stub.add_argument("--stub-jitter", type=float, default=10, help="milliseconds")
+    stub.add_argument("--stub-error-rate", type=float, default=0.0)
+    stub.add_argument("--stub-predictions", type=int, default=5)
+    stub.add_argument("--stub-format", default="center")
+    args = parser.parse_args(argv)
+
+    scenarios = list(SCENARIOS) if args.scenario == "all" else args.scenario.split(",")
+    for name in scenarios:
+        if name not in _RUNNERS:
+            parser.error(f"unknown scenario {name!r}")
+
+    params = {k: v for k, v in vars(args).items() if k not in ("out", "url", "stub_url")}
+    params["scenarios"] = scenarios
+    if args.spawn:
+        with spawn(args) as (api_url, stub_url):
+            results = asyncio.run(run(api_url, scenarios, args, stub_url))
+    else:
+        results = asyncio.run(run(args.url.rstrip("/"), scenarios, args, args.stub_url))
+    write_results("load", results, args.out, params)
+
+
+if __name__ == "__main__":
+    main()
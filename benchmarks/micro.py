@@ -0,0 +1,76 @@
+# benchmarks/micro.py
+import argparse
+import sys
+import timeit
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.payloads import FORMATS, make_response
+from benchmarks.results import write_results
+from utils import normalize_roboflow_response
+
+# name -> function under test, called with one Roboflow response
+TARGETS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    "normalize": lambda rf: normalize_roboflow_response(rf),
+    "normalize_no_raw": lambda rf: normalize_roboflow_response(rf, include_raw=False),
+}
+
+
+def bench(func: Callable[[], Any], min_time: float, repeat: int) -> Dict[str, float]:
+    """
+    Best-of-`repeat` time per call in microseconds, with the loop count chosen so
+    each repeat runs for at least min_time seconds.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    while number * (timer.timeit(number) / number) < min_time:
+        number *= 2
+    runs = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "best_us": round(min(runs) * 1e6, 3),
+        "median_us": round(sorted(runs)[len(runs) // 2] * 1e6, 3),
+        "loops": number,
+    }
+
+
+def run(formats: List[str], sizes: List[int], targets: List[str], min_time: float, repeat: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for fmt in formats:
+        for n in sizes:
+            rf_json = make_response(fmt, n)
+            for name in targets:
+                func = TARGETS[name]
+                key = f"{name}/{fmt}/{n}"
+                results[key] = bench(lambda: func(rf_json), min_time, repeat)
+                print(f"{key:40s} {results[key]['best_us']:12.2f} us", file=sys.stderr)
+    return results
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Microbenchmarks for Roboflow response normalization.")
+    parser.add_argument("--formats", default=",".join(FORMATS), help="comma-separated prediction layouts")
+    parser.add_argument("--sizes", default="0,1,10,100,1000", help="comma-separated prediction counts")
+    parser.add_argument("--targets", default=",".join(TARGETS), help="comma-separated functions to time")
+    parser.add_argument("--min-time", type=float, default=0.05, help="minimum seconds per repeat")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", default="-", help="JSON output path (default: stdout)")
+    args = parser.parse_args(argv)
+
+    params = {
+        "formats": args.formats.split(","),
+        "sizes": [int(s) for s in args.sizes.split(",")],
+        "targets": args.targets.split(","),
+        "min_time": args.min_time,
+        "repeat": args.repeat,
+    }
+    for name in params["targets"]:
+        if name not in TARGETS:
+            parser.error(f"unknown target {name!r}")
+    for fmt in params["formats"]:
+        if fmt not in FORMATS:
+            parser.error(f"unknown format {fmt!r}")
+    results = run(params["formats"], params["sizes"], params["targets"], args.min_time, args.repeat)
+    write_results("micro", results, args.out, params)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/payloads.py
+import random
+from typing import Any, Callable, Dict, List
+
+# sign classes used in generated predictions
+LABELS = ("stop", "yield", "no entry", "speed limit 50", "pedestrian crossing", "roundabout", "no parking", "traffic light")
+
+
+def _center(rng: random.Random, n: int) -> List[Dict[str, Any]]:
+    # Roboflow hosted API format
+    return [
+        {
+            "class": rng.choice(LABELS),
+            "confidence": round(rng.uniform(0.05, 0.99), 3),
+            "x": round(rng.uniform(0, 640), 1),
+            "y": round(rng.uniform(0, 480), 1),
+            "width": round(rng.uniform(8, 200), 1),
+            "height": round(rng.uniform(8, 200), 1),
+            "class_id": rng.randrange(len(LABELS)),
+        }
+        for _ in range(n)
+    ]
+
+
+def _center_alt(rng: random.Random, n: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "label": rng.choice(LABELS),
+            "score": round(rng.uniform(0.05, 0.99), 3),
+            "cx": round(rng.uniform(0, 640), 1),
+            "cy": round(rng.uniform(0, 480), 1),
+            "w": round(rng.uniform(8, 200), 1),
+            "h": round(rng.uniform(8, 200), 1),
+        }
+        for _ in range(n)
+    ]
+
+
+def _xyxy(rng: random.Random) -> List[float]:
+    x1, y1 = rng.uniform(0, 600), rng.uniform(0, 440)
+    return [round(x1, 1), round(y1, 1), round(x1 + rng.uniform(8, 200), 1), round(y1 + rng.uniform(8, 200), 1)]
+
+
+def _bbox_list(rng: random.Random, n: int) -> List[Dict[str, Any]]:
+    return [
+        {"name": rng.choice(LABELS), "confidence_score": round(rng.uniform(0.05, 0.99), 3), "bbox": _xyxy(rng)}
+        for _ in range(n)
+    ]
+
+
+def _bbox_dict(rng: random.Random, n: int) -> List[Dict[str, Any]]:
+    preds = []
+    for _ in range(n):
+        x1, y1, x2, y2 = _xyxy(rng)
+        preds.append({
+            "class": rng.choice(LABELS),
+            "confidence": round(rng.uniform(0.05, 0.99), 3),
+            "bounding_box": {"left": x1, "top": y1, "right": x2, "bottom": y2},
+        })
+    return preds
+
+
+def _mixed(rng: random.Random, n: int) -> List[Dict[str, Any]]:
+    # one of each layout in turn; forces the per-dict path of the columnar normalizer
+    makers = (_center, _center_alt, _bbox_list, _bbox_dict)
+    return [makers[i % len(makers)](rng, 1)[0] for i in range(n)]
+
+
+# prediction layout name -> generator(rng, n)
+FORMATS: Dict[str, Callable[[random.Random, int], List[Dict[str, Any]]]] = {
+    "center": _center,
+    "center_alt": _center_alt,
+    "bbox_list": _bbox_list,
+    "bbox_dict": _bbox_dict,
+    "mixed": _mixed,
+}
+
+# top-level key the predictions are returned under, per layout
+_PREDICTIONS_KEY = {"center_alt": "preds", "bbox_list": "objects"}
+
+
+def make_response(fmt: str, n: int, seed: int = 0) -> Dict[str, Any]:
+    """
+    A Roboflow-like response with n predictions in the given layout (see FORMATS).
+    """
+    rng = random.Random(seed)
+    return {
+        "time": 0.05,
+        "image": {"width": 640, "height": 480},
+        _PREDICTIONS_KEY.get(fmt, "predictions"): FORMATS[fmt](rng, n),
+    }
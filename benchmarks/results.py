@@ -0,0 +1,64 @@
+# benchmarks/results.py
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """
+    Latency summary in milliseconds (samples are seconds).
+    """
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        "min": round(ordered[0] * 1000, 3),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": round(ordered[-1] * 1000, 3),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 3),
+    }
+
+
+def write_results(kind: str, results: Dict[str, Any], path: Optional[str], params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Wrap results with run metadata (commit, Python, platform, time) and write them
+    as JSON to path, or stdout when path is None or "-".
+    """
+    document = {
+        "kind": kind,
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "params": params or {},
+        "results": results,
+    }
+    text = json.dumps(document, indent=2, sort_keys=True)
+    if path in (None, "-"):
+        sys.stdout.write(text + "\n")
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return document
@@ -0,0 +1,101 @@
+# benchmarks/stub_server.py
+import argparse
+import asyncio
+import json
+import random
+from typing import Optional
+
+from aiohttp import web
+
+from benchmarks.payloads import FORMATS, make_response
+
+
+class StubRoboflow:
+    """
+    Stands in for the Roboflow hosted detect endpoint: accepts any POST (the body is
+    read and discarded), waits latency ± jitter and answers with a canned prediction
+    payload, or with error_status for a share of requests given by error_rate.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        predictions: int = 5,
+        fmt: str = "center",
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        # serialized once; the payload is the same for every request
+        self.body = json.dumps(make_response(fmt, predictions, seed)).encode("utf-8")
+        self.stats = {"requests": 0, "errors": 0, "bytes_received": 0, "in_flight": 0, "max_in_flight": 0}
+
+    async def detect(self, request: web.Request) -> web.Response:
+        stats = self.stats
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            stats["bytes_received"] += len(await request.read())
+            delay = self.latency + (self.rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.error_rate and self.rng.random() < self.error_rate:
+                stats["errors"] += 1
+                return web.Response(status=self.error_status, text="stub error")
+            return web.Response(body=self.body, content_type="application/json")
+        finally:
+            stats["in_flight"] -= 1
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    async def reset_stats(self, request: web.Request) -> web.Response:
+        for key in self.stats:
+            if key != "in_flight":
+                self.stats[key] = 0
+        return web.json_response(self.stats)
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=1024 * 1024 * 1024)
+        app.router.add_get("/_stats", self.get_stats)
+        app.router.add_post("/_stats/reset", self.reset_stats)
+        # any model id / version, like https://detect.roboflow.com/<model>/<version>
+        app.router.add_post("/{tail:.*}", self.detect)
+        return app
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Stub Roboflow detect server for local benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=50, help="response delay in milliseconds")
+    parser.add_argument("--jitter", type=float, default=0, help="uniform ± jitter on the delay, milliseconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--predictions", type=int, default=5, help="predictions per response")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="center", help="prediction layout")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    stub = StubRoboflow(
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        predictions=args.predictions,
+        fmt=args.format,
+        seed=args.seed,
+    )
+    print(f"stub Roboflow listening on http://{args.host}:{args.port}/model/1", flush=True)
+    web.run_app(stub.app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# cache.py
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from utils import ImageData, iter_image_chunks
+
+
+# bump when the shape of cached values changes so stale disk entries are not served
+CACHE_FORMAT_VERSION = 2
+
+
+def cache_key(image: ImageData, model_url: str) -> str:
+    """
+    Content address for a detection: sha256 over the model URL and the raw image bytes.
+    File objects are hashed chunk by chunk (blocking; run it in a thread for those).
+    """
+    h = hashlib.sha256()
+    h.update(f"v{CACHE_FORMAT_VERSION}|{model_url}".encode("utf-8"))
+    h.update(b"\0")
+    for chunk in iter_image_chunks(image):
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def _retrieve_exception(task: asyncio.Task) -> None:
+    # a computation whose callers all went away must not log "exception never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+class _DiskTier:
+    """
+    Optional SQLite-backed second tier so cached results survive restarts.
+    Values are stored as JSON text together with their absolute expiry time.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS detections (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.purge_expired()
+
+    def get(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM detections WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at <= time.time():
+            return None
+        return expires_at, json.loads(value)
+
+    def set(self, key: str, value: Dict[str, Any], expires_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO detections (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM detections WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+            return cur.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class DetectionCache:
+    """
+    Bounded in-memory LRU with TTL in front of an optional on-disk tier.
+
+    Concurrent lookups for the same key are coalesced (single-flight): only the
+    first caller runs the upstream call, the others await its result.
+    """
+
+    # purge expired rows from the disk tier every this many writes
+    PURGE_EVERY = 1000
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._disk = _DiskTier(disk_path) if disk_path else None
+        self._writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    def _get_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_memory(self, key: str, value: Dict[str, Any], expires_at: float) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def _get_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        if self._disk is None:
+            return None
+        found = await asyncio.to_thread(self._disk.get, key)
+        if found is None:
+            return None
+        # promote to memory
+        expires_at, value = found
+        self._set_memory(key, value, expires_at)
+        return value
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look the key up in memory, then on disk. Disk hits are promoted to memory.
+        """
+        value = self._get_memory(key)
+        if value is None:
+            value = await self._get_disk(key)
+            if value is not None:
+                self.disk_hits += 1
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        expires_at = time.time() + self.ttl
+        self._set_memory(key, value, expires_at)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.set, key, value, expires_at)
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                await asyncio.to_thread(self._disk.purge_expired)
+
+    async def get_or_compute(
+        self, key: str, compute: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Return (value, cached). On a miss, run compute() once per key even if many
+        callers ask for it concurrently; callers that joined a running computation get
+        cached=False like its initiator. The computation runs in a task of its own, so
+        a caller that is cancelled never cancels it for the others. Failures are
+        propagated and not cached.
+        """
+        value = self._get_memory(key)
+        if value is not None:
+            self.hits += 1
+            return value, True
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # register before any await so duplicates arriving meanwhile join this flight
+            task = self._inflight[key] = asyncio.ensure_future(self._fill(key, compute))
+            task.add_done_callback(_retrieve_exception)
+        return await asyncio.shield(task)
+
+    async def _fill(
+        self, key: str, compute: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Tuple[Dict[str, Any], bool]:
+        try:
+            value = await self._get_disk(key)
+            if value is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                return value, True
+
+            self.misses += 1
+            value = await compute()
+            await self.set(key, value)
+            return value, False
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "disk_tier": self._disk is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "inflight": len(self._inflight),
+        }
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
@@ -4,11 +4,264 @@ import os
 
 load_dotenv()
 
+
+def _available_cpus() -> int:
+    """
+    CPUs this process may use: its CPU affinity, capped by a cgroup CPU quota. In
+    containers os.cpu_count() reports the host's cores, not the container's share.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # not available on macOS / Windows
+        cpus = os.cpu_count() or 1
+    quota = period = None
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+    except (OSError, ValueError):
+        try:
+            # cgroup v1: quota -1 when unlimited
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                quota = f.read().strip()
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = f.read().strip()
+        except OSError:
+            pass
+    try:
+        if quota not in (None, "max", "-1"):
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except ValueError:
+        pass
+    return cpus
+
+
+# where detections come from: roboflow (hosted API) or onnx (local model file)
+DETECTION_BACKEND = os.getenv("DETECTION_BACKEND", "roboflow").lower()
+
 ROBOFLOW_API_URL = os.getenv("ROBOFLOW_API_URL")
 ROBOFLOW_API_KEY = os.getenv("ROBOFLOW_API_KEY")
 REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "15"))
+# the hosted model's class names (file with one per line, or comma-separated), for the
+# class table of binary responses; without them every label is sent inline
+ROBOFLOW_CLASS_NAMES = os.getenv("ROBOFLOW_CLASS_NAMES") or None
+
+# upstream connection pool (shared keep-alive client)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "512"))
+HTTP_POOL_SIZE_PER_HOST = int(os.getenv("HTTP_POOL_SIZE_PER_HOST", "256"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+
+# detection result cache (in-memory LRU, optional SQLite tier when CACHE_DB_PATH is set)
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "3600"))
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH") or None
+
+# optional downscale + re-encode before upload (boxes are mapped back to original coordinates)
+PREPROCESS_ENABLED = os.getenv("PREPROCESS_ENABLED", "false").lower() in ("1", "true", "yes")
+PREPROCESS_MAX_SIDE = int(os.getenv("PREPROCESS_MAX_SIDE", "1024"))
+PREPROCESS_FORMAT = os.getenv("PREPROCESS_FORMAT", "JPEG").upper()
+PREPROCESS_QUALITY = int(os.getenv("PREPROCESS_QUALITY", "85"))
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(min(4, _available_cpus()))))
+
+# default for the include_raw query parameter:
+#   none = detections only, top = plus the Roboflow response, full = plus each prediction's raw dict
+RESPONSE_INCLUDE_RAW = os.getenv("RESPONSE_INCLUDE_RAW", "none").lower()
+
+# defaults for the ?nms= / ?iou_threshold= detection filters
+NMS_ENABLED = os.getenv("NMS_ENABLED", "false").lower() in ("1", "true", "yes")
+NMS_IOU_THRESHOLD = float(os.getenv("NMS_IOU_THRESHOLD", "0.5"))
+
+# upload limits: per image, and per request body for the batch endpoints
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv("MAX_BATCH_UPLOAD_BYTES", str(512 * 1024 * 1024)))
+
+# POST /detect/batch: upstream calls in flight per batch, images per batch (archives included)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+
+# admission control in front of Roboflow: adaptive concurrency limit plus a bounded wait queue;
+# calls that cannot be admitted fail fast with 503 + Retry-After
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+ADMISSION_INITIAL_LIMIT = int(os.getenv("ADMISSION_INITIAL_LIMIT", "32"))
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "4"))
+ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", str(HTTP_POOL_SIZE_PER_HOST)))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "256"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+# a call slower than this multiple of the no-load latency shrinks the limit
+ADMISSION_LATENCY_TOLERANCE = float(os.getenv("ADMISSION_LATENCY_TOLERANCE", "2.0"))
+
+# retries for transient Roboflow failures (connection errors, timeouts, 5xx, 429) with
+# full-jitter exponential backoff; all attempts share one REQUEST_TIMEOUT budget
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_RETRY_BACKOFF = float(os.getenv("UPSTREAM_RETRY_BACKOFF", "0.1"))
+UPSTREAM_RETRY_BACKOFF_MAX = float(os.getenv("UPSTREAM_RETRY_BACKOFF_MAX", "2.0"))
+# hedged requests: send a second call when the first is slower than the recent quantile latency
+UPSTREAM_HEDGE_ENABLED = os.getenv("UPSTREAM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+UPSTREAM_HEDGE_QUANTILE = float(os.getenv("UPSTREAM_HEDGE_QUANTILE", "0.95"))
+UPSTREAM_HEDGE_MIN_DELAY = float(os.getenv("UPSTREAM_HEDGE_MIN_DELAY", "0.05"))
+# circuit breaker: after this many consecutive failures, fail fast for CIRCUIT_RESET_TIMEOUT seconds
+CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() in ("1", "true", "yes")
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+# local ONNX Runtime backend (DETECTION_BACKEND=onnx): an exported YOLOv5/v8 detector.
+# ONNX_CLASS_NAMES is a names file (one per line) or a comma-separated list; by default
+# the names stored in the model's export metadata are used.
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH") or None
+ONNX_CLASS_NAMES = os.getenv("ONNX_CLASS_NAMES") or None
+ONNX_WORKERS = int(os.getenv("ONNX_WORKERS", "1"))
+# threads per inference inside each worker process; workers x threads ~ CPU cores
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", str(max(1, _available_cpus() // ONNX_WORKERS))))
+ONNX_BATCH_SIZE = int(os.getenv("ONNX_BATCH_SIZE", "8"))
+ONNX_CONF_THRESHOLD = float(os.getenv("ONNX_CONF_THRESHOLD", "0.25"))
+ONNX_IOU_THRESHOLD = float(os.getenv("ONNX_IOU_THRESHOLD", "0.45"))
+ONNX_MAX_DETECTIONS = int(os.getenv("ONNX_MAX_DETECTIONS", "300"))
+# used when the model's input size is dynamic
+ONNX_INPUT_SIZE = int(os.getenv("ONNX_INPUT_SIZE", "640"))
+ONNX_OUTPUT_FORMAT = os.getenv("ONNX_OUTPUT_FORMAT", "auto").lower()
+
+# micro-batching for the local backend: concurrent requests share one batched inference.
+# A batch goes out when MICROBATCH_MAX_SIZE images are waiting or the oldest waited
+# MICROBATCH_MAX_WAIT_MS; at most MICROBATCH_MAX_IN_FLIGHT batches run at once.
+MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "true").lower() in ("1", "true", "yes")
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", str(ONNX_BATCH_SIZE)))
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", "5"))
+MICROBATCH_MAX_IN_FLIGHT = int(os.getenv("MICROBATCH_MAX_IN_FLIGHT", str(ONNX_WORKERS)))
+
+# /detect/video: frames are sampled at VIDEO_SAMPLE_FPS (0 = every frame); a frame whose
+# perceptual hash differs from the last analyzed one by at most VIDEO_DEDUP_THRESHOLD bits
+# (of 64) is skipped. Frame sequences are assumed to be shot at VIDEO_SEQUENCE_FPS.
+VIDEO_SAMPLE_FPS = float(os.getenv("VIDEO_SAMPLE_FPS", "2"))
+VIDEO_SEQUENCE_FPS = float(os.getenv("VIDEO_SEQUENCE_FPS", "10"))
+VIDEO_DEDUP_THRESHOLD = int(os.getenv("VIDEO_DEDUP_THRESHOLD", "4"))
+VIDEO_TRACK_IOU = float(os.getenv("VIDEO_TRACK_IOU", "0.3"))
+# seconds a sign may go unseen before its track is closed
+VIDEO_TRACK_MAX_GAP = float(os.getenv("VIDEO_TRACK_MAX_GAP", "1.0"))
+VIDEO_CONCURRENCY = int(os.getenv("VIDEO_CONCURRENCY", "4"))
+VIDEO_MAX_FRAMES = int(os.getenv("VIDEO_MAX_FRAMES", "2000"))
+VIDEO_JPEG_QUALITY = int(os.getenv("VIDEO_JPEG_QUALITY", "90"))
+MAX_VIDEO_UPLOAD_BYTES = int(os.getenv("MAX_VIDEO_UPLOAD_BYTES", str(512 * 1024 * 1024)))
+
+# /ws/detect: largest binary frame accepted; larger ones close the connection (1009)
+WS_MAX_FRAME_BYTES = int(os.getenv("WS_MAX_FRAME_BYTES", str(MAX_UPLOAD_BYTES)))
+
+# background jobs (POST /jobs): SQLite queue and stored uploads live in JOBS_DIR.
+# Results are checkpointed every JOBS_CHECKPOINT_EVERY images; a job whose worker
+# stopped renewing its lease for JOBS_LEASE_SECONDS is resumed by another worker.
+JOBS_ENABLED = os.getenv("JOBS_ENABLED", "true").lower() in ("1", "true", "yes")
+JOBS_DIR = os.getenv("JOBS_DIR", "jobs")
+JOBS_CONCURRENCY = int(os.getenv("JOBS_CONCURRENCY", "8"))
+JOBS_CHECKPOINT_EVERY = int(os.getenv("JOBS_CHECKPOINT_EVERY", "64"))
+JOBS_LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "30"))
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "1.0"))
+JOBS_MAX_ITEMS = int(os.getenv("JOBS_MAX_ITEMS", "1000000"))
+# an image whose detection failed transiently (5xx, timeout) stays pending and the job
+# pauses with jittered exponential backoff (or the upstream Retry-After); after
+# JOBS_MAX_ATTEMPTS failed attempts the image is recorded as failed
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+JOBS_RETRY_BACKOFF = float(os.getenv("JOBS_RETRY_BACKOFF", "2.0"))
+JOBS_RETRY_BACKOFF_MAX = float(os.getenv("JOBS_RETRY_BACKOFF_MAX", "60"))
+MAX_JOB_UPLOAD_BYTES = int(os.getenv("MAX_JOB_UPLOAD_BYTES", str(4 * 1024 * 1024 * 1024)))
+# directory that `path` references may point into; unset disables them
+JOBS_SOURCE_ROOT = os.getenv("JOBS_SOURCE_ROOT") or None
+
+# tiled inference (?tiled=true): images larger than TILE_SIZE are cut into overlapping
+# tiles sent concurrently; tiles with a mean edge strength below TILE_MIN_EDGE are skipped.
+# TILE_INCLUDE_FULL adds the usual whole-image call so large, close signs are kept too.
+TILING_ENABLED = os.getenv("TILING_ENABLED", "false").lower() in ("1", "true", "yes")
+TILE_SIZE = int(os.getenv("TILE_SIZE", "1024"))
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.2"))
+TILE_MIN_EDGE = float(os.getenv("TILE_MIN_EDGE", "2.0"))
+TILE_CONCURRENCY = int(os.getenv("TILE_CONCURRENCY", "8"))
+TILE_INCLUDE_FULL = os.getenv("TILE_INCLUDE_FULL", "true").lower() in ("1", "true", "yes")
+TILE_MERGE_THRESHOLD = float(os.getenv("TILE_MERGE_THRESHOLD", "0.5"))
+TILE_JPEG_QUALITY = int(os.getenv("TILE_JPEG_QUALITY", "90"))
+
+# near-duplicate answers for fixed cameras (?camera= on /detect, and /ws/detect): an image
+# whose perceptual hash is within NEAR_DUP_THRESHOLD bits (of 64) of one from the same
+# camera analyzed in the last NEAR_DUP_TTL seconds gets that image's result
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "false").lower() in ("1", "true", "yes")
+NEAR_DUP_THRESHOLD = int(os.getenv("NEAR_DUP_THRESHOLD", "4"))
+NEAR_DUP_TTL = float(os.getenv("NEAR_DUP_TTL", "10"))
+# recent images kept per camera, and cameras kept (least recently seen dropped)
+NEAR_DUP_MAX_ENTRIES = int(os.getenv("NEAR_DUP_MAX_ENTRIES", "256"))
+NEAR_DUP_MAX_SCOPES = int(os.getenv("NEAR_DUP_MAX_SCOPES", "1024"))
+
+# per-client rate limiting of images sent for detection (429 when exceeded). Clients are
+# told apart by the RATE_LIMIT_KEY_HEADER API key when it is listed in RATE_LIMIT_TENANTS
+# (a JSON file of per-key limits), otherwise by IP address. Each gets a token bucket of
+# RATE_LIMIT_BURST images refilled at RATE_LIMIT_RATE per second and, when
+# RATE_LIMIT_DAILY > 0, a cap per UTC day. Daily usage is kept in RATE_LIMIT_DB_PATH, and
+# so are the buckets when serve.py runs several workers.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "false").lower() in ("1", "true", "yes")
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", "5"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "20"))
+RATE_LIMIT_DAILY = int(os.getenv("RATE_LIMIT_DAILY", "0"))
+RATE_LIMIT_TENANTS = os.getenv("RATE_LIMIT_TENANTS") or None
+RATE_LIMIT_KEY_HEADER = os.getenv("RATE_LIMIT_KEY_HEADER", "X-API-Key")
+# results served from the cache cost nothing upstream, so they are not charged
+RATE_LIMIT_EXEMPT_CACHE_HITS = os.getenv("RATE_LIMIT_EXEMPT_CACHE_HITS", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "ratelimit.sqlite3") or None
+RATE_LIMIT_FLUSH_INTERVAL = float(os.getenv("RATE_LIMIT_FLUSH_INTERVAL", "5"))
+# reverse proxies in front of the app: the client IP is the X-Forwarded-For entry the
+# outermost of them appended, counted from the right. Entries further left are whatever
+# the client sent and are ignored. 0: use the connection's peer address.
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", "0"))
+
+# production launcher (python serve.py): WORKERS uvicorn processes on HOST:PORT. Defaults to
+# one per available CPU (the container's CPU quota, not the host's cores) for roboflow, and
+# 1 for onnx, whose model already runs in ONNX_WORKERS processes.
+WORKERS = int(os.getenv("WORKERS") or (_available_cpus() if DETECTION_BACKEND == "roboflow" else 1))
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+# SQLite cache tier the workers share when CACHE_DB_PATH is not set
+SHARED_CACHE_DB_PATH = os.getenv("SHARED_CACHE_DB_PATH", "cache.sqlite3")
+# number of processes serving the app, exported by serve.py; the admission limits are
+# divided by it so they hold for the whole deployment, not for each worker
+WORKER_PROCESSES = max(1, int(os.getenv("ROADSIGN_WORKER_PROCESSES", "1")))
+
+# startup warm-up, done by every worker before it accepts traffic: WARMUP_CONNECTIONS
+# keep-alive connections to the Roboflow host, image codecs and the description index
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "5"))
+
+if DETECTION_BACKEND not in ("roboflow", "onnx"):
+    raise RuntimeError(f"DETECTION_BACKEND must be roboflow or onnx, got {DETECTION_BACKEND}")
+
+if ONNX_OUTPUT_FORMAT not in ("auto", "yolov5", "yolov8"):
+    raise RuntimeError(f"ONNX_OUTPUT_FORMAT must be auto, yolov5 or yolov8, got {ONNX_OUTPUT_FORMAT}")
+
+if DETECTION_BACKEND == "onnx" and not ONNX_MODEL_PATH:
+    raise RuntimeError("DETECTION_BACKEND=onnx needs ONNX_MODEL_PATH pointing at an exported model")
+
+if RATE_LIMIT_ENABLED and (RATE_LIMIT_RATE <= 0 or RATE_LIMIT_BURST < 1):
+    raise RuntimeError("RATE_LIMIT_RATE must be positive and RATE_LIMIT_BURST at least 1")
+
+if RATE_LIMIT_PROXY_HOPS < 0:
+    raise RuntimeError(f"RATE_LIMIT_PROXY_HOPS must not be negative, got {RATE_LIMIT_PROXY_HOPS}")
+
+if not 0 <= NEAR_DUP_THRESHOLD <= 64:
+    raise RuntimeError(f"NEAR_DUP_THRESHOLD must be between 0 and 64 bits, got {NEAR_DUP_THRESHOLD}")
+
+if JOBS_MAX_ATTEMPTS < 1:
+    raise RuntimeError(f"JOBS_MAX_ATTEMPTS must be at least 1, got {JOBS_MAX_ATTEMPTS}")
+
+if WORKERS < 1:
+    raise RuntimeError(f"WORKERS must be at least 1, got {WORKERS}")
+
+if not 0 <= TILE_OVERLAP < 1:
+    raise RuntimeError(f"TILE_OVERLAP must be in [0, 1), got {TILE_OVERLAP}")
+
+if RESPONSE_INCLUDE_RAW not in ("none", "top", "full"):
+    raise RuntimeError(f"RESPONSE_INCLUDE_RAW must be none, top or full, got {RESPONSE_INCLUDE_RAW}")
+
+if PREPROCESS_FORMAT not in ("JPEG", "WEBP"):
+    raise RuntimeError(f"PREPROCESS_FORMAT must be JPEG or WEBP, got {PREPROCESS_FORMAT}")
 
-if not ROBOFLOW_API_URL or not ROBOFLOW_API_KEY:
+if DETECTION_BACKEND == "roboflow" and (not ROBOFLOW_API_URL or not ROBOFLOW_API_KEY):
     raise RuntimeError(
         "Please set ROBOFLOW_API_URL and ROBOFLOW_API_KEY environment variables. "
         f"Current values: ROBOFLOW_API_URL={ROBOFLOW_API_URL}, ROBOFLOW_API_KEY={'set' if ROBOFLOW_API_KEY else 'not set'}"
@@ -0,0 +1,212 @@
+# descriptions.py
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set
+
+# Plain-language explanation per sign label (keys are lowercase).
+# Order matters: partial matches resolve to the first matching entry.
+SIGN_DESCRIPTIONS: Dict[str, str] = {
+    # Stop signs
+    "stop": "Come to a full stop and check for traffic.",
+    "stop sign": "Come to a full stop and check for traffic.",
+    "stop_sign": "Come to a full stop and proceed only when safe.",
+
+    # Parking
+    "no parking": "Parking is not allowed in this area.",
+
+    # Turns
+    "no u-turn": "U-turns are prohibited here.",
+    "no left turn": "Left turns are not permitted at this point.",
+    "no right turn": "Right turns are not permitted at this point.",
+    "turn left": "You are required to turn left.",
+    "turn right": "You are required to turn right.",
+    "turn left ahead": "Left turn ahead — slow down and prepare to turn.",
+    "turn right ahead": "Right turn ahead — slow down and prepare to turn.",
+
+    # Directional
+    "one way street": "Traffic flows only in one direction.",
+    "one way": "Traffic flows only in one direction.",
+    "straight ahead only": "You may only go straight — no turns allowed.",
+    "go straight or turn right": "You may proceed straight or turn right — no left turn allowed.",
+    "go straight or turn left": "You may proceed straight or turn left — no right turn allowed.",
+
+    # Yield/Give Way
+    "yield": "Slow down and let other vehicles go first.",
+    "give way": "Slow down and give priority to other vehicles before proceeding.",
+    "give way to oncoming": "Yield to oncoming traffic.",
+
+    # Pedestrian
+    "pedestrian crossing": "Slow down and watch for people crossing.",
+    "children crossing": "Slow down; children may cross the road here.",
+    "beware of children": "Children may be crossing — slow down and stay alert.",
+    "bicycle crossing": "Bicycles crossing ahead — slow down and watch.",
+
+    # Speed limits
+    "speed limit 20 kmph": "Maximum speed allowed is 20 km/h — drive slowly.",
+    "speed limit 30 kmph": "Maximum speed allowed is 30 km/h.",
+    "speed limit 30 km/h": "Maximum speed is 30 km/h in this area.",
+    "speed limit 40 km/h": "Maximum speed is 40 km/h in this area.",
+    "speed limit 50 kmph": "Maximum speed allowed is 50 km/h.",
+    "speed limit 50 km/h": "Maximum speed is 50 km/h in this area.",
+    "speed limit 60 km/h": "Maximum speed is 60 km/h in this area.",
+    "speed limit 70 km/h": "Maximum speed is 70 km/h in this area.",
+    "speed limit 80 km/h": "Maximum speed is 80 km/h in this area.",
+    "50 mph speed limit": "Maximum speed allowed is 50 mph — do not exceed.",
+    "end of all speed and passing limits": "Previous speed and passing limits are lifted — drive responsibly.",
+    "end of speed limit": "Previous speed limit ends — adjust accordingly.",
+
+    # Road conditions
+    "roadworks ahead": "Construction work ahead — slow down.",
+    "slippery road": "Road may be slippery when wet — proceed carefully.",
+    "slippery road ahead": "Road may be slippery — reduce speed and avoid sudden turns or brakes.",
+    "bumpy road": "Uneven surface ahead — reduce your speed.",
+    "uneven road": "Road surface ahead is uneven — reduce speed to avoid bumps.",
+
+    # Entry restrictions
+    "no entry": "Do not enter — road is closed or one-way against you.",
+    "no_over_taking": "Overtaking other vehicles is prohibited in this area.",
+    "no overtaking": "Overtaking is prohibited in this area.",
+    "overtaking by trucks is prohibited": "Trucks are not allowed to overtake here.",
+
+    # Traffic control
+    "roundabout": "Approaching roundabout — yield and follow flow.",
+    "round-about": "Roundabout ahead — yield and follow circular flow of traffic.",
+    "traffic light ahead": "Traffic signal ahead — be ready to stop.",
+    "traffic_signal": "Traffic lights ahead — be prepared to stop or slow down.",
+
+    # Keep direction
+    "keep left": "Stay on the left side of the road.",
+    "keep-left": "Stay on the left side of the road or obstacle.",
+    "keep right": "Stay on the right side of the road.",
+    "keep-right": "Stay on the right side of the road or obstacle.",
+
+    # Road features
+    "road narrows": "Road ahead becomes narrower — drive cautiously.",
+    "road narrows on right": "Right side of the road becomes narrower — slow down and keep left.",
+    "two-way traffic ahead": "Be aware that traffic moves in both directions.",
+    "bridge ahead": "Bridge ahead — check speed and load restrictions.",
+    "tunnel ahead": "Tunnel coming up — turn on lights if needed.",
+
+    # Warnings
+    "stop sign ahead": "Prepare to stop ahead.",
+    "attention please-": "Pay attention — potential danger or special instructions ahead.",
+    "dangerous left curve ahead": "Sharp left curve ahead — reduce speed and navigate carefully.",
+    "dangerous rright curve ahead": "Sharp right curve ahead — reduce speed and navigate carefully.",
+    "left zig zag traffic": "Road curves left and right ahead — reduce speed and stay alert.",
+
+    # Restrictions
+    "no trucks": "Trucks are prohibited beyond this point.",
+    "truck traffic is prohibited": "Trucks are not allowed beyond this point.",
+
+    # Crossings
+    "animal crossing": "Animals may cross the road — stay alert.",
+    "railway crossing": "Railroad tracks ahead — proceed with caution.",
+    "falling rocks": "Possible falling rocks — drive carefully.",
+
+    # Zones
+    "school zone": "Slow down — children may be nearby.",
+    "no horns": "No use of horns in this area.",
+    "pedestrian zone": "Pedestrians only — vehicles must stop or park.",
+    "bus stop": "Bus stop ahead — watch for buses pulling out.",
+    "speed camera ahead": "Speed check zone ahead — keep within limits.",
+
+    # Cycle routes
+    "cycle route ahead warning": "Cyclists may be on the road — share the road and slow down.",
+}
+
+_SEPARATORS = re.compile(r"[\s_\-]+")
+_NGRAM = 3
+
+
+def _canonical(label: str) -> str:
+    """
+    Lowercase, trim and treat '_' / '-' / runs of whitespace as a single space.
+    """
+    return _SEPARATORS.sub(" ", label.lower()).strip()
+
+
+def _ngrams(text: str) -> Set[str]:
+    return {text[i:i + _NGRAM] for i in range(len(text) - _NGRAM + 1)}
+
+
+class DescriptionIndex:
+    """
+    Lookup structure built once at import time from SIGN_DESCRIPTIONS.
+
+    Matching order for a label:
+      1. exact match on the lowercased, trimmed label
+      2. exact match on the canonical form (separators collapsed to spaces)
+      3. partial match: the first entry whose key contains the label or is contained
+         in it. A trigram index narrows the candidates instead of scanning every key.
+    """
+
+    def __init__(self, descriptions: Dict[str, str]):
+        self._keys: List[str] = list(descriptions)
+        self._values: List[str] = list(descriptions.values())
+        self._exact: Dict[str, str] = dict(descriptions)
+        self._canonical: Dict[str, str] = {}
+        for key, desc in descriptions.items():
+            self._canonical.setdefault(_canonical(key), desc)
+        # trigram -> positions of keys containing it / starting with it
+        self._contains: Dict[str, Set[int]] = {}
+        self._starts: Dict[str, Set[int]] = {}
+        self._short: List[int] = []
+        for pos, key in enumerate(self._keys):
+            if len(key) < _NGRAM:
+                self._short.append(pos)
+                continue
+            self._starts.setdefault(key[:_NGRAM], set()).add(pos)
+            for gram in _ngrams(key):
+                self._contains.setdefault(gram, set()).add(pos)
+
+    def _partial(self, label: str) -> Optional[str]:
+        if len(label) < _NGRAM:
+            candidates = range(len(self._keys))
+        else:
+            # key in label  => key's leading trigram is one of the label's trigrams
+            # label in key  => key contains the label's leading trigram
+            grams = _ngrams(label)
+            found: Set[int] = set(self._contains.get(label[:_NGRAM], ()))
+            for gram in grams:
+                found |= self._starts.get(gram, set())
+            found.update(self._short)
+            candidates = sorted(found)
+        for pos in candidates:
+            key = self._keys[pos]
+            if key in label or label in key:
+                return self._values[pos]
+        return None
+
+    def lookup(self, label: str) -> Optional[str]:
+        lowered = label.lower().strip()
+        desc = self._exact.get(lowered)
+        if desc is None:
+            desc = self._canonical.get(_canonical(lowered))
+        if desc is None:
+            desc = self._partial(lowered)
+        return desc
+
+
+_INDEX = DescriptionIndex(SIGN_DESCRIPTIONS)
+
+
+@lru_cache(maxsize=4096)
+def describe_sign(label: str) -> str:
+    """
+    Description for a detected sign label. Memoized, so the partial-match cost is
+    paid once per distinct label.
+    """
+    desc = _INDEX.lookup(label)
+    if desc is not None:
+        return desc
+    return f'Pay attention to this "{label}" sign for important traffic information.'
+
+
+def add_descriptions(detections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Set `description` on every detection that has a label. Modifies and returns the list.
+    """
+    for d in detections:
+        label = d.get("label")
+        d["description"] = describe_sign(str(label)) if label is not None else None
+    return detections
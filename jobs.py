@@ -0,0 +1,520 @@
+# jobs.py
+import asyncio
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import IO, Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from batch import BatchItem, as_completed_bounded, guess_type, is_archive, is_image_name, iter_archive, unique_name
+from metrics import JOB_ITEMS
+from resilience import backoff_delay
+
+ACTIVE_STATUSES = ("queued", "running")
+
+# (name, path of the image on disk, content type, status, result JSON) of one job item
+ItemRow = Tuple[str, Optional[str], str, str, Optional[str]]
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+def save_upload(fileobj: IO[bytes], dest: str) -> None:
+    """
+    Copy an uploaded (spooled) file to disk. Blocking.
+    """
+    fileobj.seek(0)
+    with open(dest, "wb") as out:
+        shutil.copyfileobj(fileobj, out, 1024 * 1024)
+
+
+def resolve_source_path(path: str, root: Optional[str]) -> str:
+    """
+    Resolve a server-side directory or archive reference. Only paths below `root`
+    (JOBS_SOURCE_ROOT) are allowed; raises ValueError otherwise.
+    """
+    if not root:
+        raise ValueError("Path references are disabled; set JOBS_SOURCE_ROOT to allow them")
+    root = os.path.realpath(root)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError("Path is outside JOBS_SOURCE_ROOT")
+    if os.path.isdir(resolved) or (os.path.isfile(resolved) and is_archive(resolved)):
+        return resolved
+    raise ValueError("Path is not a directory or a zip/tar archive")
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class JobStore:
+    """
+    Durable job queue in SQLite: one row per job and one per image. Results are written
+    per item as workers checkpoint, so a restart only redoes images whose result was not
+    written yet. A job is owned by one worker at a time through a renewable lease, so
+    several processes can share the database. Blocking; call it from a thread.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        # autocommit; writes use explicit BEGIN IMMEDIATE transactions
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, source TEXT NOT NULL, options TEXT NOT NULL,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL, expanded INTEGER NOT NULL DEFAULT 0,"
+            " total INTEGER, processed INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT, owner TEXT, lease_until REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_items ("
+            " job_id TEXT NOT NULL, seq INTEGER NOT NULL, name TEXT NOT NULL, path TEXT, content_type TEXT NOT NULL,"
+            " status TEXT NOT NULL, result TEXT, PRIMARY KEY (job_id, seq))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS job_items_status ON job_items (job_id, status, seq)")
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def create(self, job_id: str, source: Dict[str, Any], options: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, source, options, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, json.dumps(source), json.dumps(options), now, now),
+            )
+
+    def claim(self, owner: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """
+        Take the oldest active job that no live worker holds (new, or its lease expired).
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'running') AND (lease_until IS NULL OR lease_until < ?)"
+                " ORDER BY created_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+                (owner, now + lease_seconds, now, row["id"]),
+            )
+        job = dict(row)
+        job["source"], job["options"] = json.loads(job["source"]), json.loads(job["options"])
+        return job
+
+    def set_items(self, job_id: str, items: List[ItemRow]) -> None:
+        """
+        Record the images of a job (replacing a partial listing from an interrupted run).
+        """
+        failed = sum(1 for item in items if item[3] == "failed")
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+            conn.executemany(
+                "INSERT INTO job_items (job_id, seq, name, path, content_type, status, result) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((job_id, seq, *item) for seq, item in enumerate(items)),
+            )
+            conn.execute(
+                "UPDATE jobs SET expanded = 1, total = ?, processed = ?, failed = ?, updated_at = ? WHERE id = ?",
+                (len(items), failed, failed, time.time(), job_id),
+            )
+
+    def pending(self, job_id: str, after_seq: int, limit: int) -> List[Tuple[int, str, str, str]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, name, path, content_type FROM job_items"
+                " WHERE job_id = ? AND status = 'pending' AND seq > ? ORDER BY seq LIMIT ?",
+                (job_id, after_seq, limit),
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def checkpoint(
+        self, job_id: str, owner: str, lease_seconds: float, results: List[Tuple[int, bool, str]]
+    ) -> str:
+        """
+        Write finished items (seq, failed, result JSON) and renew the lease.
+        Returns the job status, or "lost" when another worker took the job over.
+        """
+        now = time.time()
+        done = failed = 0
+        with self._transaction() as conn:
+            for seq, item_failed, result in results:
+                cur = conn.execute(
+                    "UPDATE job_items SET status = ?, result = ? WHERE job_id = ? AND seq = ? AND status = 'pending'",
+                    ("failed" if item_failed else "done", result, job_id, seq),
+                )
+                # a result written by another worker is not counted twice
+                if cur.rowcount:
+                    done += 1
+                    failed += item_failed
+            conn.execute(
+                "UPDATE jobs SET processed = processed + ?, failed = failed + ?, updated_at = ? WHERE id = ?",
+                (done, failed, now, job_id),
+            )
+            row = conn.execute("SELECT status, owner FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return "lost"
+            if row["owner"] != owner:
+                return "lost" if row["status"] in ACTIVE_STATUSES else row["status"]
+            conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (now + lease_seconds, job_id))
+        return row["status"]
+
+    def finish(self, job_id: str, owner: str, status: str, error: Optional[str] = None) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, owner = NULL, lease_until = NULL, updated_at = ?"
+                " WHERE id = ? AND owner = ? AND status IN ('queued', 'running')",
+                (status, error, time.time(), job_id, owner),
+            )
+
+    def release(self, job_id: str, owner: str) -> None:
+        """
+        Give a job back without finishing it (shutdown), so the next worker resumes it at once.
+        """
+        with self._transaction() as conn:
+            conn.execute("UPDATE jobs SET lease_until = NULL WHERE id = ? AND owner = ?", (job_id, owner))
+
+    def pause(self, job_id: str, owner: str, until: float) -> None:
+        """
+        Give a job back until `until` (epoch seconds): no worker claims it before then.
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET owner = NULL, lease_until = ?, updated_at = ?"
+                " WHERE id = ? AND owner = ? AND status IN ('queued', 'running')",
+                (until, time.time(), job_id, owner),
+            )
+
+    def renew(self, job_id: str, owner: str, lease_seconds: float) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND owner = ?", (time.time() + lease_seconds, job_id, owner)
+            )
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancel an active job. Returns its row as it was before, or None when the job
+        does not exist or has already ended.
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT status, owner, lease_until FROM jobs WHERE id = ? AND status IN ('queued', 'running')", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', owner = NULL, lease_until = NULL, updated_at = ? WHERE id = ?",
+                (time.time(), job_id),
+            )
+        return dict(row)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, created_at, updated_at, total, processed, failed, error FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def results(self, job_id: str, offset: int, limit: int, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        One page of a job's items in image order, optionally only those with `status`.
+        """
+        query = "SELECT seq, name, status, result FROM job_items WHERE job_id = ?"
+        params: List[Any] = [job_id]
+        if status is not None:
+            query += " AND status = ?"
+            params.append(status)
+        query += " ORDER BY seq LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        page = []
+        for seq, name, item_status, result in rows:
+            entry = {"index": seq, "filename": name, "status": item_status}
+            if result is not None:
+                entry.update(json.loads(result))
+            page.append(entry)
+        return page
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobRunner:
+    """
+    Background worker of one API process: claims jobs from the JobStore, lists their
+    images once (extracting archives into the job directory), then runs detect() over
+    the pending images with at most `concurrency` calls in flight. Results are
+    checkpointed every `checkpoint_every` images (or every second); an interrupted job
+    is resumed from its pending images by whichever worker claims it next. When an
+    image is refused by the rate limiter (429) or fails transiently (5xx, timeout), it
+    stays pending and the job is paused until its Retry-After has passed, or for a
+    backoff delay; after `max_attempts` transient failures the image is failed.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        jobs_dir: str,
+        detect: Callable[[BatchItem, Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        concurrency: int = 8,
+        checkpoint_every: int = 64,
+        lease_seconds: float = 30.0,
+        poll_interval: float = 1.0,
+        max_items: int = 1_000_000,
+        max_member_bytes: Optional[int] = None,
+        max_attempts: int = 5,
+        retry_backoff: float = 2.0,
+        retry_backoff_max: float = 60.0,
+    ):
+        self.store = store
+        self.jobs_dir = jobs_dir
+        self.detect = detect
+        self.concurrency = max(1, concurrency)
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_items = max_items
+        self.max_member_bytes = max_member_bytes
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        # job id -> {item seq: transient failures so far}, while this worker runs the job
+        self._attempts: Dict[str, Dict[int, int]] = {}
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def job_dir(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, job_id)
+
+    def start(self) -> None:
+        self._wake = asyncio.Event()
+        self._task = asyncio.ensure_future(self._loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self) -> None:
+        """
+        A job was submitted: look for work now instead of at the next poll.
+        """
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _loop(self) -> None:
+        while True:
+            job = await asyncio.to_thread(self.store.claim, self.owner, self.lease_seconds)
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _heartbeat(self, job_id: str) -> None:
+        # keeps the lease while a long archive is listed or a slow image is detected
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await asyncio.to_thread(self.store.renew, job_id, self.owner, self.lease_seconds)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        heartbeat = asyncio.ensure_future(self._heartbeat(job_id))
+        try:
+            if not job["expanded"]:
+                items = await asyncio.to_thread(self._expand, job)
+                await asyncio.to_thread(self.store.set_items, job_id, items)
+            status = await self._process(job_id, job["options"])
+        except asyncio.CancelledError:
+            # shutting down: whatever was checkpointed stays done. The write may wait on
+            # SQLite's busy timeout, so it runs in a thread like every other store call
+            await asyncio.shield(asyncio.to_thread(self.store.release, job_id, self.owner))
+            raise
+        except Exception as e:
+            await asyncio.to_thread(self.store.finish, job_id, self.owner, "failed", str(e))
+            status = "failed"
+        else:
+            if status == "running":
+                await asyncio.to_thread(self.store.finish, job_id, self.owner, "done")
+        finally:
+            heartbeat.cancel()
+        if status != "paused":
+            self._attempts.pop(job_id, None)
+        if status not in ("lost", "paused"):
+            # stored uploads and extracted archive members are not needed any more
+            await asyncio.to_thread(shutil.rmtree, self.job_dir(job_id), True)
+
+    def _expand(self, job: Dict[str, Any]) -> List[ItemRow]:
+        """
+        List the images of a job. Blocking. Raises ValueError when the job has no
+        images or more than max_items.
+        """
+        source = job["source"]
+        items: List[ItemRow] = []
+        seen: set = set()
+        files_dir = os.path.join(self.job_dir(job["id"]), "files")
+
+        def add(name: str, path: Optional[str], content_type: str, error: Optional[Dict[str, Any]] = None) -> None:
+            if len(items) >= self.max_items:
+                raise ValueError(f"Job contains more than {self.max_items} images")
+            name = unique_name(name, seen)
+            if error is not None:
+                items.append((name, None, content_type, "failed", json.dumps({"error": error})))
+            else:
+                items.append((name, path, content_type, "pending", None))
+
+        def add_archive(name: str, path: str) -> None:
+            os.makedirs(files_dir, exist_ok=True)
+            try:
+                with open(path, "rb") as f:
+                    for member in iter_archive(name, f, self.max_items - len(items), self.max_member_bytes):
+                        if member.error is not None:
+                            add(member.name, None, member.content_type,
+                                {"status_code": member.error_status, "detail": member.error})
+                            continue
+                        dest = os.path.join(files_dir, str(len(items)))
+                        with open(dest, "wb") as out:
+                            out.write(member.data)
+                        add(member.name, dest, member.content_type)
+            except ValueError as e:
+                add(name, None, "application/octet-stream", {"status_code": 400, "detail": str(e)})
+
+        for upload in source.get("uploads", ()):
+            if is_archive(upload["name"]):
+                add_archive(upload["name"], upload["path"])
+            else:
+                add(upload["name"], upload["path"], upload["content_type"])
+
+        path = source.get("path")
+        if path and os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for filename in sorted(files):
+                    rel = os.path.relpath(os.path.join(root, filename), path)
+                    if is_image_name(rel):
+                        add(rel, os.path.join(root, filename), guess_type(rel))
+        elif path:
+            add_archive(os.path.basename(path), path)
+
+        if not items:
+            raise ValueError("No images found")
+        return items
+
+    def _retry_delay(self, job_id: str, seq: int, outcome: Dict[str, Any]) -> Optional[float]:
+        """
+        Seconds to wait before an item is tried again, or None when its outcome is final:
+        a result, a client error (4xx, undecodable image), or a transient failure that
+        has used up max_attempts. Refusals by the rate limiter are retried indefinitely.
+        """
+        error = outcome.get("error")
+        if error is None:
+            return None
+        status = error.get("status_code") or 500
+        retry_after = float(error.get("retry_after") or 0)
+        if status == 429:
+            return max(1.0, retry_after)
+        if status < 500 and status != 408:
+            return None
+        attempts = self._attempts.setdefault(job_id, {})
+        attempt = attempts.get(seq, 0) + 1
+        if attempt >= self.max_attempts:
+            return None
+        attempts[seq] = attempt
+        return max(retry_after, backoff_delay(attempt - 1, self.retry_backoff, self.retry_backoff_max))
+
+    async def _pending(self, job_id: str) -> AsyncIterator[Tuple[int, str, str, str]]:
+        after = -1
+        while True:
+            rows = await asyncio.to_thread(self.store.pending, job_id, after, self.checkpoint_every * 4)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+            after = rows[-1][0]
+
+    async def _process(self, job_id: str, options: Dict[str, Any]) -> str:
+        """
+        Detect all pending images of a job. Returns the job status at the end
+        ("running" when everything was processed, "paused" when images are left to retry).
+        """
+        resume_at: Optional[float] = None
+
+        async def rows() -> AsyncIterator[Tuple[int, str, str, str]]:
+            async for row in self._pending(job_id):
+                # paused: let the calls in flight finish, start no new ones
+                if resume_at is not None:
+                    return
+                yield row
+
+        async def worker(row: Tuple[int, str, str, str]) -> Dict[str, Any]:
+            _, name, path, content_type = row
+            try:
+                data = await asyncio.to_thread(_read_file, path)
+            except OSError:
+                return {"error": {"status_code": 400, "detail": "Could not read file"}}
+            return await self.detect(BatchItem(name, data, content_type), options)
+
+        async def checkpoint() -> str:
+            batch, buffer[:] = list(buffer), []
+            return await asyncio.to_thread(self.store.checkpoint, job_id, self.owner, self.lease_seconds, batch)
+
+        buffer: List[Tuple[int, bool, str]] = []
+        status = "running"
+        last_checkpoint = time.monotonic()
+        results = as_completed_bounded(rows(), worker, self.concurrency)
+        try:
+            async for row, outcome in results:
+                delay = self._retry_delay(job_id, row[0], outcome)
+                if delay is not None:
+                    # no result is written, so the item stays pending for the next run
+                    JOB_ITEMS.inc("deferred")
+                    resume_at = max(resume_at or 0.0, time.time() + delay)
+                    continue
+                failed = "error" in outcome
+                JOB_ITEMS.inc("failed" if failed else "done")
+                buffer.append((row[0], failed, json.dumps(outcome)))
+                if len(buffer) >= self.checkpoint_every or time.monotonic() - last_checkpoint >= 1.0:
+                    status = await checkpoint()
+                    last_checkpoint = time.monotonic()
+                    if status != "running":
+                        # cancelled, or another worker holds the job now
+                        return status
+            if buffer:
+                status = await checkpoint()
+        finally:
+            await results.aclose()
+        if status == "running" and resume_at is not None:
+            await asyncio.to_thread(self.store.pause, job_id, self.owner, resume_at)
+            return "paused"
+        return status
@@ -0,0 +1,48 @@
+# live.py
+import asyncio
+from typing import Generic, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class LatestSlot(Generic[T]):
+    """
+    One-item buffer between a producer that must never block (frames arriving on a
+    socket) and a slower consumer (detection): put() overwrites a value that was not
+    taken yet, so the consumer always gets the freshest one and nothing queues up.
+    """
+
+    def __init__(self):
+        self._item: Optional[T] = None
+        self._full = False
+        self._closed = False
+        self._event = asyncio.Event()
+        # values overwritten before they were taken, since the last take()
+        self._dropped = 0
+
+    def put(self, item: T) -> None:
+        if self._full:
+            self._dropped += 1
+        self._item, self._full = item, True
+        self._event.set()
+
+    def close(self) -> None:
+        """
+        Wake the consumer; take() returns None once the slot is empty.
+        """
+        self._closed = True
+        self._event.set()
+
+    async def take(self) -> Optional[Tuple[T, int]]:
+        """
+        Wait for the newest value. Returns (value, values dropped since the previous
+        take), or None when the slot is closed and empty.
+        """
+        while not self._full:
+            if self._closed:
+                return None
+            self._event.clear()
+            await self._event.wait()
+        item, dropped = self._item, self._dropped
+        self._item, self._full, self._dropped = None, False, 0
+        return item, dropped
@@ -1,551 +1,1060 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse, HTMLResponse
-import requests
-import io
-from config import ROBOFLOW_API_URL, ROBOFLOW_API_KEY, REQUEST_TIMEOUT
-from utils import normalize_roboflow_response
+import asyncio
+import json
+import logging
+import math
+import os
+import shutil
+import time
+import uuid
+from dataclasses import asdict
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Literal, Optional, Tuple
+from fastapi import Depends, FastAPI, File, Form, UploadFile, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, HTMLResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.requests import HTTPConnection
+from config import (
+    CACHE_ENABLED,
+    CACHE_MAX_ENTRIES,
+    CACHE_TTL,
+    CACHE_DB_PATH,
+    RESPONSE_INCLUDE_RAW,
+    NMS_ENABLED,
+    NMS_IOU_THRESHOLD,
+    MAX_UPLOAD_BYTES,
+    MAX_BATCH_UPLOAD_BYTES,
+    BATCH_CONCURRENCY,
+    BATCH_MAX_ITEMS,
+    MAX_VIDEO_UPLOAD_BYTES,
+    VIDEO_SAMPLE_FPS,
+    VIDEO_SEQUENCE_FPS,
+    VIDEO_DEDUP_THRESHOLD,
+    VIDEO_TRACK_IOU,
+    VIDEO_TRACK_MAX_GAP,
+    VIDEO_CONCURRENCY,
+    VIDEO_MAX_FRAMES,
+    VIDEO_JPEG_QUALITY,
+    WS_MAX_FRAME_BYTES,
+    JOBS_ENABLED,
+    JOBS_DIR,
+    JOBS_CONCURRENCY,
+    JOBS_CHECKPOINT_EVERY,
+    JOBS_LEASE_SECONDS,
+    JOBS_POLL_INTERVAL,
+    JOBS_MAX_ITEMS,
+    JOBS_MAX_ATTEMPTS,
+    JOBS_RETRY_BACKOFF,
+    JOBS_RETRY_BACKOFF_MAX,
+    JOBS_SOURCE_ROOT,
+    MAX_JOB_UPLOAD_BYTES,
+    TILING_ENABLED,
+    TILE_SIZE,
+    TILE_OVERLAP,
+    TILE_MIN_EDGE,
+    TILE_CONCURRENCY,
+    TILE_INCLUDE_FULL,
+    TILE_MERGE_THRESHOLD,
+    TILE_JPEG_QUALITY,
+    WARMUP_ENABLED,
+    WORKER_PROCESSES,
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_RATE,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_DAILY,
+    RATE_LIMIT_TENANTS,
+    RATE_LIMIT_KEY_HEADER,
+    RATE_LIMIT_EXEMPT_CACHE_HITS,
+    RATE_LIMIT_DB_PATH,
+    RATE_LIMIT_FLUSH_INTERVAL,
+    RATE_LIMIT_PROXY_HOPS,
+    NEAR_DUP_ENABLED,
+    NEAR_DUP_THRESHOLD,
+    NEAR_DUP_TTL,
+    NEAR_DUP_MAX_ENTRIES,
+    NEAR_DUP_MAX_SCOPES,
+)
+from utils import ImageData, normalize_roboflow_response, rescale_detections, attach_raw
+from descriptions import add_descriptions
+from upstream import UpstreamError
+from backends import create_backend, read_image_bytes
+from cache import DetectionCache, cache_key
+from preprocess import prepare_image, settings_signature, shutdown_executor
+from postprocess import DetectionFilters
+from static_assets import StaticAssets, etag_matches
+from middleware import BodySizeLimitMiddleware
+from metrics import REGISTRY, TILES, VIDEO_FRAMES, WS_CONNECTIONS, WS_FRAMES, Counter, Gauge, MetricsMiddleware, stage, time_upload
+from batch import BatchItem, is_archive, aiter_archive, as_completed_bounded, ordered_bounded, unique_name
+from video import DuplicateFilter, FrameSampler, IoUTracker, aiter_video_frames, image_frame, is_video
+from live import LatestSlot
+from tiling import merge_detections, offset_detections, slice_image
+from jobs import JobRunner, JobStore, new_job_id, resolve_source_path, save_upload
+from warmup import warm_up
+from ratelimit import Policy, RateLimited, RateLimiter, load_tenants
+from neardup import NearDuplicateIndex, image_hash
+from packing import MSGPACK_MEDIA_TYPE, PACKED_MEDIA_TYPE, ClassTable, encode_msgpack, encode_packed, negotiate
+
+logger = logging.getLogger(__name__)
+
+detection_cache: Optional[DetectionCache] = None
+job_store: Optional[JobStore] = None
+job_runner: Optional[JobRunner] = None
+rate_limiter: Optional[RateLimiter] = None
+class_table: Optional[ClassTable] = None
+near_index: Optional[NearDuplicateIndex] = None
+static_assets = StaticAssets()
+# Roboflow HTTP client or local ONNX model, per DETECTION_BACKEND
+backend = create_backend()
+
+RawMode = Literal["none", "top", "full"]
+INCLUDE_RAW_QUERY = Query(
+    None,
+    description="none: detections only; top: plus the Roboflow response; full: plus each prediction's raw dict. "
+    "Defaults to RESPONSE_INCLUDE_RAW.",
+)
+CAMERA_QUERY = Query(
+    None,
+    max_length=128,
+    description="Id of the fixed camera the image comes from. With NEAR_DUP_ENABLED, a near-identical image "
+    "from the same camera of the same client in the last NEAR_DUP_TTL seconds is answered with its result, "
+    "without a model call.",
+)
+TILED_QUERY = Query(
+    TILING_ENABLED,
+    description="Slice images larger than TILE_SIZE into overlapping tiles to find small, distant signs "
+    "(more upstream calls per image). Defaults to TILING_ENABLED.",
+)
+
+
+def detection_filters(
+    min_confidence: Optional[float] = Query(None, ge=0, le=1, description="Drop detections below this confidence."),
+    classes: Optional[List[str]] = Query(
+        None, description="Only keep these labels (case-insensitive). Repeat the parameter or pass a comma-separated list."
+    ),
+    max_detections: Optional[int] = Query(None, ge=0, description="Keep at most this many detections, most confident first."),
+    nms: bool = Query(NMS_ENABLED, description="Apply class-aware non-maximum suppression."),
+    iou_threshold: float = Query(NMS_IOU_THRESHOLD, gt=0, le=1, description="IoU above which NMS suppresses a box."),
+) -> DetectionFilters:
+    if classes:
+        classes = [c for value in classes for c in value.split(",") if c.strip()]
+    return DetectionFilters(min_confidence, classes or None, max_detections, nms, iou_threshold)
+
+
+def client_address(conn: HTTPConnection) -> Optional[str]:
+    """
+    Client IP for rate limiting. Behind RATE_LIMIT_PROXY_HOPS proxies it is the
+    X-Forwarded-For entry the outermost proxy appended; a client can prepend anything
+    to the header, so only entries added by trusted proxies count.
+    """
+    if RATE_LIMIT_PROXY_HOPS:
+        hops = [hop.strip() for value in conn.headers.getlist("x-forwarded-for") for hop in value.split(",")]
+        hops = [hop for hop in hops if hop]
+        if len(hops) >= RATE_LIMIT_PROXY_HOPS:
+            return hops[-RATE_LIMIT_PROXY_HOPS]
+    return conn.client.host if conn.client else None
+
+
+def client_tenant(conn: HTTPConnection) -> Optional[str]:
+    """
+    Rate-limit tenant of the request (API key or client IP); None when rate limiting is off.
+    The key can also be passed as ?api_key=, for WebSocket clients that cannot set headers.
+    """
+    if rate_limiter is None:
+        return None
+    api_key = conn.headers.get(RATE_LIMIT_KEY_HEADER) or conn.query_params.get("api_key")
+    return rate_limiter.tenant(api_key, client_address(conn))
+
+
+def camera_scope(conn: HTTPConnection, tenant: Optional[str], camera: Optional[str]) -> Optional[str]:
+    """
+    Near-duplicate scope of a camera id. Camera ids are chosen by clients, so the scope
+    belongs to the client too (its tenant, or its address when rate limiting is off):
+    two clients that both call their camera "cam1" never get each other's results.
+    """
+    if not camera:
+        return None
+    return f"{tenant or client_address(conn) or 'unknown'}|camera:{camera}"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global detection_cache, job_store, job_runner, rate_limiter, class_table, near_index
+    # pooled keep-alive client (roboflow) or loaded model workers (onnx), shared by all requests
+    await backend.start()
+    # label ids of binary responses: the model's classes
+    class_table = ClassTable(backend.labels())
+    if not len(class_table):
+        logger.warning(
+            "The model's class names are unknown (set ROBOFLOW_CLASS_NAMES): binary /detect "
+            "responses will carry every label inline instead of class ids from GET /classes"
+        )
+    if WARMUP_ENABLED:
+        # uvicorn only starts accepting once startup is done, so the first requests
+        # find open upstream connections and loaded codecs
+        await warm_up(backend)
+    # hash, template and precompress the UI once per process
+    static_assets.build()
+    if CACHE_ENABLED:
+        detection_cache = DetectionCache(CACHE_MAX_ENTRIES, CACHE_TTL, CACHE_DB_PATH)
+    if NEAR_DUP_ENABLED:
+        near_index = NearDuplicateIndex(NEAR_DUP_THRESHOLD, NEAR_DUP_TTL, NEAR_DUP_MAX_ENTRIES, NEAR_DUP_MAX_SCOPES)
+    if RATE_LIMIT_ENABLED:
+        default = Policy(RATE_LIMIT_RATE, RATE_LIMIT_BURST, RATE_LIMIT_DAILY or None)
+        rate_limiter = RateLimiter(
+            default, load_tenants(RATE_LIMIT_TENANTS, default), RATE_LIMIT_DB_PATH,
+            RATE_LIMIT_FLUSH_INTERVAL, WORKER_PROCESSES,
+        )
+        # loads today's usage, then flushes it periodically
+        await rate_limiter.start()
+    if JOBS_ENABLED:
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        job_store = JobStore(os.path.join(JOBS_DIR, "jobs.db"))
+        job_runner = JobRunner(
+            job_store, JOBS_DIR, detect_job_item, JOBS_CONCURRENCY, JOBS_CHECKPOINT_EVERY,
+            JOBS_LEASE_SECONDS, JOBS_POLL_INTERVAL, JOBS_MAX_ITEMS, MAX_UPLOAD_BYTES,
+            JOBS_MAX_ATTEMPTS, JOBS_RETRY_BACKOFF, JOBS_RETRY_BACKOFF_MAX,
+        )
+        # picks up jobs left unfinished by the previous run
+        job_runner.start()
+    try:
+        yield
+    finally:
+        if job_runner is not None:
+            await job_runner.close()
+            job_runner = None
+        if job_store is not None:
+            job_store.close()
+            job_store = None
+        if rate_limiter is not None:
+            await rate_limiter.close()
+            rate_limiter = None
+        await backend.close()
+        shutdown_executor()
+        if detection_cache is not None:
+            detection_cache.close()
+            detection_cache = None
+        near_index = None
+
 
 app = FastAPI(
     title="Road Sign Detection (Roboflow)",
     description="FastAPI wrapper that sends images to a Roboflow traffic sign model and returns cleaned JSON detections.",
-    version="1.0"
+    version="1.0",
+    lifespan=lifespan,
 )
+app.mount("/static", static_assets, name="static")
+# 413 before oversized bodies are buffered; the per-file limit is checked again in the handlers.
+# Multipart framing adds a little on top of the image itself.
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits=[
+        ("/detect/video", MAX_VIDEO_UPLOAD_BYTES),
+        ("/detect/batch", MAX_BATCH_UPLOAD_BYTES),
+        ("/jobs", MAX_JOB_UPLOAD_BYTES),
+        ("/detect", MAX_UPLOAD_BYTES + 64 * 1024),
+    ],
+)
+# outermost, so rejected requests are counted too
+app.add_middleware(MetricsMiddleware)
+
+
+def _cache_stat(*names: str):
+    def collect():
+        if detection_cache is None:
+            return {}
+        stats = detection_cache.stats()
+        return {(name,): stats[name] for name in names}
+    return collect
+
+
+REGISTRY.register(Counter(
+    "roadsign_cache_events_total", "Detection cache lookups and evictions by outcome.", ("event",),
+    callback=_cache_stat("hits", "disk_hits", "misses", "coalesced", "evictions", "expirations"),
+))
+REGISTRY.register(Gauge(
+    "roadsign_cache_entries", "Entries held in the in-memory detection cache.",
+    callback=lambda: {(): detection_cache.stats()["entries"]} if detection_cache is not None else {},
+))
+REGISTRY.register(Counter(
+    "roadsign_near_duplicate_lookups_total", "Near-duplicate index lookups by outcome.", ("outcome",),
+    callback=lambda: {("hit",): near_index.hits, ("miss",): near_index.misses} if near_index is not None else {},
+))
+# lookup cost of the index: per lookup, divide by roadsign_near_duplicate_lookups_total
+REGISTRY.register(Counter(
+    "roadsign_near_duplicate_nodes_visited_total", "Hashes compared while searching the near-duplicate index.",
+    callback=lambda: {(): near_index.nodes_visited} if near_index is not None else {},
+))
+REGISTRY.register(Counter(
+    "roadsign_near_duplicate_lookup_seconds_total", "Time spent searching the near-duplicate index (hashing excluded).",
+    callback=lambda: {(): near_index.lookup_seconds} if near_index is not None else {},
+))
 
 @app.get("/", response_class=HTMLResponse)
-async def home():
-    """
-    Serve the main UI page.
-    """
-    return """
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Road Sign Detection</title>
-        <style>
-            * {
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }
-            
-            body {
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                background: linear-gradient(135deg, #1e3c72 0%, #2a5298 50%, #7e8ba3 100%);
-                min-height: 100vh;
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                padding: 20px;
-            }
-            
-            .container {
-                background: white;
-                border-radius: 20px;
-                box-shadow: 0 20px 60px rgba(0,0,0,0.3);
-                padding: 40px;
-                max-width: 800px;
-                width: 100%;
-            }
-            
-            h1 {
-                color: #333;
-                text-align: center;
-                margin-bottom: 10px;
-                font-size: 2.5em;
-            }
-            
-            .subtitle {
-                text-align: center;
-                color: #666;
-                margin-bottom: 30px;
-                font-size: 1.1em;
-            }
-            
-            .upload-area {
-                border: 3px dashed #2a5298;
-                border-radius: 15px;
-                padding: 40px;
-                text-align: center;
-                transition: all 0.3s ease;
-                cursor: pointer;
-                background: #f0f7ff;
-            }
-            
-            .upload-area:hover {
-                border-color: #1e3c72;
-                background: #e6f2ff;
-            }
-            
-            .upload-area.dragover {
-                border-color: #1e3c72;
-                background: #d9edff;
-                transform: scale(1.02);
-            }
-            
-            #fileInput {
-                display: none;
-            }
-            
-            .upload-icon {
-                font-size: 4em;
-                margin-bottom: 20px;
-            }
-            
-            .upload-text {
-                color: #2a5298;
-                font-size: 1.2em;
-                font-weight: 600;
-                margin-bottom: 10px;
-            }
-            
-            .upload-hint {
-                color: #999;
-                font-size: 0.9em;
-            }
-            
-            .btn {
-                background: linear-gradient(135deg, #1e3c72 0%, #2a5298 100%);
-                color: white;
-                border: none;
-                padding: 15px 40px;
-                border-radius: 30px;
-                font-size: 1.1em;
-                font-weight: 600;
-                cursor: pointer;
-                margin-top: 20px;
-                transition: all 0.3s ease;
-                display: none;
-            }
-            
-            .btn:hover {
-                transform: translateY(-2px);
-                box-shadow: 0 10px 20px rgba(42, 82, 152, 0.4);
-            }
-            
-            .btn:disabled {
-                opacity: 0.5;
-                cursor: not-allowed;
-            }
-            
-            #preview {
-                margin-top: 30px;
-                display: none;
-            }
-            
-            #previewImage {
-                max-width: 100%;
-                border-radius: 10px;
-                box-shadow: 0 5px 15px rgba(0,0,0,0.2);
-            }
-            
-            #results {
-                margin-top: 30px;
-                display: none;
-            }
-            
-            .result-card {
-                background: #f0f7ff;
-                border-left: 4px solid #2a5298;
-                padding: 20px;
-                border-radius: 10px;
-                margin-bottom: 15px;
-            }
-            
-            .result-title {
-                color: #1e3c72;
-                font-weight: 600;
-                font-size: 1.2em;
-                margin-bottom: 10px;
-            }
-            
-            .detection-item {
-                background: white;
-                padding: 15px;
-                border-radius: 8px;
-                margin-bottom: 10px;
-                box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-            }
-            
-            .detection-class {
-                font-weight: 600;
-                color: #333;
-                font-size: 1.1em;
-            }
-            
-            .detection-confidence {
-                color: #2a5298;
-                font-weight: 600;
-                margin-left: 10px;
-            }
-            
-            .detection-description {
-                color: #666;
-                font-size: 0.9em;
-                margin-top: 8px;
-                line-height: 1.5;
-                font-style: italic;
-            }
-            
-            .loading {
-                text-align: center;
-                padding: 20px;
-                display: none;
-            }
-            
-            .spinner {
-                border: 4px solid #f3f3f3;
-                border-top: 4px solid #2a5298;
-                border-radius: 50%;
-                width: 50px;
-                height: 50px;
-                animation: spin 1s linear infinite;
-                margin: 0 auto;
-            }
-            
-            @keyframes spin {
-                0% { transform: rotate(0deg); }
-                100% { transform: rotate(360deg); }
-            }
-            
-            .error {
-                background: #ffe6e6;
-                border-left: 4px solid #ff4444;
-                color: #cc0000;
-                padding: 15px;
-                border-radius: 8px;
-                margin-top: 20px;
-                display: none;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>🚦 Road Sign Detection</h1>
-            <p class="subtitle">Upload an image to detect road signs using AI</p>
-            
-            <div class="upload-area" id="uploadArea">
-                <div class="upload-icon">📸</div>
-                <div class="upload-text">Click to upload or drag and drop</div>
-                <div class="upload-hint">Supports: JPG, PNG, JPEG</div>
-                <input type="file" id="fileInput" accept="image/*">
-            </div>
-            
-            <center>
-                <button class="btn" id="detectBtn">Detect Road Signs</button>
-            </center>
-            
-            <div id="preview">
-                <h3 style="margin-bottom: 15px; color: #333;">Preview:</h3>
-                <img id="previewImage" alt="Preview">
-            </div>
-            
-            <div class="loading" id="loading">
-                <div class="spinner"></div>
-                <p style="margin-top: 15px; color: #2a5298; font-weight: 600;">Analyzing image...</p>
-            </div>
-            
-            <div class="error" id="error"></div>
-            
-            <div id="results"></div>
-        </div>
-        
-        <script>
-            const uploadArea = document.getElementById('uploadArea');
-            const fileInput = document.getElementById('fileInput');
-            const detectBtn = document.getElementById('detectBtn');
-            const preview = document.getElementById('preview');
-            const previewImage = document.getElementById('previewImage');
-            const loading = document.getElementById('loading');
-            const results = document.getElementById('results');
-            const errorDiv = document.getElementById('error');
-            
-            let selectedFile = null;
-            
-            // Click to upload
-            uploadArea.addEventListener('click', () => fileInput.click());
-            
-            // File selection
-            fileInput.addEventListener('change', (e) => {
-                handleFile(e.target.files[0]);
-            });
-            
-            // Drag and drop
-            uploadArea.addEventListener('dragover', (e) => {
-                e.preventDefault();
-                uploadArea.classList.add('dragover');
-            });
-            
-            uploadArea.addEventListener('dragleave', () => {
-                uploadArea.classList.remove('dragover');
-            });
-            
-            uploadArea.addEventListener('drop', (e) => {
-                e.preventDefault();
-                uploadArea.classList.remove('dragover');
-                handleFile(e.dataTransfer.files[0]);
-            });
-            
-            function handleFile(file) {
-                if (!file || !file.type.startsWith('image/')) {
-                    showError('Please select a valid image file');
-                    return;
-                }
-                
-                selectedFile = file;
-                
-                // Show preview
-                const reader = new FileReader();
-                reader.onload = (e) => {
-                    previewImage.src = e.target.result;
-                    preview.style.display = 'block';
-                    detectBtn.style.display = 'inline-block';
-                    results.style.display = 'none';
-                    errorDiv.style.display = 'none';
-                };
-                reader.readAsDataURL(file);
-            }
-            
-            // Detect button
-            detectBtn.addEventListener('click', async () => {
-                if (!selectedFile) return;
-                
-                const formData = new FormData();
-                formData.append('file', selectedFile);
-                
-                loading.style.display = 'block';
-                results.style.display = 'none';
-                errorDiv.style.display = 'none';
-                detectBtn.disabled = true;
-                
-                try {
-                    const response = await fetch('/detect', {
-                        method: 'POST',
-                        body: formData
-                    });
-                    
-                    const data = await response.json();
-                    
-                    if (response.ok) {
-                        displayResults(data.raw);
-                    } else {
-                        showError(data.detail || 'Detection failed');
-                    }
-                } catch (error) {
-                    showError('Network error: ' + error.message);
-                } finally {
-                    loading.style.display = 'none';
-                    detectBtn.disabled = false;
-                }
-            });
-            
-            function getSignDescription(signClass) {
-                const descriptions = {
-                    // Stop signs
-                    'stop': 'Come to a full stop and check for traffic.',
-                    'stop sign': 'Come to a full stop and check for traffic.',
-                    'stop_sign': 'Come to a full stop and proceed only when safe.',
-                    
-                    // Parking
-                    'no parking': 'Parking is not allowed in this area.',
-                    
-                    // Turns
-                    'no u-turn': 'U-turns are prohibited here.',
-                    'no left turn': 'Left turns are not permitted at this point.',
-                    'no right turn': 'Right turns are not permitted at this point.',
-                    'turn left': 'You are required to turn left.',
-                    'turn right': 'You are required to turn right.',
-                    'turn left ahead': 'Left turn ahead — slow down and prepare to turn.',
-                    'turn right ahead': 'Right turn ahead — slow down and prepare to turn.',
-                    
-                    // Directional
-                    'one way street': 'Traffic flows only in one direction.',
-                    'one way': 'Traffic flows only in one direction.',
-                    'straight ahead only': 'You may only go straight — no turns allowed.',
-                    'go straight or turn right': 'You may proceed straight or turn right — no left turn allowed.',
-                    'go straight or turn left': 'You may proceed straight or turn left — no right turn allowed.',
-                    
-                    // Yield/Give Way
-                    'yield': 'Slow down and let other vehicles go first.',
-                    'give way': 'Slow down and give priority to other vehicles before proceeding.',
-                    'give way to oncoming': 'Yield to oncoming traffic.',
-                    
-                    // Pedestrian
-                    'pedestrian crossing': 'Slow down and watch for people crossing.',
-                    'children crossing': 'Slow down; children may cross the road here.',
-                    'beware of children': 'Children may be crossing — slow down and stay alert.',
-                    'bicycle crossing': 'Bicycles crossing ahead — slow down and watch.',
-                    
-                    // Speed limits
-                    'speed limit 20 kmph': 'Maximum speed allowed is 20 km/h — drive slowly.',
-                    'speed limit 30 kmph': 'Maximum speed allowed is 30 km/h.',
-                    'speed limit 30 km/h': 'Maximum speed is 30 km/h in this area.',
-                    'speed limit 40 km/h': 'Maximum speed is 40 km/h in this area.',
-                    'speed limit 50 kmph': 'Maximum speed allowed is 50 km/h.',
-                    'speed limit 50 km/h': 'Maximum speed is 50 km/h in this area.',
-                    'speed limit 60 km/h': 'Maximum speed is 60 km/h in this area.',
-                    'speed limit 70 km/h': 'Maximum speed is 70 km/h in this area.',
-                    'speed limit 80 km/h': 'Maximum speed is 80 km/h in this area.',
-                    '50 mph speed limit': 'Maximum speed allowed is 50 mph — do not exceed.',
-                    'end of all speed and passing limits': 'Previous speed and passing limits are lifted — drive responsibly.',
-                    'end of speed limit': 'Previous speed limit ends — adjust accordingly.',
-                    
-                    // Road conditions
-                    'roadworks ahead': 'Construction work ahead — slow down.',
-                    'slippery road': 'Road may be slippery when wet — proceed carefully.',
-                    'slippery road ahead': 'Road may be slippery — reduce speed and avoid sudden turns or brakes.',
-                    'bumpy road': 'Uneven surface ahead — reduce your speed.',
-                    'uneven road': 'Road surface ahead is uneven — reduce speed to avoid bumps.',
-                    
-                    // Entry restrictions
-                    'no entry': 'Do not enter — road is closed or one-way against you.',
-                    'no_over_taking': 'Overtaking other vehicles is prohibited in this area.',
-                    'no overtaking': 'Overtaking is prohibited in this area.',
-                    'overtaking by trucks is prohibited': 'Trucks are not allowed to overtake here.',
-                    
-                    // Traffic control
-                    'roundabout': 'Approaching roundabout — yield and follow flow.',
-                    'round-about': 'Roundabout ahead — yield and follow circular flow of traffic.',
-                    'traffic light ahead': 'Traffic signal ahead — be ready to stop.',
-                    'traffic_signal': 'Traffic lights ahead — be prepared to stop or slow down.',
-                    
-                    // Keep direction
-                    'keep left': 'Stay on the left side of the road.',
-                    'keep-left': 'Stay on the left side of the road or obstacle.',
-                    'keep right': 'Stay on the right side of the road.',
-                    'keep-right': 'Stay on the right side of the road or obstacle.',
-                    
-                    // Road features
-                    'road narrows': 'Road ahead becomes narrower — drive cautiously.',
-                    'road narrows on right': 'Right side of the road becomes narrower — slow down and keep left.',
-                    'two-way traffic ahead': 'Be aware that traffic moves in both directions.',
-                    'bridge ahead': 'Bridge ahead — check speed and load restrictions.',
-                    'tunnel ahead': 'Tunnel coming up — turn on lights if needed.',
-                    
-                    // Warnings
-                    'stop sign ahead': 'Prepare to stop ahead.',
-                    'attention please-': 'Pay attention — potential danger or special instructions ahead.',
-                    'dangerous left curve ahead': 'Sharp left curve ahead — reduce speed and navigate carefully.',
-                    'dangerous rright curve ahead': 'Sharp right curve ahead — reduce speed and navigate carefully.',
-                    'left zig zag traffic': 'Road curves left and right ahead — reduce speed and stay alert.',
-                    
-                    // Restrictions
-                    'no trucks': 'Trucks are prohibited beyond this point.',
-                    'truck traffic is prohibited': 'Trucks are not allowed beyond this point.',
-                    
-                    // Crossings
-                    'animal crossing': 'Animals may cross the road — stay alert.',
-                    'railway crossing': 'Railroad tracks ahead — proceed with caution.',
-                    'falling rocks': 'Possible falling rocks — drive carefully.',
-                    
-                    // Zones
-                    'school zone': 'Slow down — children may be nearby.',
-                    'no horns': 'No use of horns in this area.',
-                    'pedestrian zone': 'Pedestrians only — vehicles must stop or park.',
-                    'bus stop': 'Bus stop ahead — watch for buses pulling out.',
-                    'speed camera ahead': 'Speed check zone ahead — keep within limits.',
-                    
-                    // Cycle routes
-                    'cycle route ahead warning': 'Cyclists may be on the road — share the road and slow down.',
-                };
-                
-                // Try exact match first (case-insensitive)
-                const lowerClass = signClass.toLowerCase().trim();
-                if (descriptions[lowerClass]) {
-                    return descriptions[lowerClass];
-                }
-                
-                // Try partial match
-                for (const [key, desc] of Object.entries(descriptions)) {
-                    if (lowerClass.includes(key) || key.includes(lowerClass)) {
-                        return desc;
-                    }
-                }
-                
-                // Default description with the sign name
-                return `Pay attention to this "${signClass}" sign for important traffic information.`;
-            }
-            
-            function displayResults(data) {
-                results.innerHTML = '';
-                
-                if (data.predictions && data.predictions.length > 0) {
-                    let html = '<div class="result-card">';
-                    html += '<div class="result-title">🎯 Detected ' + data.predictions.length + ' road sign(s)</div>';
-                    
-                    data.predictions.forEach((pred, index) => {
-                        const confidence = (pred.confidence * 100).toFixed(1);
-                        const description = getSignDescription(pred.class);
-                        html += `
-                            <div class="detection-item">
-                                <div>
-                                    <span class="detection-class">${pred.class}</span>
-                                    <span class="detection-confidence">${confidence}% confidence</span>
-                                </div>
-                                <div class="detection-description">${description}</div>
-                            </div>
-                        `;
-                    });
-                    
-                    html += '</div>';
-                    results.innerHTML = html;
-                } else {
-                    results.innerHTML = '<div class="result-card"><div class="result-title">No road signs detected in this image</div></div>';
-                }
-                
-                results.style.display = 'block';
-            }
-            
-            function showError(message) {
-                errorDiv.textContent = '❌ Error: ' + message;
-                errorDiv.style.display = 'block';
-            }
-        </script>
-    </body>
-    </html>
+async def home(request: Request):
     """
+    Serve the main UI page (prebuilt, precompressed, ETag-validated).
+    """
+    return static_assets.response("index.html", request.headers)
+
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus metrics: request counts, in-flight gauges, upstream status codes,
+    per-stage latency histograms and cache counters.
+    """
+    return PlainTextResponse(REGISTRY.expose(), media_type="text/plain; version=0.0.4")
+
+@app.get("/classes")
+def classes(request: Request):
+    """
+    Class table of the model: the label and description behind each class id of binary
+    /detect responses. Fetch once, keep it while responses carry the same X-Class-Table
+    id; revalidation with If-None-Match answers 304.
+    """
+    etag = f'"{class_table.id:08x}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(class_table.to_dict(), headers=headers)
+
+@app.get("/cache/stats")
+def cache_stats():
+    """
+    Hit / miss / eviction counters of the detection result cache, and of the
+    near-duplicate index when it is enabled.
+    """
+    stats = {"enabled": False} if detection_cache is None else {"enabled": True, **detection_cache.stats()}
+    if near_index is not None:
+        stats["near_duplicates"] = near_index.stats()
+    return stats
+
+
+async def detect_whole(image: ImageData, filename: str, content_type: str) -> Dict[str, Any]:
+    """
+    One backend call for the whole image: {"rf_json", "detections"} in original-image coordinates.
+    """
+    # optional downscale / re-encode in the worker pool
+    with stage("preprocess"):
+        prepared = await prepare_image(image, filename, content_type)
+    rf_json = await backend.detect(prepared.data, prepared.filename, prepared.content_type)
+    # Normalize into clean detections, in original-image coordinates
+    with stage("normalize"):
+        detections = normalize_roboflow_response(rf_json, include_raw=False)
+        rescale_detections(detections, prepared.scale_x, prepared.scale_y)
+        add_descriptions(detections)
+    return {"rf_json": rf_json, "detections": detections}
+
+
+async def detect_tiled(
+    image: ImageData,
+    filename: str,
+    content_type: str,
+    charge: Optional[Callable[[int], Awaitable[None]]] = None,
+) -> Dict[str, Any]:
+    """
+    Sliced inference for high-resolution images: overlapping full-resolution tiles go to
+    the backend concurrently (plus the whole image with TILE_INCLUDE_FULL), tile boxes are
+    moved to image coordinates and duplicates across seams merged. Images that fit in one
+    tile take the normal single-call path. `charge` is awaited with the number of backend
+    calls about to be made, once the tiles are known.
+    The response's `predictions` are the raw predictions of the kept detections (in tile
+    or sent-image coordinates), `tiles` summarizes the slicing.
+    """
+    data = await read_image_bytes(image)
+    with stage("tile"):
+        try:
+            sliced = await asyncio.to_thread(slice_image, data, TILE_SIZE, TILE_OVERLAP, TILE_MIN_EDGE, TILE_JPEG_QUALITY)
+        except ValueError:
+            sliced = None
+    if sliced is None or not (sliced.tiles or sliced.skipped):
+        # undecodable (the backend reports it) or small enough for one call
+        if charge is not None:
+            await charge(1)
+        return await detect_whole(data, filename, content_type)
+    if charge is not None:
+        await charge(len(sliced.tiles) + int(TILE_INCLUDE_FULL))
+    TILES.inc("sent", amount=len(sliced.tiles))
+    TILES.inc("skipped", amount=sliced.skipped)
+
+    semaphore = asyncio.Semaphore(TILE_CONCURRENCY)
+    stem = filename.rsplit(".", 1)[0] if "." in filename else filename
+
+    async def detect_tile(tile) -> List[Dict[str, Any]]:
+        async with semaphore:
+            rf_json = await backend.detect(tile.data, f"{stem}_{tile.x}_{tile.y}.jpg", "image/jpeg")
+        return offset_detections(normalize_roboflow_response(rf_json, include_raw=True), tile.x, tile.y)
+
+    async def detect_full() -> List[Dict[str, Any]]:
+        result = await detect_whole(data, filename, content_type)
+        return attach_raw(result["detections"], result["rf_json"])
+
+    tasks = [asyncio.ensure_future(detect_tile(tile)) for tile in sliced.tiles]
+    if TILE_INCLUDE_FULL:
+        tasks.append(asyncio.ensure_future(detect_full()))
+    try:
+        parts = await asyncio.gather(*tasks)
+    except BaseException:
+        # one failed tile fails the image; do not leave the other calls running
+        for task in tasks:
+            task.cancel()
+        raise
+
+    with stage("merge"):
+        detections = merge_detections([d for part in parts for d in part], TILE_MERGE_THRESHOLD)
+        predictions = [d.pop("raw") for d in detections]
+        add_descriptions(detections)
+    rf_json = {
+        "image": {"width": sliced.width, "height": sliced.height},
+        "predictions": predictions,
+        "tiles": {
+            "size": TILE_SIZE,
+            "overlap": TILE_OVERLAP,
+            "sent": len(sliced.tiles),
+            "skipped": sliced.skipped,
+            "full_image": TILE_INCLUDE_FULL,
+        },
+    }
+    return {"rf_json": rf_json, "detections": detections}
+
+
+async def run_detection(
+    image: ImageData,
+    filename: str,
+    content_type: str,
+    tiled: bool = False,
+    tenant: Optional[str] = None,
+    scope: Optional[str] = None,
+) -> Tuple[Dict[str, Any], bool]:
+    """
+    Run one image through the detection backend (or the cache) and normalize the result.
+    `image` is bytes or a file object; file objects are hashed and uploaded in chunks.
+    With tiled=True large images go through detect_tiled(). With a `scope` (camera id)
+    and NEAR_DUP_ENABLED, a recent near-identical image of that camera answers first.
+    The image is charged to `tenant`'s rate limit first, or only when it reaches the
+    backend with RATE_LIMIT_EXEMPT_CACHE_HITS; a tiled image is charged one image per
+    backend call it makes. Only the caller that runs a shared computation is charged
+    for it; a caller that joined it and saw it refused runs it again under its own tenant.
+    Returns ({"rf_json", "detections"}, cached). Raises UpstreamError on failure
+    (RateLimited when the tenant is over its limit).
+    """
+    near = near_index is not None and scope is not None
+    charge_on_miss = tenant is not None and RATE_LIMIT_EXEMPT_CACHE_HITS and (detection_cache is not None or near)
+    prepaid = 0
+    if tenant is not None and not charge_on_miss:
+        await rate_limiter.charge(tenant)
+        prepaid = 1
+
+    async def charge_calls(calls: int) -> None:
+        if tenant is not None:
+            await rate_limiter.charge(tenant, calls - prepaid)
+
+    charged = False
+
+    async def compute() -> Dict[str, Any]:
+        nonlocal charged
+        charged = True
+        if tiled:
+            return await detect_tiled(image, filename, content_type, charge_calls)
+        await charge_calls(1)
+        return await detect_whole(image, filename, content_type)
+
+    model = f"{backend.signature()}|{settings_signature()}"
+    if tiled:
+        model += f"|tiles:{TILE_SIZE}:{TILE_OVERLAP}:{TILE_MIN_EDGE}:{int(TILE_INCLUDE_FULL)}:{TILE_MERGE_THRESHOLD}"
+    image_phash = None
+    if near:
+        scope = f"{scope}|{model}"
+        with stage("phash"):
+            image_phash = await asyncio.to_thread(image_hash, image)
+            if image_phash is not None:
+                value, _, _ = near_index.lookup(scope, image_phash)
+                if value is not None:
+                    return value, True
+
+    if detection_cache is None:
+        result, cached = await compute(), False
+    else:
+        if isinstance(image, bytes):
+            key = cache_key(image, model)
+        else:
+            key = await asyncio.to_thread(cache_key, image, model)
+        while True:
+            try:
+                result, cached = await detection_cache.get_or_compute(key, compute)
+                break
+            except RateLimited:
+                if charged:
+                    raise
+                # another tenant's charge refused the computation this call joined;
+                # that is not our 429, so run it again under our own tenant
+    if image_phash is not None:
+        near_index.add(scope, image_phash, result)
+    return result, cached
+
+
+def shape_result(result: Dict[str, Any], include_raw: RawMode, filters: Optional[DetectionFilters] = None) -> Dict[str, Any]:
+    """
+    Response fields for one detection result: filtered compact detections, plus the
+    raw Roboflow payload only as far as include_raw asks for it.
+    """
+    detections = result["detections"]
+    if include_raw == "full":
+        # attach before filtering: detections and predictions match by position
+        detections = attach_raw(detections, result["rf_json"])
+    if filters is not None:
+        detections = filters.apply(detections)
+    shaped = {"detections": detections}
+    if include_raw != "none":
+        shaped["raw"] = result["rf_json"]
+    return shaped
+
+
+def upload_size(file: UploadFile) -> int:
+    """
+    Size of an uploaded file in bytes, without reading it.
+    """
+    if file.size is not None:
+        return file.size
+    file.file.seek(0, 2)
+    size = file.file.tell()
+    file.file.seek(0)
+    return size
+
+
 @app.post("/detect")
-async def detect(file: UploadFile = File(...)):
+async def detect(
+    request: Request,
+    file: UploadFile = File(...),
+    include_raw: Optional[RawMode] = INCLUDE_RAW_QUERY,
+    filters: DetectionFilters = Depends(detection_filters),
+    tiled: bool = TILED_QUERY,
+    camera: Optional[str] = CAMERA_QUERY,
+    tenant: Optional[str] = Depends(client_tenant),
+):
     """
     Upload an image file (multipart/form-data).
-    Returns JSON: { message, detections: [ {label, confidence, x, y, width, height, raw} ], raw: {...} }
+    Returns JSON: { message, detections: [ {label, confidence, x, y, width, height, description} ] }
+    plus `raw` (top-level and/or per detection) depending on include_raw.
+    Detections can be filtered with min_confidence, classes, max_detections and nms.
+    With Accept: application/vnd.roadsign.detections or application/msgpack the detections
+    come as packed records with class ids instead (see packing.py and GET /classes).
     """
+    time_upload(request.scope)
+    size = upload_size(file)
+    if not size:
+        raise HTTPException(status_code=400, detail="Empty file uploaded")
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds the {MAX_UPLOAD_BYTES} byte limit")
+
+    # call Roboflow detect endpoint over the shared async client (or serve from cache);
+    # the spooled upload is hashed and forwarded in chunks, never read into one bytes object
     try:
-        image_bytes = await file.read()
-        if not image_bytes:
-            raise HTTPException(status_code=400, detail="Empty file uploaded")
+        result, cached = await run_detection(
+            file.file, file.filename or "image.jpg", file.content_type or "image/jpeg", tiled, tenant,
+            camera_scope(request, tenant, camera),
+        )
+    except UpstreamError as ue:
+        raise HTTPException(status_code=ue.status_code, detail=ue.detail, headers=ue.headers)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # call Roboflow detect endpoint
-        # Use files parameter: file name, bytes, mime
-        files = {"file": (file.filename or "image.jpg", io.BytesIO(image_bytes), file.content_type or "image/jpeg")}
-        url = f"{ROBOFLOW_API_URL}?api_key={ROBOFLOW_API_KEY}"
+    raw_mode = include_raw or RESPONSE_INCLUDE_RAW
+    fmt = negotiate(request.headers.get("accept"))
+    headers = {"X-Cache": "HIT" if cached else "MISS", "Vary": "Accept"}
+    if tenant is not None:
+        headers.update(rate_limiter.headers(tenant))
+    with stage("encode"):
+        if fmt == "json":
+            return JSONResponse({
+                "message": "Detection successful",
+                **shape_result(result, raw_mode, filters),
+            }, headers=headers)
+        detections = shape_result(result, "none", filters)["detections"]
+        headers["X-Class-Table"] = str(class_table.id)
+        if fmt == "packed":
+            return Response(encode_packed(detections, class_table, cached), media_type=PACKED_MEDIA_TYPE, headers=headers)
+        raw = result["rf_json"] if raw_mode != "none" else None
+        return Response(encode_msgpack(detections, class_table, cached, raw), media_type=MSGPACK_MEDIA_TYPE, headers=headers)
 
-        resp = requests.post(url, files=files, timeout=REQUEST_TIMEOUT)
-    except requests.exceptions.RequestException as re:
-        raise HTTPException(status_code=503, detail=f"Roboflow request failed: {str(re)}")
+
+async def iter_batch_items(files: List[UploadFile]) -> AsyncIterator[BatchItem]:
+    """
+    Lazily yield the images of a batch request, expanding zip/tar archives member by
+    member. An archive that cannot be read becomes a single item carrying an error.
+    Plain images and archive members share one BATCH_MAX_ITEMS budget; images past it
+    are yielded with an error instead of their data.
+    """
+    seen: set = set()
+    count = 0
+    for f in files:
+        filename = f.filename or f"image{count}.jpg"
+        if is_archive(filename):
+            await f.seek(0)
+            try:
+                async for m in aiter_archive(filename, f.file, BATCH_MAX_ITEMS - count, MAX_UPLOAD_BYTES):
+                    count += 1
+                    yield m._replace(name=unique_name(m.name, seen))
+            except ValueError as e:
+                yield BatchItem(unique_name(filename, seen), b"", "application/octet-stream", error=str(e))
+            continue
+        count += 1
+        name, content_type = unique_name(filename, seen), f.content_type or "image/jpeg"
+        if count > BATCH_MAX_ITEMS:
+            yield BatchItem(name, b"", content_type, error=f"Batch contains more than {BATCH_MAX_ITEMS} images")
+        elif upload_size(f) > MAX_UPLOAD_BYTES:
+            detail = f"File exceeds the {MAX_UPLOAD_BYTES} byte limit"
+            yield BatchItem(name, b"", content_type, error=detail, error_status=413)
+        else:
+            yield BatchItem(name, await f.read(), content_type)
+
+
+async def detect_item(
+    item: BatchItem,
+    include_raw: RawMode,
+    filters: Optional[DetectionFilters] = None,
+    tiled: bool = False,
+    tenant: Optional[str] = None,
+    scope: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Detection result for one batch item; failures are reported per item instead of raised.
+    """
+    if item.error is not None:
+        return {"error": {"status_code": item.error_status, "detail": item.error}}
+    if not item.data:
+        return {"error": {"status_code": 400, "detail": "Empty file uploaded"}}
+    try:
+        result, cached = await run_detection(item.data, item.name, item.content_type, tiled, tenant, scope)
+    except UpstreamError as ue:
+        error = {"status_code": ue.status_code, "detail": ue.detail}
+        if ue.headers and "Retry-After" in ue.headers:
+            error["retry_after"] = int(ue.headers["Retry-After"])
+        elif ue.retry_after is not None:
+            error["retry_after"] = math.ceil(ue.retry_after)
+        return {"error": error}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        return {"error": {"status_code": 500, "detail": str(e)}}
+    return {**shape_result(result, include_raw, filters), "cached": cached}
+
+
+def check_batch_size(files: List[UploadFile]) -> None:
+    if not files:
+        raise HTTPException(status_code=400, detail="No images found in batch")
+    if len(files) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch contains more than {BATCH_MAX_ITEMS} images")
+
+
+@app.post("/detect/batch")
+async def detect_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    include_raw: Optional[RawMode] = INCLUDE_RAW_QUERY,
+    filters: DetectionFilters = Depends(detection_filters),
+    tiled: bool = TILED_QUERY,
+    tenant: Optional[str] = Depends(client_tenant),
+):
+    """
+    Upload many image files and/or zip/tar archives of images (multipart/form-data).
+    Images are sent to Roboflow with at most BATCH_CONCURRENCY calls in flight.
+    Returns JSON: { message, count, failed, results: { filename: {detections, raw?, cached} | {error} } }
+    """
+    time_upload(request.scope)
+    check_batch_size(files)
+    worker = partial(
+        detect_item, include_raw=include_raw or RESPONSE_INCLUDE_RAW, filters=filters, tiled=tiled, tenant=tenant
+    )
+
+    results: Dict[str, Dict[str, Any]] = {}
+    async for item, outcome in as_completed_bounded(iter_batch_items(files), worker, BATCH_CONCURRENCY):
+        results[item.name] = outcome
+    if not results:
+        raise HTTPException(status_code=400, detail="No images found in batch")
+    failed = sum(1 for outcome in results.values() if "error" in outcome)
+
+    with stage("encode"):
+        return JSONResponse({
+            "message": "Batch detection finished",
+            "count": len(results),
+            "failed": failed,
+            "results": results,
+        })
+
+
+@app.post("/detect/batch/stream")
+async def detect_batch_stream(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    include_raw: Optional[RawMode] = INCLUDE_RAW_QUERY,
+    filters: DetectionFilters = Depends(detection_filters),
+    tiled: bool = TILED_QUERY,
+    tenant: Optional[str] = Depends(client_tenant),
+):
+    """
+    Same input as /detect/batch, but results are streamed one record per image as soon
+    as its upstream call finishes (completion order), followed by a summary record.
+    NDJSON by default; Server-Sent Events when the client sends Accept: text/event-stream.
+    Record: { filename, detections, raw?, cached } | { filename, error }
+    Summary: { done: true, count, failed }
+    """
+    time_upload(request.scope)
+    check_batch_size(files)
+    worker = partial(
+        detect_item, include_raw=include_raw or RESPONSE_INCLUDE_RAW, filters=filters, tiled=tiled, tenant=tenant
+    )
+
+    async def records() -> AsyncIterator[Dict[str, Any]]:
+        count = failed = 0
+        async for item, outcome in as_completed_bounded(iter_batch_items(files), worker, BATCH_CONCURRENCY):
+            count += 1
+            failed += "error" in outcome
+            yield {"filename": item.name, **outcome}
+        yield {"done": True, "count": count, "failed": failed}
+
+    return stream_records(request, records())
+
+
+def stream_records(request: Request, records: AsyncIterator[Dict[str, Any]]) -> StreamingResponse:
+    """
+    Stream records as NDJSON, or as Server-Sent Events when the client sends
+    Accept: text/event-stream.
+    """
+    sse = "text/event-stream" in request.headers.get("accept", "")
+
+    async def encoded() -> AsyncIterator[str]:
+        async for record in records:
+            line = json.dumps(record)
+            yield f"data: {line}\n\n" if sse else line + "\n"
+
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    # X-Accel-Buffering: keep reverse proxies from holding back the stream
+    return StreamingResponse(encoded(), media_type=media_type, headers={"X-Accel-Buffering": "no"})
+
+
+# (frame index, time in seconds, image to detect on, index of the analyzed frame it duplicates)
+VideoEntry = Tuple[int, float, BatchItem, Optional[int]]
+
+
+async def iter_video_entries(
+    file: UploadFile, sample_fps: float, dedup: DuplicateFilter, errors: List[str]
+) -> AsyncIterator[VideoEntry]:
+    """
+    Sampled frames of an uploaded video, decoded in a worker thread. The first frame
+    is decoded before the response starts, so undecodable uploads get a plain 400;
+    a decode error later on ends the stream and is reported through `errors`.
+    """
+    await file.seek(0)
+    frames = aiter_video_frames(file.file, sample_fps, VIDEO_MAX_FRAMES, VIDEO_JPEG_QUALITY)
+    try:
+        first = await frames.__anext__()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except StopAsyncIteration:
+        raise HTTPException(status_code=400, detail="No frames found in video")
+
+    async def entries() -> AsyncIterator[VideoEntry]:
+        frame = first
+        while True:
+            item = BatchItem(f"frame{frame.index}.jpg", frame.data, frame.content_type)
+            yield frame.index, frame.time, item, dedup.duplicate_of(frame)
+            try:
+                frame = await frames.__anext__()
+            except StopAsyncIteration:
+                return
+            except ValueError as e:
+                errors.append(str(e))
+                return
+
+    return entries()
 
-    if resp.status_code != 200:
-        # forward Roboflow error for easier debugging
-        raise HTTPException(status_code=resp.status_code, detail=f"Roboflow returned {resp.status_code}: {resp.text}")
 
+async def iter_sequence_entries(
+    files: List[UploadFile], sample_fps: float, fps: float, dedup: DuplicateFilter
+) -> AsyncIterator[VideoEntry]:
+    """
+    Sampled frames of an image sequence (files and/or archives, in upload order),
+    frame i taken at i / fps seconds. Images are hashed in a worker thread.
+    """
+    sampler = FrameSampler(sample_fps)
+    index = -1
+    async for item in iter_batch_items(files):
+        index += 1
+        t = index / fps
+        if not sampler.take(t):
+            continue
+        if item.error is not None:
+            yield index, round(t, 3), item, None
+            continue
+        try:
+            frame = await asyncio.to_thread(image_frame, index, t, item.data, item.content_type)
+        except ValueError as e:
+            yield index, round(t, 3), item._replace(error=str(e)), None
+            continue
+        yield index, frame.time, item, dedup.duplicate_of(frame)
+
+
+@app.post("/detect/video")
+async def detect_video(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    sample_fps: float = Query(VIDEO_SAMPLE_FPS, ge=0, description="Frames per second to analyze; 0 analyzes every frame."),
+    fps: float = Query(VIDEO_SEQUENCE_FPS, gt=0, description="Frame rate of an uploaded image sequence (video files carry their own timestamps)."),
+    dedup_threshold: int = Query(
+        VIDEO_DEDUP_THRESHOLD, ge=-1, le=64,
+        description="Skip frames whose perceptual hash is within this many bits of the last analyzed frame; -1 disables.",
+    ),
+    track_iou: float = Query(VIDEO_TRACK_IOU, gt=0, le=1, description="IoU needed to continue a track in the next frame."),
+    track_max_gap: float = Query(VIDEO_TRACK_MAX_GAP, ge=0, description="Seconds a sign may go unseen before its track closes."),
+    include_raw: Optional[RawMode] = INCLUDE_RAW_QUERY,
+    filters: DetectionFilters = Depends(detection_filters),
+    tenant: Optional[str] = Depends(client_tenant),
+):
+    """
+    Upload one video file, or a sequence of frames as image files and/or zip/tar archives
+    (multipart/form-data). Frames are sampled at sample_fps, near-duplicates of the last
+    analyzed frame are skipped, and detections are linked across frames into tracks.
+    Records are streamed in frame order (NDJSON, or SSE with Accept: text/event-stream):
+    Frame: { type: "frame", frame, time, filename?, detections (with track_id), raw?, cached } | { ..., error }
+           | { type: "frame", frame, time, skipped: true, duplicate_of }
+    Track (once per sign, when it leaves the view): { type: "track", track_id, label, description,
+           first_seen, last_seen, first_frame, last_frame, frames, confidence, best }
+    Summary: { type: "summary", done: true, frames, analyzed, skipped, failed, tracks }
+    """
+    time_upload(request.scope)
+    check_batch_size(files)
+    dedup = DuplicateFilter(dedup_threshold)
+    errors: List[str] = []
+    sequence = not (len(files) == 1 and is_video(files[0].filename or "", files[0].content_type))
+    if sequence:
+        if any(is_video(f.filename or "", f.content_type) for f in files):
+            raise HTTPException(status_code=400, detail="Upload either one video file or a sequence of images")
+        entries = iter_sequence_entries(files, sample_fps, fps, dedup)
+    else:
+        size = upload_size(files[0])
+        if not size:
+            raise HTTPException(status_code=400, detail="Empty file uploaded")
+        if size > MAX_VIDEO_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"File exceeds the {MAX_VIDEO_UPLOAD_BYTES} byte limit")
+        entries = await iter_video_entries(files[0], sample_fps, dedup, errors)
+
+    raw_mode = include_raw or RESPONSE_INCLUDE_RAW
+
+    async def worker(entry: VideoEntry) -> Optional[Dict[str, Any]]:
+        _, _, item, duplicate_of = entry
+        if duplicate_of is not None:
+            return None
+        return await detect_item(item, raw_mode, filters, tenant=tenant)
+
+    async def records() -> AsyncIterator[Dict[str, Any]]:
+        tracker = IoUTracker(track_iou, track_max_gap)
+        counts = {"analyzed": 0, "skipped": 0, "failed": 0}
+        # frame order matters for tracking; up to VIDEO_CONCURRENCY frames are in flight
+        async for (index, t, item, duplicate_of), outcome in ordered_bounded(entries, worker, VIDEO_CONCURRENCY):
+            record: Dict[str, Any] = {"type": "frame", "frame": index, "time": t}
+            if sequence:
+                record["filename"] = item.name
+            closed: List[Dict[str, Any]] = []
+            if duplicate_of is not None:
+                # the signs of the analyzed frame are still in view
+                tracker.extend(index, t)
+                record.update(skipped=True, duplicate_of=duplicate_of)
+                result = "skipped"
+            elif "error" in outcome:
+                record.update(outcome)
+                result = "failed"
+            else:
+                detections, closed = tracker.update(index, t, outcome["detections"])
+                record.update(outcome, detections=detections)
+                result = "analyzed"
+            counts[result] += 1
+            VIDEO_FRAMES.inc(result)
+            yield record
+            for track in closed:
+                yield {"type": "track", **track}
+        for track in tracker.close_all():
+            yield {"type": "track", **track}
+        for detail in errors:
+            yield {"type": "error", "detail": detail}
+        yield {"type": "summary", "done": True, "frames": sum(counts.values()), **counts, "tracks": tracker.total}
+
+    return stream_records(request, records())
+
+
+@app.websocket("/ws/detect")
+async def detect_live(
+    websocket: WebSocket,
+    include_raw: Optional[RawMode] = INCLUDE_RAW_QUERY,
+    filters: DetectionFilters = Depends(detection_filters),
+    camera: Optional[str] = CAMERA_QUERY,
+    tenant: Optional[str] = Depends(client_tenant),
+):
+    """
+    Continuous detection over one connection: send each camera frame (JPEG/PNG) as a
+    binary message. Replies, one JSON text message per analyzed frame:
+    { frame, detections, raw?, cached, dropped } | { frame, error, dropped }
+    `frame` numbers the binary messages from 0; `dropped` counts the frames replaced by
+    a newer one since the previous reply. Only the newest frame received while a frame
+    is being analyzed is kept, so results never fall behind the camera.
+    A text message closes the connection with 1003, a frame over WS_MAX_FRAME_BYTES with 1009.
+    """
+    await websocket.accept()
+    raw_mode = include_raw or RESPONSE_INCLUDE_RAW
+    # the frames of one connection come from one camera
+    scope = camera_scope(websocket, tenant, camera) or f"ws:{uuid.uuid4().hex}"
+    slot: LatestSlot[Tuple[int, bytes]] = LatestSlot()
+
+    async def receive() -> None:
+        # keeps reading while a frame is analyzed, so the client is never blocked
+        received = 0
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                data = message.get("bytes")
+                if data is None:
+                    await websocket.close(code=1003, reason="Send frames as binary messages")
+                    return
+                if len(data) > WS_MAX_FRAME_BYTES:
+                    await websocket.close(code=1009, reason=f"Frame exceeds the {WS_MAX_FRAME_BYTES} byte limit")
+                    return
+                slot.put((received, data))
+                received += 1
+        finally:
+            slot.close()
+
+    async def analyze() -> None:
+        while True:
+            taken = await slot.take()
+            if taken is None:
+                return
+            (frame, data), dropped = taken
+            if dropped:
+                WS_FRAMES.inc("dropped", amount=dropped)
+            outcome = await detect_item(
+                BatchItem(f"frame{frame}.jpg", data, "image/jpeg"), raw_mode, filters, tenant=tenant, scope=scope
+            )
+            WS_FRAMES.inc("failed" if "error" in outcome else "analyzed")
+            try:
+                await websocket.send_json({"frame": frame, **outcome, "dropped": dropped})
+            except (WebSocketDisconnect, RuntimeError):
+                return
+
+    WS_CONNECTIONS.inc()
+    tasks = [asyncio.ensure_future(receive()), asyncio.ensure_future(analyze())]
     try:
-        rf_json = resp.json()
-    except ValueError:
-        raise HTTPException(status_code=502, detail="Roboflow returned non-JSON response")
-
-    # Normalize into clean detections
-    detections = normalize_roboflow_response(rf_json)
-
-    return JSONResponse({
-        "message": "Detection successful",
-        "detections": detections,
-        "raw": rf_json  # you can remove raw later for production
-    })
+        # the client left (or was closed on) or the socket broke: stop both sides
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        WS_CONNECTIONS.dec()
+
+
+async def detect_job_item(item: BatchItem, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Detection for one image of a background job, with the options stored at submission
+    (jobs queued before tenants were recorded are not rate limited).
+    """
+    tenant = options.get("tenant") if rate_limiter is not None else None
+    return await detect_item(item, options["include_raw"], DetectionFilters(**options["filters"]), tenant=tenant)
+
+
+def require_jobs() -> Tuple[JobStore, JobRunner]:
+    if job_store is None or job_runner is None:
+        raise HTTPException(status_code=503, detail="Background jobs are disabled (JOBS_ENABLED=false)")
+    return job_store, job_runner
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    request: Request,
+    files: Optional[List[UploadFile]] = File(None),
+    path: Optional[str] = Form(None, description="Directory or zip/tar archive below JOBS_SOURCE_ROOT, instead of files."),
+    include_raw: Optional[RawMode] = INCLUDE_RAW_QUERY,
+    filters: DetectionFilters = Depends(detection_filters),
+    tenant: Optional[str] = Depends(client_tenant),
+):
+    """
+    Queue a bulk detection job: upload image files and/or zip/tar archives, or reference
+    a server-side directory or archive with the `path` form field.
+    Returns 202 with { id, status, url }; poll GET /jobs/{id} for progress and results.
+    The images are charged to the submitting client's rate limit as they are detected.
+    """
+    time_upload(request.scope)
+    store, runner = require_jobs()
+    if bool(files) == bool(path):
+        raise HTTPException(status_code=400, detail="Send either files or a path")
+
+    job_id = new_job_id()
+    source: Dict[str, Any] = {}
+    if path:
+        try:
+            source["path"] = resolve_source_path(path, JOBS_SOURCE_ROOT)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        # the request ends before the job runs: keep the uploads next to the queue
+        upload_dir = os.path.join(runner.job_dir(job_id), "uploads")
+        os.makedirs(upload_dir, exist_ok=True)
+        source["uploads"] = []
+        for n, f in enumerate(files):
+            dest = os.path.join(upload_dir, str(n))
+            await asyncio.to_thread(save_upload, f.file, dest)
+            source["uploads"].append({
+                "name": f.filename or f"image{n}.jpg",
+                "path": dest,
+                "content_type": f.content_type or "image/jpeg",
+            })
+
+    options = {"include_raw": include_raw or RESPONSE_INCLUDE_RAW, "filters": asdict(filters), "tenant": tenant}
+    await asyncio.to_thread(store.create, job_id, source, options)
+    runner.wake()
+    return {"id": job_id, "status": "queued", "url": f"/jobs/{job_id}"}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    offset: int = Query(0, ge=0, description="Index of the first result to return."),
+    limit: int = Query(100, ge=0, le=1000, description="Results per page (0 for progress only)."),
+    status: Optional[Literal["pending", "done", "failed"]] = Query(None, description="Only results with this status."),
+):
+    """
+    Progress of a job plus one page of per-image results, in image order:
+    { id, status, created_at, updated_at, total, processed, failed, error,
+      results: [ {index, filename, status, detections, raw?, cached} | {index, filename, status, error} ],
+      next_offset }
+    status: queued | running | done | failed | cancelled. total is null until the images are listed.
+    """
+    store, _ = require_jobs()
+    job = await asyncio.to_thread(store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    results = await asyncio.to_thread(store.results, job_id, offset, limit, status) if limit else []
+    job["results"] = results
+    job["next_offset"] = offset + len(results) if limit and len(results) == limit else None
+    return job
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Cancel a queued or running job. Results written so far are kept.
+    """
+    store, runner = require_jobs()
+    previous = await asyncio.to_thread(store.cancel, job_id)
+    if previous is None:
+        if await asyncio.to_thread(store.get, job_id) is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        raise HTTPException(status_code=409, detail="Job has already finished")
+    if previous["owner"] is None or (previous["lease_until"] or 0) < time.time():
+        # no live worker holds it, so none will clean up its uploads
+        await asyncio.to_thread(shutil.rmtree, runner.job_dir(job_id), True)
+    return await asyncio.to_thread(store.get, job_id)
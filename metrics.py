@@ -0,0 +1,276 @@
+# metrics.py
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Minimal Prometheus-compatible registry. Recording a sample is a dict lookup plus
+# an integer add, cheap enough to leave on in production.
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        # values computed at scrape time (e.g. cache statistics) instead of inc()/set()
+        self._callback = callback
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def expose(self) -> List[str]:
+        lines = self.header()
+        values = self._callback() if self._callback is not None else self._values
+        for labels, value in values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_fmt(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def expose(self) -> List[str]:
+        lines = self.header()
+        for labels, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = f'le="{_fmt(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter("roadsign_requests_total", "HTTP requests handled.", ("endpoint", "status")))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge("roadsign_requests_in_flight", "HTTP requests currently being handled."))
+REQUEST_DURATION = REGISTRY.register(
+    Histogram("roadsign_request_duration_seconds", "Time until the response starts, per endpoint.", ("endpoint",))
+)
+STAGE_DURATION = REGISTRY.register(
+    Histogram("roadsign_stage_duration_seconds", "Time spent per processing stage of a detection.", ("stage",))
+)
+UPSTREAM_REQUESTS = REGISTRY.register(
+    Counter("roadsign_upstream_requests_total", "Roboflow calls by HTTP status (or 'error' for connection failures).", ("status",))
+)
+UPSTREAM_IN_FLIGHT = REGISTRY.register(Gauge("roadsign_upstream_in_flight", "Roboflow calls currently in flight."))
+UPSTREAM_RETRIES_TOTAL = REGISTRY.register(
+    Counter("roadsign_upstream_retries_total", "Roboflow calls retried after a transient failure.")
+)
+UPSTREAM_HEDGES = REGISTRY.register(
+    Counter("roadsign_upstream_hedges_total", "Hedged Roboflow calls sent, and how many answered first.", ("outcome",))
+)
+UPSTREAM_REJECTED = REGISTRY.register(
+    Counter("roadsign_upstream_rejected_total", "Roboflow calls shed by the admission controller.", ("reason",))
+)
+MICROBATCH_SIZE = REGISTRY.register(
+    Histogram("roadsign_microbatch_size", "Images per micro-batch sent to local inference.",
+              buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+)
+MICROBATCH_WAIT = REGISTRY.register(
+    Histogram("roadsign_microbatch_wait_seconds", "Time the oldest image of a micro-batch waited before dispatch.",
+              buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+)
+
+VIDEO_FRAMES = REGISTRY.register(
+    Counter("roadsign_video_frames_total", "Sampled /detect/video frames by outcome (analyzed, skipped, failed).", ("outcome",))
+)
+WS_CONNECTIONS = REGISTRY.register(Gauge("roadsign_ws_connections", "Open /ws/detect connections."))
+WS_FRAMES = REGISTRY.register(
+    Counter("roadsign_ws_frames_total", "/ws/detect frames by outcome (analyzed, failed, or dropped for a newer frame).", ("outcome",))
+)
+JOB_ITEMS = REGISTRY.register(
+    Counter("roadsign_job_items_total", "Images processed by background jobs, by outcome.", ("outcome",))
+)
+TILES = REGISTRY.register(
+    Counter("roadsign_tiles_total", "Tiles of tiled detections, sent upstream or skipped as flat.", ("outcome",))
+)
+RATE_LIMITED = REGISTRY.register(
+    Counter("roadsign_rate_limited_total", "Images refused with 429, by exhausted limit (rate or daily).", ("reason",))
+)
+WARMUP_SECONDS = REGISTRY.register(
+    Gauge("roadsign_warmup_seconds", "Time this worker spent on each startup warm-up step.", ("step",))
+)
+
+# stage name -> seconds, for the request being handled
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("timings", default=None)
+
+
+def start_timings() -> Dict[str, float]:
+    timings: Dict[str, float] = {}
+    _timings.set(timings)
+    return timings
+
+
+def record_stage(stage: str, seconds: float, observe: bool = True) -> None:
+    """
+    Add a stage duration to the histogram and to the current request's Server-Timing.
+    observe=False only adds it to Server-Timing (the histogram was fed elsewhere).
+    """
+    if observe:
+        STAGE_DURATION.observe(seconds, stage)
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def server_timing(timings: Dict[str, float], total: float) -> str:
+    """
+    Server-Timing header value, durations in milliseconds.
+    """
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """
+    Counts requests per endpoint and status, tracks in-flight requests, and adds a
+    Server-Timing header with the per-stage breakdown recorded while handling the request.
+    The request start time is kept in the scope so handlers can time the upload.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _endpoint(scope) -> str:
+        route = scope.get("route")
+        if route is not None and getattr(route, "path", None):
+            return route.path
+        if scope["path"].startswith("/static/"):
+            return "/static"
+        # unmatched paths share one label to keep cardinality bounded
+        return "other"
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        scope["request_start"] = start
+        timings = start_timings()
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                total = time.perf_counter() - start
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(timings, total).encode("latin-1")))
+                message = {**message, "headers": headers}
+                REQUEST_DURATION.observe(total, self._endpoint(scope))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            REQUESTS.inc(self._endpoint(scope), str(status["code"]))
+
+
+def time_upload(scope) -> None:
+    """
+    Record the time from request start until the handler runs (body receipt and
+    multipart parsing) as the `upload` stage.
+    """
+    start = scope.get("request_start")
+    if start is not None:
+        record_stage("upload", time.perf_counter() - start)
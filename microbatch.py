@@ -0,0 +1,124 @@
+# microbatch.py
+import asyncio
+import contextvars
+import time
+from typing import Any, Awaitable, Callable, Generic, List, Optional, TypeVar
+
+from metrics import MICROBATCH_SIZE, MICROBATCH_WAIT, record_stage
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class _Entry:
+    __slots__ = ("item", "future", "enqueued", "dispatched")
+
+    def __init__(self, item: Any, future: asyncio.Future):
+        self.item = item
+        self.future = future
+        self.enqueued = time.perf_counter()
+        self.dispatched = 0.0
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collects concurrent single-item calls into batches for a batch function.
+
+    A batch is dispatched when max_batch_size items are waiting or the oldest has waited
+    max_wait seconds. At most max_in_flight batches run at once; while they are all busy,
+    arriving items keep collecting and go out as one larger batch as soon as a slot frees
+    up, so batches grow with load instead of queueing behind each other.
+
+    run_batch gets a list of items and returns one result per item, in order; a result
+    that is an exception is raised to that item's caller only.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[T]], Awaitable[List[Any]]],
+        max_batch_size: int = 8,
+        max_wait: float = 0.005,
+        max_in_flight: int = 1,
+    ):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.max_in_flight = max(1, max_in_flight)
+        self._pending: List[_Entry] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running = 0
+        self._tasks: set = set()
+
+    async def submit(self, item: T) -> R:
+        loop = asyncio.get_running_loop()
+        entry = _Entry(item, loop.create_future())
+        self._pending.append(entry)
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._on_timer)
+
+        result = await entry.future
+        # per-request share of the batch: waiting for it to fill, then running it
+        done = time.perf_counter()
+        record_stage("batch_wait", entry.dispatched - entry.enqueued)
+        record_stage("inference", done - entry.dispatched, observe=False)
+        return result
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._flush()
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending and self._running < self.max_in_flight:
+            batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+            # callers that gave up (client disconnected) are dropped before running
+            batch = [e for e in batch if not e.future.done()]
+            if not batch:
+                continue
+            self._running += 1
+            now = time.perf_counter()
+            for e in batch:
+                e.dispatched = now
+            MICROBATCH_SIZE.observe(len(batch))
+            MICROBATCH_WAIT.observe(now - batch[0].enqueued)
+            # a fresh context, so stages timed inside the batch are not charged to
+            # whichever request happened to trigger the flush
+            task = contextvars.Context().run(asyncio.ensure_future, self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if self._pending and self._timer is None and self._running < self.max_in_flight:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._on_timer)
+
+    async def _run(self, batch: List[_Entry]) -> None:
+        try:
+            results = await self.run_batch([e.item for e in batch])
+        except asyncio.CancelledError:
+            for entry in batch:
+                entry.future.cancel()
+            raise
+        except Exception as exc:
+            results = [exc] * len(batch)
+        finally:
+            self._running -= 1
+        for entry, result in zip(batch, results):
+            if entry.future.done():
+                continue
+            if isinstance(result, BaseException):
+                entry.future.set_exception(result)
+            else:
+                entry.future.set_result(result)
+        if self._pending:
+            # these waited while every slot was busy: send them right away
+            self._flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "running": self._running,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
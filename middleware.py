@@ -0,0 +1,62 @@
+# middleware.py
+from typing import Sequence, Tuple
+
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+
+class BodySizeLimitMiddleware:
+    """
+    Reject request bodies above a size limit before they are buffered.
+
+    A declared Content-Length over the limit is answered with 413 straight away,
+    without reading the body. Chunked bodies are counted while the app reads them
+    and the upload is aborted with 413 as soon as the limit is passed.
+    Limits are chosen by path prefix; the first matching prefix wins.
+    """
+
+    def __init__(self, app, limits: Sequence[Tuple[str, int]]):
+        self.app = app
+        self.limits = list(limits)
+
+    def _limit_for(self, path: str):
+        for prefix, limit in self.limits:
+            if path.startswith(prefix):
+                return limit
+        return None
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limit = self._limit_for(scope["path"])
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body exceeds the {limit} byte limit"
+        for name, value in scope.get("headers", ()):
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = 0
+                if declared > limit:
+                    response = JSONResponse({"detail": detail}, status_code=413, headers={"Connection": "close"})
+                    await response(scope, receive, send)
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # HTTPException passes through FastAPI's body parsing untouched
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,181 @@
+# neardup.py
+import io
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from PIL import Image
+
+from utils import ImageData
+from video import dhash, hamming
+
+# JPEGs are decoded at a reduced scale for hashing; the hash only needs a 9x8 thumbnail
+_DRAFT_SIZE = (64, 64)
+
+
+def image_hash(image: ImageData) -> Optional[int]:
+    """
+    64-bit difference hash of an uploaded image (see video.dhash), or None when it
+    cannot be decoded. File objects are rewound afterwards. Blocking.
+    EXIF orientation is ignored: a fixed camera always writes the same one.
+    """
+    try:
+        if isinstance(image, bytes):
+            img = Image.open(io.BytesIO(image))
+        else:
+            image.seek(0)
+            img = Image.open(image)
+        img.draft("L", _DRAFT_SIZE)
+        return dhash(img)
+    except Exception:
+        return None
+    finally:
+        if not isinstance(image, bytes):
+            image.seek(0)
+
+
+class _Entry:
+    __slots__ = ("hash", "added", "value", "dead")
+
+    def __init__(self, h: int, added: float, value: Dict[str, Any]):
+        self.hash = h
+        self.added = added
+        self.value = value
+        # evicted or expired; still a routing node of the tree until the next rebuild
+        self.dead = False
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes with the Hamming distance: children are
+    keyed by their distance to the parent, so by the triangle inequality a search
+    within radius r only descends into children keyed d - r .. d + r.
+    """
+
+    def __init__(self):
+        # node: [entry, {distance: child node}]
+        self._root: Optional[list] = None
+
+    def add(self, entry: _Entry) -> None:
+        if self._root is None:
+            self._root = [entry, {}]
+            return
+        node = self._root
+        while True:
+            d = hamming(entry.hash, node[0].hash)
+            child = node[1].get(d)
+            if child is None:
+                node[1][d] = [entry, {}]
+                return
+            node = child
+
+    def nearest(self, h: int, radius: int, max_age: float, now: float) -> Tuple[Optional[_Entry], int, int]:
+        """
+        Closest live entry within `radius` bits added at most max_age seconds ago.
+        Returns (entry or None, its distance, nodes visited).
+        """
+        best: Optional[_Entry] = None
+        best_d = radius
+        visited = 0
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            entry, children = stack.pop()
+            visited += 1
+            d = hamming(h, entry.hash)
+            if d <= best_d and not entry.dead and now - entry.added <= max_age:
+                best, best_d = entry, d
+            for k, child in children.items():
+                if d - best_d <= k <= d + best_d:
+                    stack.append(child)
+        return best, best_d, visited
+
+
+class _Scope:
+    """
+    The recent frames of one camera: a BK-tree for lookups and a FIFO of the same
+    entries for eviction. Evicted entries are only flagged; the tree is rebuilt from
+    the live entries once the dead ones outnumber them.
+    """
+
+    def __init__(self):
+        self.tree = BKTree()
+        self.entries: Deque[_Entry] = deque()
+        self.dead = 0
+
+    def expire(self, now: float, ttl: float, max_entries: int) -> None:
+        while self.entries and (len(self.entries) > max_entries or now - self.entries[0].added > ttl):
+            self.entries.popleft().dead = True
+            self.dead += 1
+        if self.dead > len(self.entries):
+            self.tree = BKTree()
+            for entry in self.entries:
+                self.tree.add(entry)
+            self.dead = 0
+
+
+class NearDuplicateIndex:
+    """
+    Detection results of recent images per scope (a camera id plus the model settings),
+    found by perceptual hash: an image within `threshold` bits of one analyzed less than
+    `ttl` seconds ago gets that image's result without a backend call. Meant for fixed
+    cameras, whose frames differ by sensor noise and compression but not in content.
+    At most max_scopes scopes (least recently used dropped) of max_entries images each.
+    """
+
+    def __init__(self, threshold: int = 4, ttl: float = 10.0, max_entries: int = 256, max_scopes: int = 1024):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_scopes = max_scopes
+        self._scopes: "OrderedDict[str, _Scope]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lookups = 0
+        self.nodes_visited = 0
+        self.lookup_seconds = 0.0
+
+    def lookup(self, scope: str, h: int) -> Tuple[Optional[Dict[str, Any]], int, int]:
+        """
+        (result of the closest recent image or None, its distance, nodes visited).
+        """
+        start = time.perf_counter()
+        now = time.monotonic()
+        found = self._scopes.get(scope)
+        entry, distance, visited = None, 0, 0
+        if found is not None:
+            self._scopes.move_to_end(scope)
+            found.expire(now, self.ttl, self.max_entries)
+            entry, distance, visited = found.tree.nearest(h, self.threshold, self.ttl, now)
+        self.lookups += 1
+        self.nodes_visited += visited
+        self.lookup_seconds += time.perf_counter() - start
+        if entry is None:
+            self.misses += 1
+            return None, 0, visited
+        self.hits += 1
+        return entry.value, distance, visited
+
+    def add(self, scope: str, h: int, value: Dict[str, Any]) -> None:
+        found = self._scopes.get(scope)
+        if found is None:
+            found = self._scopes[scope] = _Scope()
+            while len(self._scopes) > self.max_scopes:
+                self._scopes.popitem(last=False)
+        self._scopes.move_to_end(scope)
+        entry = _Entry(h, time.monotonic(), value)
+        found.entries.append(entry)
+        found.tree.add(entry)
+        found.expire(entry.added, self.ttl, self.max_entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "scopes": len(self._scopes),
+            "entries": sum(len(s.entries) for s in self._scopes.values()),
+            "threshold": self.threshold,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / self.lookups) if self.lookups else 0.0,
+            "avg_nodes_visited": (self.nodes_visited / self.lookups) if self.lookups else 0.0,
+            "avg_lookup_seconds": (self.lookup_seconds / self.lookups) if self.lookups else 0.0,
+        }
@@ -0,0 +1,297 @@
+# onnx_backend.py
+import ast
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+try:
+    import onnxruntime as ort
+except ImportError:  # optional: only needed with DETECTION_BACKEND=onnx
+    ort = None
+
+from postprocess import nms_indices
+
+# grey used by YOLO letterboxing
+_PAD_VALUE = 114
+
+# the model of this worker process, loaded once by _init_worker
+_model: Optional["_YoloModel"] = None
+
+
+class _YoloModel:
+    """
+    An exported YOLO detector (YOLOv5 or YOLOv8/11 ONNX layout) in one worker process.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        intra_op_threads: int,
+        class_names: Sequence[str],
+        input_size: int,
+        output_format: str,
+    ):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        # one graph at a time per process; parallelism comes from the process pool
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        shape = model_input.shape
+        # symbolic or missing dimensions mean the model accepts any batch / size
+        self.dynamic_batch = not isinstance(shape[0], int) or shape[0] < 1
+        height = shape[2] if len(shape) == 4 and isinstance(shape[2], int) and shape[2] > 0 else input_size
+        width = shape[3] if len(shape) == 4 and isinstance(shape[3], int) and shape[3] > 0 else input_size
+        self.input_hw = (height, width)
+        self.names = list(class_names) or _metadata_names(self.session)
+        self.output_format = output_format
+
+    def describe(self) -> Dict[str, Any]:
+        return {"input_hw": self.input_hw, "dynamic_batch": self.dynamic_batch, "names": self.names}
+
+    def letterbox(self, img: Image.Image) -> Tuple[np.ndarray, float, int, int]:
+        """
+        Resize keeping the aspect ratio and pad to the input size.
+        Returns (HWC uint8 canvas, ratio, pad_x, pad_y).
+        """
+        in_h, in_w = self.input_hw
+        ratio = min(in_w / img.width, in_h / img.height)
+        new_w, new_h = max(1, round(img.width * ratio)), max(1, round(img.height * ratio))
+        if (new_w, new_h) != img.size:
+            img = img.resize((new_w, new_h), Image.BILINEAR)
+        left, top = (in_w - new_w) // 2, (in_h - new_h) // 2
+        canvas = np.full((in_h, in_w, 3), _PAD_VALUE, dtype=np.uint8)
+        canvas[top:top + new_h, left:left + new_w] = np.asarray(img)
+        return canvas, ratio, left, top
+
+    def _layout(self, output: np.ndarray) -> str:
+        if self.output_format != "auto":
+            return self.output_format
+        nc = len(self.names)
+        if nc:
+            if output.shape[1] == 4 + nc:
+                return "yolov8"
+            if output.shape[2] == 5 + nc:
+                return "yolov5"
+        # YOLOv8 puts the (few) channels before the (many) anchors
+        return "yolov8" if output.shape[1] < output.shape[2] else "yolov5"
+
+    def _decode(
+        self, preds: np.ndarray, layout: str, conf_threshold: float, iou_threshold: float, max_detections: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        One image's raw output -> (xyxy boxes, scores, class ids) in input-tensor pixels.
+        """
+        if layout == "yolov8":
+            preds = preds.T
+            class_scores = preds[:, 4:]
+        else:
+            class_scores = preds[:, 5:] * preds[:, 4:5]
+        class_ids = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(class_scores)), class_ids]
+        keep = scores >= conf_threshold
+        boxes, scores, class_ids = preds[keep, :4], scores[keep], class_ids[keep]
+
+        xyxy = np.empty_like(boxes)
+        xyxy[:, 0] = boxes[:, 0] - boxes[:, 2] / 2
+        xyxy[:, 1] = boxes[:, 1] - boxes[:, 3] / 2
+        xyxy[:, 2] = boxes[:, 0] + boxes[:, 2] / 2
+        xyxy[:, 3] = boxes[:, 1] + boxes[:, 3] / 2
+        kept = nms_indices(xyxy, scores, iou_threshold, class_ids)[:max_detections]
+        return xyxy[kept], scores[kept], class_ids[kept]
+
+    def _label(self, class_id: int) -> str:
+        return self.names[class_id] if class_id < len(self.names) else str(class_id)
+
+    def infer(
+        self, images: List[bytes], conf_threshold: float, iou_threshold: float, max_detections: int
+    ) -> List[Union[Dict[str, Any], str]]:
+        """
+        Detections for each image as a Roboflow-style response, or an error message
+        for images that could not be decoded. Images are run as one batched tensor
+        when the model has a dynamic batch dimension.
+        """
+        results: List[Union[Dict[str, Any], str]] = [""] * len(images)
+        canvases, metas, slots = [], [], []
+        for i, data in enumerate(images):
+            try:
+                img = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+                if img.mode != "RGB":
+                    img = img.convert("RGB")
+            except Exception:
+                results[i] = "Could not decode image"
+                continue
+            canvas, ratio, pad_x, pad_y = self.letterbox(img)
+            canvases.append(canvas)
+            metas.append((img.width, img.height, ratio, pad_x, pad_y))
+            slots.append(i)
+        if not canvases:
+            return results
+
+        # HWC uint8 -> NCHW float32 in 0..1, written straight into one batch tensor
+        in_h, in_w = self.input_hw
+        batch = np.empty((len(canvases), 3, in_h, in_w), dtype=np.float32)
+        for n, canvas in enumerate(canvases):
+            batch[n] = canvas.transpose(2, 0, 1)
+        batch *= 1 / 255.0
+
+        start = time.perf_counter()
+        if self.dynamic_batch:
+            outputs = self.session.run(None, {self.input_name: batch})[0]
+        else:
+            outputs = np.concatenate(
+                [self.session.run(None, {self.input_name: batch[n:n + 1]})[0] for n in range(len(batch))]
+            )
+        elapsed = (time.perf_counter() - start) / len(batch)
+
+        layout = self._layout(outputs)
+        for slot, preds, (width, height, ratio, pad_x, pad_y) in zip(slots, outputs, metas):
+            xyxy, scores, class_ids = self._decode(preds, layout, conf_threshold, iou_threshold, max_detections)
+            # input-tensor pixels -> original image pixels
+            xyxy[:, [0, 2]] = np.clip((xyxy[:, [0, 2]] - pad_x) / ratio, 0, width)
+            xyxy[:, [1, 3]] = np.clip((xyxy[:, [1, 3]] - pad_y) / ratio, 0, height)
+            # boxes inside the letterbox padding collapse to nothing once clipped
+            keep = (xyxy[:, 2] > xyxy[:, 0]) & (xyxy[:, 3] > xyxy[:, 1])
+            xyxy, scores, class_ids = xyxy[keep], scores[keep], class_ids[keep]
+            predictions = []
+            for (x1, y1, x2, y2), score, class_id in zip(xyxy.tolist(), scores.tolist(), class_ids.tolist()):
+                predictions.append({
+                    "x": round((x1 + x2) / 2, 1),
+                    "y": round((y1 + y2) / 2, 1),
+                    "width": round(x2 - x1, 1),
+                    "height": round(y2 - y1, 1),
+                    "confidence": round(score, 4),
+                    "class": self._label(class_id),
+                    "class_id": class_id,
+                })
+            results[slot] = {
+                "time": round(elapsed, 4),
+                "image": {"width": width, "height": height},
+                "predictions": predictions,
+            }
+        return results
+
+
+def _metadata_names(session) -> List[str]:
+    """
+    Class names from Ultralytics export metadata ("{0: 'stop', 1: 'yield'}"), if present.
+    """
+    raw = session.get_modelmeta().custom_metadata_map.get("names")
+    if not raw:
+        return []
+    try:
+        names = ast.literal_eval(raw)
+    except (ValueError, SyntaxError):
+        return []
+    if isinstance(names, dict):
+        return [str(names[k]) for k in sorted(names)]
+    return [str(n) for n in names]
+
+
+def _init_worker(*args) -> None:
+    global _model
+    _model = _YoloModel(*args)
+
+
+def _describe() -> Dict[str, Any]:
+    return _model.describe()
+
+
+def _infer(images: List[bytes], conf_threshold: float, iou_threshold: float, max_detections: int):
+    return _model.infer(images, conf_threshold, iou_threshold, max_detections)
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+class OnnxRunner:
+    """
+    A pool of worker processes, each holding one ONNX Runtime session of the model.
+    Images are decoded, letterboxed and inferred in the workers, so the event loop
+    and the GIL of the API process stay free.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        class_names: Sequence[str] = (),
+        workers: int = 1,
+        intra_op_threads: int = 1,
+        batch_size: int = 8,
+        conf_threshold: float = 0.25,
+        iou_threshold: float = 0.45,
+        max_detections: int = 300,
+        input_size: int = 640,
+        output_format: str = "auto",
+    ):
+        self.model_path = model_path
+        self.class_names = list(class_names)
+        self.workers = max(1, workers)
+        self.intra_op_threads = max(1, intra_op_threads)
+        self.batch_size = max(1, batch_size)
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.max_detections = max_detections
+        self.input_size = input_size
+        self.output_format = output_format
+        self.digest: Optional[str] = None
+        self.info: Dict[str, Any] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    async def start(self) -> None:
+        if ort is None:
+            raise RuntimeError("DETECTION_BACKEND=onnx needs the onnxruntime package (pip install onnxruntime)")
+        if not os.path.isfile(self.model_path):
+            raise RuntimeError(f"ONNX model not found: {self.model_path}")
+        self.digest = await asyncio.to_thread(file_digest, self.model_path)
+        # spawn, not fork: the parent runs an event loop and threads
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model_path, self.intra_op_threads, self.class_names, self.input_size, self.output_format),
+        )
+        loop = asyncio.get_running_loop()
+        # load the model in every worker now, so a broken model fails startup and
+        # the first requests do not pay for session creation
+        infos = await asyncio.gather(*(loop.run_in_executor(self._pool, _describe) for _ in range(self.workers)))
+        self.info = infos[0]
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def infer(self, images: List[bytes]) -> List[Union[Dict[str, Any], str]]:
+        """
+        Run images through the pool in chunks of batch_size (chunks run in parallel
+        across workers). Returns one response dict or error message per image.
+        """
+        if self._pool is None:
+            raise RuntimeError("ONNX backend is not started")
+        loop = asyncio.get_running_loop()
+        chunks = [images[i:i + self.batch_size] for i in range(0, len(images), self.batch_size)]
+        outputs = await asyncio.gather(*(
+            loop.run_in_executor(
+                self._pool, _infer, chunk, self.conf_threshold, self.iou_threshold, self.max_detections
+            )
+            for chunk in chunks
+        ))
+        return [result for chunk in outputs for result in chunk]
@@ -0,0 +1,152 @@
+# packing.py
+import struct
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # optional: without it Accept: application/msgpack gets JSON
+    msgpack = None
+
+from descriptions import describe_sign
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+PACKED_MEDIA_TYPE = "application/vnd.roadsign.detections"
+
+# x, y, width, height, confidence, class id: 24 bytes per detection, little-endian
+RECORD_DTYPE = np.dtype([
+    ("x", "<f4"),
+    ("y", "<f4"),
+    ("width", "<f4"),
+    ("height", "<f4"),
+    ("confidence", "<f4"),
+    ("class_id", "<u4"),
+])
+
+_FLOAT_FIELDS = ("x", "y", "width", "height", "confidence")
+# a value the model did not report; 0.0 would be a real coordinate or score
+_MISSING = float("nan")
+
+# magic, format version, flags (bit 0: cached), detection count, class table id, extra class count
+_HEADER = struct.Struct("<4sBBIIH")
+_MAGIC = b"RSDP"
+_VERSION = 1
+_FLAG_CACHED = 1
+
+_MEDIA_TYPES = {
+    "application/json": "json",
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+    PACKED_MEDIA_TYPE: "packed",
+}
+
+
+class ClassTable:
+    """
+    Label strings of a model interned to small integer ids, so binary responses carry
+    an id per detection and clients fetch the labels (and descriptions) once from
+    GET /classes. `id` is a checksum of the labels: a response whose class table id
+    differs from the client's copy means the table changed and must be fetched again.
+    Labels missing from the table are numbered after it and listed in the response.
+    """
+
+    def __init__(self, labels: Sequence[str]):
+        self.labels: List[str] = list(dict.fromkeys(labels))
+        self._ids = {label: i for i, label in enumerate(self.labels)}
+        self.id = zlib.crc32("\n".join(self.labels).encode("utf-8"))
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def lookup(self, label: str, extra: Dict[str, int]) -> int:
+        class_id = self._ids.get(label)
+        if class_id is None:
+            class_id = extra.get(label)
+            if class_id is None:
+                class_id = extra[label] = len(self.labels) + len(extra)
+        return class_id
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "classes": [
+                {"id": i, "label": label, "description": describe_sign(label)}
+                for i, label in enumerate(self.labels)
+            ],
+        }
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """
+    Response format for an Accept header: json, msgpack or packed. The highest q-value
+    wins, ties go to the first listed; anything unsupported (and msgpack without the
+    msgpack package) falls back to json.
+    """
+    best, best_q = "json", 0.0
+    for part in (accept or "").split(","):
+        media_type, _, params = part.strip().partition(";")
+        fmt = _MEDIA_TYPES.get(media_type.strip().lower())
+        if fmt is None or (fmt == "msgpack" and msgpack is None):
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = fmt, q
+    return best
+
+
+def pack_detections(detections: List[Dict[str, Any]], table: ClassTable) -> Tuple[bytes, List[str]]:
+    """
+    Detections as RECORD_DTYPE records (missing values as NaN), plus the labels that
+    are not in the class table, in the order of their ids (len(table), len(table) + 1, ...).
+    """
+    extra: Dict[str, int] = {}
+    rows = [
+        (
+            *(_MISSING if d.get(key) is None else d[key] for key in _FLOAT_FIELDS),
+            table.lookup(d.get("label") or "", extra),
+        )
+        for d in detections
+    ]
+    return np.array(rows, dtype=RECORD_DTYPE).tobytes(), list(extra)
+
+
+def encode_packed(detections: List[Dict[str, Any]], table: ClassTable, cached: bool) -> bytes:
+    """
+    Header (_HEADER), the extra labels (u16 length + UTF-8 each), then the records.
+    """
+    records, extra = pack_detections(detections, table)
+    parts = [_HEADER.pack(_MAGIC, _VERSION, _FLAG_CACHED if cached else 0, len(detections), table.id, len(extra))]
+    for label in extra:
+        data = label.encode("utf-8")
+        parts.append(struct.pack("<H", len(data)) + data)
+    parts.append(records)
+    return b"".join(parts)
+
+
+def encode_msgpack(
+    detections: List[Dict[str, Any]], table: ClassTable, cached: bool, raw: Optional[Any] = None
+) -> bytes:
+    """
+    {message, class_table, extra_classes, detections: <records as bin>, cached, raw?}
+    """
+    records, extra = pack_detections(detections, table)
+    body = {
+        "message": "Detection successful",
+        "class_table": table.id,
+        "extra_classes": extra,
+        "detections": records,
+        "cached": cached,
+    }
+    if raw is not None:
+        body["raw"] = raw
+    return msgpack.packb(body, use_bin_type=True)
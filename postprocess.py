@@ -0,0 +1,183 @@
+# postprocess.py
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+def box_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """
+    IoU of one x1y1x2y2 box against an (N, 4) array of x1y1x2y2 boxes.
+    """
+    ix1 = np.maximum(box[0], boxes[:, 0])
+    iy1 = np.maximum(box[1], boxes[:, 1])
+    ix2 = np.minimum(box[2], boxes[:, 2])
+    iy2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    union = area + areas - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def pairwise_iou(boxes: np.ndarray) -> np.ndarray:
+    """
+    (N, N) IoU matrix of an (N, 4) array of x1y1x2y2 boxes.
+    """
+    ix1 = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+    iy1 = np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+    ix2 = np.minimum(boxes[:, None, 2], boxes[None, :, 2])
+    iy2 = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    union = areas[:, None] + areas[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def pairwise_ios(boxes: np.ndarray) -> np.ndarray:
+    """
+    (N, N) intersection over the smaller box's area. Unlike IoU it is high when a box
+    cut off at a tile seam lies inside the full box of the same object.
+    """
+    ix1 = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+    iy1 = np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+    ix2 = np.minimum(boxes[:, None, 2], boxes[None, :, 2])
+    iy2 = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    smaller = np.minimum(areas[:, None], areas[None, :])
+    return np.divide(inter, smaller, out=np.zeros_like(inter), where=smaller > 0)
+
+
+def box_ios(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    return pairwise_ios(np.vstack([box[None, :], boxes]))[0, 1:]
+
+
+_OVERLAP_METRICS = {"iou": (pairwise_iou, box_iou), "ios": (pairwise_ios, box_ios)}
+
+# above this many boxes the (N, N) matrix gets too large; suppress row by row instead
+_PAIRWISE_MAX_BOXES = 2048
+
+
+def _nms_single_class(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float, metric: str = "iou") -> np.ndarray:
+    pairwise, one_to_many = _OVERLAP_METRICS[metric]
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    if len(order) <= _PAIRWISE_MAX_BOXES:
+        # all IoUs in one vectorized step; the greedy pass is then just mask updates
+        overlaps = pairwise(boxes[order]) > iou_threshold
+        suppressed = np.zeros(len(order), dtype=bool)
+        for n in range(len(order)):
+            if suppressed[n]:
+                continue
+            keep.append(order[n])
+            suppressed |= overlaps[n]
+    else:
+        while order.size:
+            i = order[0]
+            keep.append(i)
+            rest = order[1:]
+            order = rest[one_to_many(boxes[i], boxes[rest]) <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def nms_indices(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    iou_threshold: float,
+    class_ids: Optional[np.ndarray] = None,
+    metric: str = "iou",
+) -> np.ndarray:
+    """
+    Greedy non-maximum suppression. boxes is (N, 4) x1y1x2y2, scores is (N,).
+    With class_ids, boxes only suppress boxes of the same class (each class is
+    suppressed on its own, which also keeps the IoU matrices small).
+    metric="ios" compares intersection over the smaller box instead of IoU.
+    Returns the kept indices, highest score first.
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+    if class_ids is None:
+        return _nms_single_class(boxes, scores, iou_threshold, metric)
+
+    kept = []
+    for cls in np.unique(class_ids):
+        idx = np.flatnonzero(class_ids == cls)
+        kept.append(idx[_nms_single_class(boxes[idx], scores[idx], iou_threshold, metric)])
+    kept = np.concatenate(kept)
+    return kept[np.argsort(-scores[kept], kind="stable")]
+
+
+@dataclass
+class DetectionFilters:
+    """
+    Server-side filtering applied to normalized detections before they are returned.
+    All fields are optional; an empty DetectionFilters returns detections unchanged.
+    """
+    min_confidence: Optional[float] = None
+    classes: Optional[List[str]] = None
+    max_detections: Optional[int] = None
+    nms: bool = False
+    iou_threshold: float = 0.5
+
+    def active(self) -> bool:
+        return bool(self.min_confidence is not None or self.classes or self.max_detections is not None or self.nms)
+
+    def apply(self, detections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Confidence threshold, class allow-list (case-insensitive), optional class-aware
+        NMS, then the max_detections cap keeping the most confident detections.
+        """
+        if not self.active() or not detections:
+            return detections
+
+        if self.min_confidence is not None:
+            detections = [d for d in detections if d.get("confidence") is not None and d["confidence"] >= self.min_confidence]
+        if self.classes:
+            allowed = {c.strip().lower() for c in self.classes}
+            detections = [d for d in detections if str(d.get("label") or "").strip().lower() in allowed]
+
+        if self.nms and len(detections) > 1:
+            detections = self._nms(detections)
+
+        if self.max_detections is not None and len(detections) > self.max_detections:
+            detections = sorted(detections, key=lambda d: d.get("confidence") or 0.0, reverse=True)[: self.max_detections]
+        return detections
+
+    def _nms(self, detections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return suppress_detections(detections, self.iou_threshold)
+
+
+def suppress_detections(detections: List[Dict[str, Any]], threshold: float, metric: str = "iou") -> List[Dict[str, Any]]:
+    """
+    Class-aware NMS over normalized detections (center x/y, width, height), keeping
+    the original order of the survivors.
+    """
+    # detections without a complete box cannot overlap anything; they are always kept
+    boxed: List[int] = []
+    unboxed: List[int] = []
+    for i, d in enumerate(detections):
+        if all(isinstance(d.get(k), (int, float)) for k in ("x", "y", "width", "height")):
+            boxed.append(i)
+        else:
+            unboxed.append(i)
+    if len(boxed) < 2:
+        return detections
+
+    xywh = np.array([[detections[i][k] for k in ("x", "y", "width", "height")] for i in boxed], dtype=np.float64)
+    boxes = np.empty_like(xywh)
+    boxes[:, 0] = xywh[:, 0] - xywh[:, 2] / 2
+    boxes[:, 1] = xywh[:, 1] - xywh[:, 3] / 2
+    boxes[:, 2] = xywh[:, 0] + xywh[:, 2] / 2
+    boxes[:, 3] = xywh[:, 1] + xywh[:, 3] / 2
+    scores = np.array([detections[i].get("confidence") or 0.0 for i in boxed], dtype=np.float64)
+
+    labels = [detections[i].get("label") for i in boxed]
+    label_ids = {label: n for n, label in enumerate(dict.fromkeys(labels))}
+    class_ids = np.array([label_ids[label] for label in labels], dtype=np.int64)
+
+    kept = nms_indices(boxes, scores, threshold, class_ids, metric)
+    keep = {boxed[i] for i in kept.tolist()}
+    keep.update(unboxed)
+    # preserve the original order
+    return [d for i, d in enumerate(detections) if i in keep]
@@ -0,0 +1,120 @@
+# preprocess.py
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+from utils import ImageData
+from config import (
+    PREPROCESS_ENABLED,
+    PREPROCESS_MAX_SIDE,
+    PREPROCESS_FORMAT,
+    PREPROCESS_QUALITY,
+    PREPROCESS_WORKERS,
+)
+
+_CONTENT_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+@dataclass
+class PreparedImage:
+    """
+    Image ready to send upstream plus the factors that map boxes on the
+    sent image back to the original (EXIF-oriented) image.
+    """
+    data: ImageData
+    filename: str
+    content_type: str
+    scale_x: float = 1.0
+    scale_y: float = 1.0
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+
+def settings_signature() -> str:
+    """
+    Short string describing the active preprocessing settings, so cached results
+    produced under different settings are not mixed up.
+    """
+    if not PREPROCESS_ENABLED:
+        return "raw"
+    return f"{PREPROCESS_FORMAT}:{PREPROCESS_MAX_SIDE}:{PREPROCESS_QUALITY}"
+
+
+def preprocess_image(image: ImageData, filename: str, content_type: str) -> PreparedImage:
+    """
+    Decode, apply EXIF orientation, downscale so the longest side is at most
+    PREPROCESS_MAX_SIDE and re-encode. Blocking; run it through prepare_image().
+    Images Pillow cannot decode are passed through unchanged (file objects are
+    rewound by the upstream client before sending).
+    """
+    try:
+        if isinstance(image, bytes):
+            img = Image.open(io.BytesIO(image))
+        else:
+            image.seek(0)
+            img = Image.open(image)
+        # reading EXIF does not decode pixels; stay lazy until we know we need to
+        orientation = img.getexif().get(0x0112, 1)
+        orig_w, orig_h = img.size
+        if orientation in (5, 6, 7, 8):
+            orig_w, orig_h = orig_h, orig_w
+    except Exception:
+        return PreparedImage(image, filename, content_type)
+
+    longest = max(orig_w, orig_h)
+    if longest <= PREPROCESS_MAX_SIDE and orientation == 1:
+        # already small and upright: forwarding the original is cheapest
+        return PreparedImage(image, filename, content_type, width=orig_w, height=orig_h)
+
+    try:
+        if longest > PREPROCESS_MAX_SIDE:
+            # let the decoder drop resolution early (JPEG DCT scaling) before the real resize
+            img.draft("RGB", (PREPROCESS_MAX_SIDE, PREPROCESS_MAX_SIDE))
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.thumbnail((PREPROCESS_MAX_SIDE, PREPROCESS_MAX_SIDE), Image.LANCZOS)
+
+        out = io.BytesIO()
+        img.save(out, format=PREPROCESS_FORMAT, quality=PREPROCESS_QUALITY)
+    except Exception:
+        return PreparedImage(image, filename, content_type)
+
+    new_w, new_h = img.size
+    stem = filename.rsplit(".", 1)[0] if "." in filename else filename
+    return PreparedImage(
+        data=out.getvalue(),
+        filename=f"{stem}.{PREPROCESS_FORMAT.lower()}",
+        content_type=_CONTENT_TYPES[PREPROCESS_FORMAT],
+        scale_x=orig_w / new_w,
+        scale_y=orig_h / new_h,
+        width=orig_w,
+        height=orig_h,
+    )
+
+
+async def prepare_image(image: ImageData, filename: str, content_type: str) -> PreparedImage:
+    """
+    Run preprocess_image() in the worker pool so decoding never blocks the event loop.
+    Returns the upload unchanged when preprocessing is disabled.
+    """
+    global _executor
+    if not PREPROCESS_ENABLED:
+        return PreparedImage(image, filename, content_type)
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix="preprocess")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, preprocess_image, image, filename, content_type)
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
@@ -0,0 +1,349 @@
+# ratelimit.py
+import asyncio
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from metrics import RATE_LIMITED
+from upstream import UpstreamError
+
+_DAY = 86400
+
+
+@dataclass(frozen=True)
+class Policy:
+    """
+    Limits of one tenant: a token bucket refilled with `rate` images per second that
+    holds at most `burst`, and an optional cap on images per UTC day.
+    """
+    rate: float
+    burst: float
+    daily: Optional[int] = None
+
+
+class RateLimited(UpstreamError):
+    """
+    The client is over its rate or its daily quota (429, with Retry-After and quota headers).
+    """
+
+    def __init__(self, detail: str, headers: Dict[str, str]):
+        super().__init__(429, detail, headers=headers)
+
+
+def load_tenants(path: Optional[str], default: Policy) -> Dict[str, Tuple[str, Policy]]:
+    """
+    RATE_LIMIT_TENANTS: a JSON file mapping API keys to their limits,
+    {"<key>": {"name": "acme", "rate": 10, "burst": 50, "daily": 100000}}.
+    Missing fields take the default policy. Returns key -> (tenant id, policy); the
+    tenant id is the name, or a digest of the key, so keys are never stored.
+    """
+    if not path:
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"Could not read RATE_LIMIT_TENANTS {path}: {e}")
+    tenants = {}
+    for key, spec in raw.items():
+        name = spec.get("name") or hashlib.sha256(key.encode()).hexdigest()[:12]
+        policy = Policy(
+            rate=float(spec.get("rate", default.rate)),
+            burst=float(spec.get("burst", default.burst)),
+            daily=spec.get("daily", default.daily) or None,
+        )
+        if policy.rate <= 0 or policy.burst < 1:
+            raise RuntimeError(f"RATE_LIMIT_TENANTS: {name} needs rate > 0 and burst >= 1")
+        tenants[key] = (f"key:{name}", policy)
+    return tenants
+
+
+def _refusal(policy: Policy, tokens: float, used: int, cost: int) -> Optional[str]:
+    """
+    Why `cost` images cannot be taken ("daily" or "rate"), or None. A charge larger than
+    the burst (a tiled image) is allowed from a full bucket and leaves it in debt.
+    """
+    if policy.daily is not None and used + cost > policy.daily:
+        return "daily"
+    if tokens < min(cost, policy.burst):
+        return "rate"
+    return None
+
+
+class _Bucket:
+    __slots__ = ("policy", "tokens", "updated", "day", "used")
+
+    def __init__(self, policy: Policy, now: float, day: int, used: int):
+        self.policy = policy
+        self.tokens = policy.burst
+        self.updated = now
+        self.day = day
+        # images charged today, deployment-wide as of the last flush plus this process's since
+        self.used = used
+
+    def refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.policy.burst, self.tokens + (now - self.updated) * self.policy.rate)
+            self.updated = now
+
+
+class _UsageStore:
+    """
+    Daily usage per tenant in SQLite, shared by all worker processes. Writes add
+    deltas, so concurrent flushes from several processes sum up. With several worker
+    processes the token buckets live here too (take()), so every worker sees the
+    tenant's real balance.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS usage (tenant TEXT NOT NULL, day INTEGER NOT NULL, "
+            "used INTEGER NOT NULL, PRIMARY KEY (tenant, day))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (tenant TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def take(self, tenant: str, policy: Policy, cost: int, now: float, day: int) -> Tuple[Optional[str], float, int]:
+        """
+        Refill the tenant's bucket to `now` (wall clock) and take `cost` images from it
+        and from today's usage, in one transaction. Returns (None, or "rate" / "daily"
+        when refused, tokens left, images used today).
+        """
+        with self._lock:
+            with self._conn:
+                # take the write lock up front: read-then-write must not interleave across processes
+                self._conn.execute("BEGIN IMMEDIATE")
+                row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE tenant = ?", (tenant,)).fetchone()
+                tokens = policy.burst if row is None else min(policy.burst, row[0] + max(0.0, now - row[1]) * policy.rate)
+                row = self._conn.execute("SELECT used FROM usage WHERE tenant = ? AND day = ?", (tenant, day)).fetchone()
+                used = row[0] if row is not None else 0
+                refused = _refusal(policy, tokens, used, cost)
+                if refused is None:
+                    tokens -= cost
+                    used += cost
+                    self._conn.execute(
+                        "INSERT INTO usage (tenant, day, used) VALUES (?, ?, ?) "
+                        "ON CONFLICT (tenant, day) DO UPDATE SET used = used + excluded.used",
+                        (tenant, day, cost),
+                    )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO buckets (tenant, tokens, updated) VALUES (?, ?, ?)", (tenant, tokens, now)
+                )
+        return refused, tokens, used
+
+    def prune_buckets(self, before: float) -> None:
+        """
+        Drop buckets untouched since `before`: they have refilled, and a missing bucket is a full one.
+        """
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM buckets WHERE updated < ?", (before,))
+
+    def add(self, deltas: Dict[Tuple[str, int], int], today: int) -> Dict[str, int]:
+        """
+        Add the deltas and return today's totals of every tenant.
+        """
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO usage (tenant, day, used) VALUES (?, ?, ?) "
+                    "ON CONFLICT (tenant, day) DO UPDATE SET used = used + excluded.used",
+                    [(tenant, day, used) for (tenant, day), used in deltas.items()],
+                )
+                # yesterday is kept for the stragglers of the previous day's last flush
+                self._conn.execute("DELETE FROM usage WHERE day < ?", (today - 1,))
+            rows = self._conn.execute("SELECT tenant, used FROM usage WHERE day = ?", (today,)).fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RateLimiter:
+    """
+    Token buckets per tenant (a configured API key, otherwise the client IP), checked
+    before an image goes to the detection backend.
+
+    In a single process the buckets live in memory and a check is O(1) on the event
+    loop. Daily usage is flushed to SQLite (db_path) every flush_interval seconds and
+    read back, so daily caps hold across restarts. With several worker processes
+    (serve.py) and a db_path, buckets and daily usage are kept in SQLite instead and
+    every charge is one transaction in a thread, so a tenant gets its configured rate
+    and quota exactly, however its requests are spread over the workers. Without a
+    db_path each worker enforces the full limits on its own. Idle, full buckets are
+    dropped on flush.
+    """
+
+    def __init__(
+        self,
+        default: Policy,
+        tenants: Dict[str, Tuple[str, Policy]],
+        db_path: Optional[str] = None,
+        flush_interval: float = 5.0,
+        processes: int = 1,
+    ):
+        self.default = default
+        self.tenants = dict(tenants)
+        self._policies = {tenant: policy for tenant, policy in self.tenants.values()}
+        self.flush_interval = flush_interval
+        self._store = _UsageStore(db_path) if db_path else None
+        self._shared = self._store is not None and processes > 1
+        self._buckets: Dict[str, _Bucket] = {}
+        # images charged since the last flush, per (tenant, day); only used in memory mode
+        self._pending: Dict[Tuple[str, int], int] = {}
+        # today's deployment-wide usage as of the last flush
+        self._totals: Dict[str, int] = {}
+        self._day = self._today()
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _today() -> int:
+        return int(time.time() // _DAY)
+
+    async def start(self) -> None:
+        await self.flush()
+        self._task = asyncio.ensure_future(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def tenant(self, api_key: Optional[str], client_ip: Optional[str]) -> str:
+        """
+        Tenant id of a request: the configured API key, else the client address.
+        Unknown keys are limited by address, so making up keys gives no extra quota.
+        """
+        if api_key and api_key in self.tenants:
+            return self.tenants[api_key][0]
+        return f"ip:{client_ip or 'unknown'}"
+
+    def _used(self, tenant: str, day: int) -> int:
+        total = self._totals.get(tenant, 0) if day == self._day else 0
+        return total + self._pending.get((tenant, day), 0)
+
+    def _bucket(self, tenant: str, now: float) -> _Bucket:
+        day = self._today()
+        bucket = self._buckets.get(tenant)
+        if bucket is None:
+            policy = self._policies.get(tenant, self.default)
+            bucket = self._buckets[tenant] = _Bucket(policy, now, day, self._used(tenant, day))
+        elif bucket.day != day:
+            bucket.day, bucket.used = day, self._used(tenant, day)
+        bucket.refill(now)
+        return bucket
+
+    async def charge(self, tenant: str, cost: int = 1) -> None:
+        """
+        Take `cost` images from the tenant's bucket and daily quota, or raise RateLimited.
+        """
+        if cost <= 0:
+            return
+        bucket = self._bucket(tenant, time.monotonic())
+        if self._shared:
+            # the local bucket only mirrors the shared one, for the response headers
+            refused, bucket.tokens, bucket.used = await asyncio.to_thread(
+                self._store.take, tenant, bucket.policy, cost, time.time(), bucket.day
+            )
+            bucket.updated = time.monotonic()
+        else:
+            refused = _refusal(bucket.policy, bucket.tokens, bucket.used, cost)
+            if refused is None:
+                bucket.tokens -= cost
+                bucket.used += cost
+                key = (tenant, bucket.day)
+                self._pending[key] = self._pending.get(key, 0) + cost
+        if refused is None:
+            return
+        RATE_LIMITED.inc(refused)
+        policy = bucket.policy
+        headers = self._headers(bucket)
+        if refused == "daily":
+            headers["Retry-After"] = headers["X-Quota-Reset"]
+            raise RateLimited(f"Daily quota of {policy.daily} images used up", headers)
+        needed = min(cost, policy.burst)
+        headers["Retry-After"] = str(max(1, math.ceil((needed - bucket.tokens) / policy.rate)))
+        raise RateLimited("Rate limit exceeded, slow down", headers)
+
+    def headers(self, tenant: str) -> Dict[str, str]:
+        """
+        Remaining-quota headers for a response to this tenant.
+        """
+        return self._headers(self._bucket(tenant, time.monotonic()))
+
+    def _headers(self, bucket: _Bucket) -> Dict[str, str]:
+        policy = bucket.policy
+        headers = {
+            "X-RateLimit-Limit": str(int(policy.burst)),
+            "X-RateLimit-Remaining": str(max(0, int(bucket.tokens))),
+            # seconds until the bucket is full again
+            "X-RateLimit-Reset": str(math.ceil((policy.burst - bucket.tokens) / policy.rate)),
+        }
+        if policy.daily is not None:
+            headers["X-Quota-Limit"] = str(policy.daily)
+            headers["X-Quota-Remaining"] = str(max(0, policy.daily - bucket.used))
+            headers["X-Quota-Reset"] = str(max(1, math.ceil((bucket.day + 1) * _DAY - time.time())))
+        return headers
+
+    def _policies_in_use(self) -> Iterable[Policy]:
+        yield self.default
+        yield from self._policies.values()
+
+    async def flush(self) -> None:
+        """
+        Write pending usage, read back today's totals and drop idle buckets.
+        """
+        pending, self._pending = self._pending, {}
+        today = self._today()
+        if self._store is None:
+            # this process is the only one charging
+            totals = dict(self._totals) if today == self._day else {}
+            for (tenant, day), used in pending.items():
+                if day == today:
+                    totals[tenant] = totals.get(tenant, 0) + used
+        else:
+            try:
+                totals = await asyncio.to_thread(self._store.add, pending, today)
+                if self._shared:
+                    # a bucket idle for longer than the slowest refill is full
+                    refill = max(p.burst / p.rate for p in self._policies_in_use())
+                    await asyncio.to_thread(self._store.prune_buckets, time.time() - refill)
+            except sqlite3.Error:
+                # keep the usage for the next attempt
+                for key, used in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + used
+                raise
+        self._totals, self._day = totals, today
+        now = time.monotonic()
+        for tenant, bucket in list(self._buckets.items()):
+            bucket.day, bucket.used = today, self._used(tenant, today)
+            bucket.refill(now)
+            if bucket.tokens >= bucket.policy.burst and (tenant, today) not in self._pending:
+                # a new bucket starts full and takes today's usage from the totals
+                del self._buckets[tenant]
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        return {"tenants": len(self._buckets), "pending": sum(self._pending.values())}
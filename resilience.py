@@ -0,0 +1,106 @@
+# resilience.py
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+def backoff_delay(attempt: int, base: float, cap: float, rng: Optional[random.Random] = None) -> float:
+    """
+    "Full jitter" exponential backoff: uniform in [0, min(cap, base * 2**attempt)].
+    Spreading retries randomly keeps clients from retrying in lockstep.
+    """
+    return (rng or random).uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class LatencyWindow:
+    """
+    The last `size` latencies of successful calls, for quantile estimates (hedge delay).
+    """
+
+    def __init__(self, size: int = 512, min_samples: int = 20):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+        self._sorted: Optional[list] = None
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._sorted = None
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        The q-quantile of the window, or None until min_samples have been seen.
+        """
+        if len(self._samples) < self.min_samples:
+            return None
+        if self._sorted is None:
+            # re-sorted at most once per new sample
+            self._sorted = sorted(self._samples)
+        return self._sorted[min(len(self._sorted) - 1, int(q * len(self._sorted)))]
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed: calls pass; `failure_threshold` failures in a row open the circuit.
+    open: calls are refused for `reset_timeout` seconds.
+    half_open: then a single probe call is let through; success closes the circuit,
+    failure opens it again for another reset_timeout.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+
+    def retry_after(self) -> float:
+        """
+        Seconds until the circuit lets a probe through (0 when not open).
+        """
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def record(self, success: bool) -> None:
+        if success:
+            self._failures = 0
+            self._probing = False
+            self.state = self.CLOSED
+            return
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self) -> None:
+        """
+        The probe was abandoned without an outcome (e.g. cancelled); allow another.
+        """
+        self._probing = False
+
+    def stats(self) -> Dict[str, object]:
+        return {"state": self.state, "consecutive_failures": self._failures, "opened": self.opened}
@@ -0,0 +1,29 @@
+# serve.py
+# Production launcher: python serve.py
+# Runs WORKERS uvicorn worker processes on one listening socket. Settings are loaded and
+# validated here once, before any worker starts, and reach the workers through the
+# environment. Each worker runs the app's startup (backend, warm-up, cache) before it
+# accepts connections, and all of them share the SQLite cache tier.
+import os
+
+import uvicorn
+
+from config import CACHE_DB_PATH, CACHE_ENABLED, HOST, PORT, SHARED_CACHE_DB_PATH, WORKERS
+
+
+def main() -> None:
+    # config already ran load_dotenv(); workers inherit the populated environment
+    os.environ["ROADSIGN_WORKER_PROCESSES"] = str(WORKERS)
+    if WORKERS > 1 and CACHE_ENABLED and not CACHE_DB_PATH:
+        # without a shared tier each worker would only see its own cache entries
+        os.environ["CACHE_DB_PATH"] = SHARED_CACHE_DB_PATH
+    uvicorn.run(
+        "main:app",
+        host=HOST,
+        port=PORT,
+        workers=WORKERS,
+    )
+
+
+if __name__ == "__main__":
+    main()
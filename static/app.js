@@ -0,0 +1,122 @@
+const uploadArea = document.getElementById('uploadArea');
+const fileInput = document.getElementById('fileInput');
+const detectBtn = document.getElementById('detectBtn');
+const preview = document.getElementById('preview');
+const previewImage = document.getElementById('previewImage');
+const loading = document.getElementById('loading');
+const results = document.getElementById('results');
+const errorDiv = document.getElementById('error');
+
+let selectedFile = null;
+
+// Click to upload
+uploadArea.addEventListener('click', () => fileInput.click());
+
+// File selection
+fileInput.addEventListener('change', (e) => {
+    handleFile(e.target.files[0]);
+});
+
+// Drag and drop
+uploadArea.addEventListener('dragover', (e) => {
+    e.preventDefault();
+    uploadArea.classList.add('dragover');
+});
+
+uploadArea.addEventListener('dragleave', () => {
+    uploadArea.classList.remove('dragover');
+});
+
+uploadArea.addEventListener('drop', (e) => {
+    e.preventDefault();
+    uploadArea.classList.remove('dragover');
+    handleFile(e.dataTransfer.files[0]);
+});
+
+function handleFile(file) {
+    if (!file || !file.type.startsWith('image/')) {
+        showError('Please select a valid image file');
+        return;
+    }
+
+    selectedFile = file;
+
+    // Show preview
+    const reader = new FileReader();
+    reader.onload = (e) => {
+        previewImage.src = e.target.result;
+        preview.style.display = 'block';
+        detectBtn.style.display = 'inline-block';
+        results.style.display = 'none';
+        errorDiv.style.display = 'none';
+    };
+    reader.readAsDataURL(file);
+}
+
+// Detect button
+detectBtn.addEventListener('click', async () => {
+    if (!selectedFile) return;
+
+    const formData = new FormData();
+    formData.append('file', selectedFile);
+
+    loading.style.display = 'block';
+    results.style.display = 'none';
+    errorDiv.style.display = 'none';
+    detectBtn.disabled = true;
+
+    try {
+        const response = await fetch('/detect', {
+            method: 'POST',
+            body: formData
+        });
+
+        const data = await response.json();
+
+        if (response.ok) {
+            displayResults(data);
+        } else {
+            showError(data.detail || 'Detection failed');
+        }
+    } catch (error) {
+        showError('Network error: ' + error.message);
+    } finally {
+        loading.style.display = 'none';
+        detectBtn.disabled = false;
+    }
+});
+
+function displayResults(data) {
+    results.innerHTML = '';
+
+    if (data.detections && data.detections.length > 0) {
+        let html = '<div class="result-card">';
+        html += '<div class="result-title">🎯 Detected ' + data.detections.length + ' road sign(s)</div>';
+
+        data.detections.forEach((det, index) => {
+            const confidence = ((det.confidence || 0) * 100).toFixed(1);
+            const description = det.description || '';
+            html += `
+                <div class="detection-item">
+                    <div>
+                        <span class="detection-class">${det.label}</span>
+                        <span class="detection-confidence">${confidence}% confidence</span>
+                    </div>
+                    <div class="detection-description">${description}</div>
+                </div>
+            `;
+        });
+
+        html += '</div>';
+        results.innerHTML = html;
+    } else {
+        results.innerHTML = '<div class="result-card"><div class="result-title">No road signs detected in this image</div></div>';
+    }
+
+    results.style.display = 'block';
+}
+
+function showError(message) {
+    errorDiv.textContent = '❌ Error: ' + message;
+    errorDiv.style.display = 'block';
+}
@@ -0,0 +1,171 @@
+# static_assets.py
+import gzip
+import hashlib
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are generated
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+# files referenced from index.html as {{name}} and served under content-hash names
+HASHED_ASSETS = ("app.css", "app.js")
+
+_CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+}
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# bodies smaller than this are not worth compressing
+_MIN_COMPRESS_SIZE = 256
+
+
+@dataclass
+class Asset:
+    content_type: str
+    cache_control: str
+    digest: str
+    # content-coding -> body; always has "identity"
+    bodies: Dict[str, bytes] = field(default_factory=dict)
+
+    def etag(self, coding: str) -> str:
+        # strong validator per representation: each encoding gets its own tag
+        return f'"{self.digest}"' if coding == "identity" else f'"{self.digest}-{coding}"'
+
+
+def _build_asset(name: str, body: bytes, cache_control: str) -> Asset:
+    ext = os.path.splitext(name)[1]
+    asset = Asset(
+        content_type=_CONTENT_TYPES.get(ext, "application/octet-stream"),
+        cache_control=cache_control,
+        digest=hashlib.sha256(body).hexdigest()[:16],
+        bodies={"identity": body},
+    )
+    if len(body) >= _MIN_COMPRESS_SIZE:
+        asset.bodies["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            asset.bodies["br"] = brotli.compress(body, quality=11)
+    return asset
+
+
+def _accepted_codings(accept_encoding: str) -> List[str]:
+    """
+    Codings the client accepts (q > 0), e.g. "gzip, br;q=0.9" -> ["gzip", "br"].
+    """
+    codings = []
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            codings.append(name)
+    return codings
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    tags = [t.strip() for t in if_none_match.split(",")]
+    # weak comparison, as If-None-Match requires
+    return etag in tags or f"W/{etag}" in tags
+
+
+class StaticAssets:
+    """
+    The bundled UI, loaded and prepared once at startup: CSS/JS get content-hash
+    filenames (served as immutable), index.html gets those names substituted in, and
+    every file is precompressed with gzip (and brotli when installed).
+
+    Mount it as an ASGI app for /static; serve the page with response("index.html", headers).
+    """
+
+    def __init__(self, directory: str = STATIC_DIR):
+        self.directory = directory
+        self._assets: Dict[str, Asset] = {}
+
+    def build(self) -> None:
+        assets: Dict[str, Asset] = {}
+        replacements: Dict[str, str] = {}
+        for name in HASHED_ASSETS:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                body = f.read()
+            asset = _build_asset(name, body, IMMUTABLE)
+            stem, ext = os.path.splitext(name)
+            hashed = f"{stem}.{asset.digest[:10]}{ext}"
+            assets[hashed] = asset
+            # the plain name stays reachable, but has to be revalidated
+            assets[name] = _build_asset(name, body, REVALIDATE)
+            replacements["{{%s}}" % name] = f"/static/{hashed}"
+
+        with open(os.path.join(self.directory, "index.html"), "r", encoding="utf-8") as f:
+            html = f.read()
+        for placeholder, url in replacements.items():
+            html = html.replace(placeholder, url)
+        assets["index.html"] = _build_asset("index.html", html.encode("utf-8"), REVALIDATE)
+        self._assets = assets
+
+    def _negotiate(self, asset: Asset, accept_encoding: str) -> Tuple[str, bytes]:
+        accepted = _accepted_codings(accept_encoding)
+        for coding in ("br", "gzip"):
+            if coding in asset.bodies and (coding in accepted or "*" in accepted):
+                return coding, asset.bodies[coding]
+        return "identity", asset.bodies["identity"]
+
+    def response(self, name: str, headers: Headers, head: bool = False) -> Response:
+        if not self._assets:
+            self.build()
+        asset = self._assets.get(name)
+        if asset is None:
+            return Response("Not Found", status_code=404, media_type="text/plain")
+
+        coding, body = self._negotiate(asset, headers.get("accept-encoding", ""))
+        etag = asset.etag(coding)
+        response_headers = {
+            "ETag": etag,
+            "Cache-Control": asset.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if coding != "identity":
+            response_headers["Content-Encoding"] = coding
+
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=response_headers)
+
+        if head:
+            response_headers["Content-Length"] = str(len(body))
+            return Response(status_code=200, headers=response_headers, media_type=asset.content_type)
+        return Response(body, headers=response_headers, media_type=asset.content_type)
+
+    async def __call__(self, scope, receive, send) -> None:
+        assert scope["type"] == "http"
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        method = scope["method"]
+        if method not in ("GET", "HEAD"):
+            response = Response("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+        else:
+            response = self.response(path.lstrip("/"), Headers(scope=scope), head=method == "HEAD")
+        await response(scope, receive, send)
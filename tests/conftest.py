@@ -0,0 +1,91 @@
+# tests/conftest.py
+import io
+import os
+import sys
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
+
+# settings are read at import; these keep the app self-contained (no upstream, no files)
+os.environ.setdefault("ROBOFLOW_API_URL", "http://127.0.0.1:9/model/1")
+os.environ.setdefault("ROBOFLOW_API_KEY", "test")
+os.environ.setdefault("WARMUP_ENABLED", "false")
+os.environ.setdefault("JOBS_ENABLED", "false")
+os.environ.setdefault("RATE_LIMIT_DB_PATH", "")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import main  # noqa: E402
+from backends import DetectionBackend  # noqa: E402
+from utils import ImageData  # noqa: E402
+
+
+class FakeBackend(DetectionBackend):
+    """
+    Answers every image with one stop sign. Errors queued in `failures` are raised by
+    the next calls instead, one per call.
+    """
+
+    name = "fake"
+
+    def __init__(self):
+        self.calls = 0
+        self.failures: List[Exception] = []
+
+    def labels(self) -> List[str]:
+        return ["stop"]
+
+    def signature(self) -> str:
+        return "fake"
+
+    async def detect(self, image: ImageData, filename: str, content_type: str) -> Dict[str, Any]:
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        return {
+            "image": {"width": 64, "height": 48},
+            "predictions": [{"class": "stop", "confidence": 0.9, "x": 20, "y": 20, "width": 10, "height": 10}],
+        }
+
+
+def jpeg(seed: int, size=(64, 48)) -> bytes:
+    """
+    A small JPEG whose content (and perceptual hash) depends on `seed`.
+    """
+    pixels = np.random.default_rng(seed).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    img = Image.fromarray(pixels)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def backend(monkeypatch) -> FakeBackend:
+    fake = FakeBackend()
+    monkeypatch.setattr(main, "backend", fake)
+    return fake
+
+
+@pytest.fixture
+def app_client(backend):
+    """
+    Starts the app (lifespan included) and returns a client for it. Tests change
+    main's settings with monkeypatch before entering.
+    """
+
+    @asynccontextmanager
+    async def start():
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                yield client
+
+    return start
@@ -0,0 +1,88 @@
+# tests/test_jobs.py
+import asyncio
+
+import pytest
+
+import main
+from conftest import jpeg
+from upstream import UpstreamError
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def jobs(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "JOBS_ENABLED", True)
+    monkeypatch.setattr(main, "JOBS_DIR", str(tmp_path / "jobs"))
+    monkeypatch.setattr(main, "JOBS_POLL_INTERVAL", 0.05)
+
+
+async def wait_for_job(client, job_id, timeout=10.0):
+    async def finished():
+        while True:
+            job = (await client.get(f"/jobs/{job_id}")).json()
+            if job["status"] not in ("queued", "running"):
+                return job
+            await asyncio.sleep(0.05)
+
+    return await asyncio.wait_for(finished(), timeout)
+
+
+async def test_job_waits_for_its_tenants_rate_limit(app_client, backend, jobs, monkeypatch):
+    monkeypatch.setattr(main, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(main, "RATE_LIMIT_RATE", 2.0)
+    monkeypatch.setattr(main, "RATE_LIMIT_BURST", 1.0)
+    monkeypatch.setattr(main, "RATE_LIMIT_DAILY", 3)
+    files = [("files", (f"{n}.jpg", jpeg(n), "image/jpeg")) for n in range(3)]
+    async with app_client() as client:
+        pauses = []
+        pause = main.job_store.pause
+        monkeypatch.setattr(main.job_store, "pause", lambda *args: pauses.append(args) or pause(*args))
+        job_id = (await client.post("/jobs", files=files)).json()["id"]
+        job = await wait_for_job(client, job_id)
+        tenant = main.rate_limiter.tenant(None, "127.0.0.1")
+        quota = main.rate_limiter.headers(tenant)["X-Quota-Remaining"]
+
+    # refused images were retried after Retry-After, all charged to the submitter
+    assert pauses
+    assert quota == "0"
+
+    assert job["status"] == "done"
+    assert (job["processed"], job["failed"]) == (3, 0)
+    assert [r["status"] for r in job["results"]] == ["done"] * 3
+    assert backend.calls == 3
+
+
+@pytest.fixture
+def quick_retries(monkeypatch):
+    monkeypatch.setattr(main, "JOBS_RETRY_BACKOFF", 0.01)
+    monkeypatch.setattr(main, "JOBS_RETRY_BACKOFF_MAX", 0.05)
+
+
+async def test_job_recovers_from_transient_backend_failures(app_client, backend, jobs, quick_retries):
+    backend.failures = [UpstreamError(503, "Roboflow request failed", retryable=True) for _ in range(3)]
+    files = [("files", (f"{n}.jpg", jpeg(n), "image/jpeg")) for n in range(4)]
+    async with app_client() as client:
+        job_id = (await client.post("/jobs", files=files)).json()["id"]
+        job = await wait_for_job(client, job_id)
+
+    assert job["status"] == "done"
+    assert (job["processed"], job["failed"]) == (4, 0)
+    assert [r["status"] for r in job["results"]] == ["done"] * 4
+    assert backend.calls == 7
+
+
+async def test_job_fails_client_errors_and_exhausted_retries(app_client, backend, jobs, quick_retries, monkeypatch):
+    monkeypatch.setattr(main, "JOBS_CONCURRENCY", 1)
+    monkeypatch.setattr(main, "JOBS_MAX_ATTEMPTS", 2)
+    backend.failures = [UpstreamError(400, "Invalid image"), UpstreamError(500, "boom"), UpstreamError(500, "boom")]
+    files = [("files", (f"{n}.jpg", jpeg(n), "image/jpeg")) for n in range(3)]
+    async with app_client() as client:
+        job_id = (await client.post("/jobs", files=files)).json()["id"]
+        job = await wait_for_job(client, job_id)
+
+    assert job["status"] == "done"
+    assert [(r["status"], r.get("error", {}).get("status_code")) for r in job["results"]] == [
+        ("failed", 400), ("failed", 500), ("done", None),
+    ]
+    assert backend.calls == 4
@@ -0,0 +1,48 @@
+# tests/test_neardup.py
+import json
+
+import pytest
+
+import main
+from conftest import jpeg
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def near_dups(monkeypatch):
+    # without the result cache, only the near-duplicate index can answer a repeated image
+    monkeypatch.setattr(main, "CACHE_ENABLED", False)
+    monkeypatch.setattr(main, "NEAR_DUP_ENABLED", True)
+
+
+def upload(client, image, **headers):
+    return client.post("/detect?camera=cam1", files={"file": ("a.jpg", image, "image/jpeg")}, headers=headers)
+
+
+async def test_tenants_with_the_same_camera_id_do_not_share_results(app_client, backend, near_dups, monkeypatch, tmp_path):
+    path = tmp_path / "tenants.json"
+    path.write_text(json.dumps({"key-a": {"name": "a"}, "key-b": {"name": "b"}}))
+    monkeypatch.setattr(main, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(main, "RATE_LIMIT_TENANTS", str(path))
+    image = jpeg(1)
+    async with app_client() as client:
+        first = await upload(client, image, **{"X-API-Key": "key-a"})
+        again = await upload(client, image, **{"X-API-Key": "key-a"})
+        other = await upload(client, image, **{"X-API-Key": "key-b"})
+
+    assert [r.headers["x-cache"] for r in (first, again, other)] == ["MISS", "HIT", "MISS"]
+    assert backend.calls == 2
+
+
+async def test_clients_with_the_same_camera_id_do_not_share_results(app_client, backend, near_dups, monkeypatch):
+    # rate limiting off: clients are told apart by address
+    monkeypatch.setattr(main, "RATE_LIMIT_PROXY_HOPS", 1)
+    image = jpeg(1)
+    async with app_client() as client:
+        first = await upload(client, image, **{"X-Forwarded-For": "203.0.113.1"})
+        again = await upload(client, image, **{"X-Forwarded-For": "203.0.113.1"})
+        other = await upload(client, image, **{"X-Forwarded-For": "203.0.113.2"})
+
+    assert [r.headers["x-cache"] for r in (first, again, other)] == ["MISS", "HIT", "MISS"]
+    assert backend.calls == 2
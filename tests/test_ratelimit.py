@@ -0,0 +1,59 @@
+# tests/test_ratelimit.py
+import asyncio
+import json
+
+import pytest
+
+import main
+from conftest import jpeg
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def tenants(monkeypatch, tmp_path):
+    """
+    Rate limiting with two API keys, "key-a" and "key-b", of one image each.
+    """
+    path = tmp_path / "tenants.json"
+    path.write_text(json.dumps({"key-a": {"name": "a"}, "key-b": {"name": "b"}}))
+    monkeypatch.setattr(main, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(main, "RATE_LIMIT_TENANTS", str(path))
+    monkeypatch.setattr(main, "RATE_LIMIT_RATE", 0.001)
+    monkeypatch.setattr(main, "RATE_LIMIT_BURST", 1.0)
+    monkeypatch.setattr(main, "RATE_LIMIT_EXEMPT_CACHE_HITS", True)
+
+
+async def test_refused_tenant_does_not_fail_others_on_the_same_image(app_client, backend, tenants, monkeypatch):
+    async with app_client() as client:
+        tenant_a = main.rate_limiter.tenant("key-a", None)
+        await main.rate_limiter.charge(tenant_a)  # a has no quota left
+        charge = main.rate_limiter.charge
+        charging, release = asyncio.Event(), asyncio.Event()
+
+        async def held_charge(tenant, cost=1):
+            # hold a's charge until b has joined a's computation
+            if tenant == tenant_a:
+                charging.set()
+                await release.wait()
+            await charge(tenant, cost)
+
+        monkeypatch.setattr(main.rate_limiter, "charge", held_charge)
+        image = jpeg(1)
+
+        def upload(key):
+            return client.post("/detect", files={"file": ("a.jpg", image, "image/jpeg")}, headers={"X-API-Key": key})
+
+        first = asyncio.ensure_future(upload("key-a"))
+        await asyncio.wait_for(charging.wait(), 5)
+        second = asyncio.ensure_future(upload("key-b"))
+        while not main.detection_cache.coalesced:
+            await asyncio.sleep(0.01)
+        release.set()
+        a, b = await asyncio.wait_for(asyncio.gather(first, second), 5)
+
+    assert a.status_code == 429
+    assert b.status_code == 200
+    assert b.headers["x-cache"] == "MISS"
+    assert len(b.json()["detections"]) == 1
+    assert backend.calls == 1
@@ -0,0 +1,117 @@
+# tiling.py
+import io
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from postprocess import suppress_detections
+
+# the texture check runs on a greyscale copy reduced by this factor
+_TEXTURE_REDUCE = 4
+
+
+class Tile(NamedTuple):
+    x: int
+    y: int
+    width: int
+    height: int
+    # JPEG of the crop, at full resolution
+    data: bytes
+
+
+class SlicedImage(NamedTuple):
+    width: int
+    height: int
+    tiles: List[Tile]
+    # tiles left out because they are flat (sky, road surface, motion blur)
+    skipped: int
+
+
+def _starts(length: int, tile_size: int, overlap: float) -> List[int]:
+    if length <= tile_size:
+        return [0]
+    stride = max(1, int(tile_size * (1 - overlap)))
+    starts = list(range(0, length - tile_size, stride))
+    # the last tile is flush with the edge instead of running past it
+    starts.append(length - tile_size)
+    return starts
+
+
+def plan_tiles(width: int, height: int, tile_size: int, overlap: float) -> List[Tuple[int, int, int, int]]:
+    """
+    Overlapping (x, y, width, height) tiles covering the image, row by row.
+    Neighbouring tiles share at least `overlap` of the tile size.
+    """
+    return [
+        (x, y, min(tile_size, width), min(tile_size, height))
+        for y in _starts(height, tile_size, overlap)
+        for x in _starts(width, tile_size, overlap)
+    ]
+
+
+def edge_strength(gray: np.ndarray) -> float:
+    """
+    Mean absolute brightness gradient (0-255) of a greyscale region.
+    """
+    if gray.shape[0] < 2 or gray.shape[1] < 2:
+        return 0.0
+    return float(np.abs(np.diff(gray, axis=1)).mean() + np.abs(np.diff(gray, axis=0)).mean())
+
+
+def slice_image(data: bytes, tile_size: int, overlap: float, min_edge: float, quality: int = 90) -> SlicedImage:
+    """
+    Decode (EXIF-oriented) and cut into overlapping JPEG tiles, leaving out tiles
+    whose edge_strength is below min_edge. An image that fits in one tile is not
+    decoded and comes back without tiles. Blocking. Raises ValueError for files
+    that are not images.
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+        if max(img.size) <= tile_size:
+            # the size is read from the header; rotation does not change the longest side
+            return SlicedImage(img.width, img.height, [], 0)
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+    except Exception:
+        raise ValueError("Could not decode image")
+
+    gray = np.asarray(img.convert("L").reduce(_TEXTURE_REDUCE), dtype=np.int16)
+    tiles: List[Tile] = []
+    skipped = 0
+    for x, y, w, h in plan_tiles(img.width, img.height, tile_size, overlap):
+        r = _TEXTURE_REDUCE
+        if min_edge > 0 and edge_strength(gray[y // r:(y + h) // r, x // r:(x + w) // r]) < min_edge:
+            skipped += 1
+            continue
+        out = io.BytesIO()
+        img.crop((x, y, x + w, y + h)).save(out, format="JPEG", quality=quality)
+        tiles.append(Tile(x, y, w, h, out.getvalue()))
+    return SlicedImage(img.width, img.height, tiles, skipped)
+
+
+def offset_detections(detections: List[Dict[str, Any]], dx: float, dy: float) -> List[Dict[str, Any]]:
+    """
+    Move tile-local detections into image coordinates. Modifies and returns the same list.
+    """
+    for d in detections:
+        for key, delta in (("x", dx), ("y", dy)):
+            v = d.get(key)
+            if v is None:
+                continue
+            try:
+                d[key] = float(v) + delta
+            except (TypeError, ValueError):
+                pass
+    return detections
+
+
+def merge_detections(detections: List[Dict[str, Any]], threshold: float) -> List[Dict[str, Any]]:
+    """
+    Merge the detections of all tiles (and the full-image pass): class-aware NMS on
+    intersection over the smaller box, so a sign cut off at a seam is folded into
+    the complete box from the neighbouring tile. Most confident first.
+    """
+    kept = suppress_detections(detections, threshold, metric="ios")
+    return sorted(kept, key=lambda d: d.get("confidence") or 0.0, reverse=True)
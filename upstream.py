@@ -0,0 +1,387 @@
+# upstream.py
+import asyncio
+import io
+import json
+import math
+import time
+from typing import Any, BinaryIO, Dict, Optional
+
+import aiohttp
+from yarl import URL
+
+from admission import AdaptiveLimiter, Overloaded
+from resilience import CircuitBreaker, LatencyWindow, backoff_delay
+from utils import ImageData
+from metrics import (
+    REGISTRY,
+    Gauge,
+    UPSTREAM_HEDGES,
+    UPSTREAM_IN_FLIGHT,
+    UPSTREAM_REJECTED,
+    UPSTREAM_REQUESTS,
+    UPSTREAM_RETRIES_TOTAL,
+    record_stage,
+    stage,
+)
+from config import (
+    ROBOFLOW_API_URL,
+    ROBOFLOW_API_KEY,
+    REQUEST_TIMEOUT,
+    HTTP_POOL_SIZE,
+    HTTP_POOL_SIZE_PER_HOST,
+    HTTP_KEEPALIVE_TIMEOUT,
+    ADMISSION_ENABLED,
+    ADMISSION_INITIAL_LIMIT,
+    ADMISSION_MIN_LIMIT,
+    ADMISSION_MAX_LIMIT,
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_QUEUE_TIMEOUT,
+    ADMISSION_LATENCY_TOLERANCE,
+    UPSTREAM_RETRIES,
+    UPSTREAM_RETRY_BACKOFF,
+    UPSTREAM_RETRY_BACKOFF_MAX,
+    UPSTREAM_HEDGE_ENABLED,
+    UPSTREAM_HEDGE_QUANTILE,
+    UPSTREAM_HEDGE_MIN_DELAY,
+    CIRCUIT_BREAKER_ENABLED,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    WORKER_PROCESSES,
+)
+
+
+class UpstreamError(Exception):
+    """
+    Raised when the Roboflow call (or another detection backend) fails. Carries the
+    HTTP status code that should be returned to our own client together with a readable detail.
+    """
+
+    def __init__(
+        self,
+        status_code: int,
+        detail: str,
+        headers: Optional[Dict[str, str]] = None,
+        retryable: bool = False,
+        retry_after: Optional[float] = None,
+    ):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        # extra response headers, e.g. Retry-After when the call was shed
+        self.headers = headers
+        # transient failure (connection error, 5xx, 429) and Roboflow's own Retry-After
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def _worker_share(total: int) -> int:
+    """
+    This process's part of a deployment-wide limit (serve.py runs WORKER_PROCESSES of them).
+    """
+    return max(1, math.ceil(total / WORKER_PROCESSES))
+
+
+# shared by every request in this process; None when admission control is off
+limiter: Optional[AdaptiveLimiter] = AdaptiveLimiter(
+    initial_limit=_worker_share(ADMISSION_INITIAL_LIMIT),
+    min_limit=_worker_share(ADMISSION_MIN_LIMIT),
+    max_limit=_worker_share(ADMISSION_MAX_LIMIT),
+    queue_size=_worker_share(ADMISSION_QUEUE_SIZE),
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    tolerance=ADMISSION_LATENCY_TOLERANCE,
+) if ADMISSION_ENABLED else None
+
+breaker: Optional[CircuitBreaker] = CircuitBreaker(
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=CIRCUIT_RESET_TIMEOUT,
+) if CIRCUIT_BREAKER_ENABLED else None
+
+# successful call latencies, for the hedge delay
+latencies = LatencyWindow()
+
+if breaker is not None:
+    REGISTRY.register(Gauge(
+        "roadsign_circuit_open", "1 while the Roboflow circuit breaker is open or half-open.",
+        callback=lambda: {(): 0 if breaker.state == CircuitBreaker.CLOSED else 1},
+    ))
+
+if limiter is not None:
+    REGISTRY.register(Gauge(
+        "roadsign_admission_state", "Admission controller: current limit, calls in flight and calls queued.", ("value",),
+        callback=lambda: {(k,): limiter.stats()[k] for k in ("limit", "in_flight", "queued")},
+    ))
+
+
+async def start_client() -> None:
+    """
+    Create the shared upstream session. Called once on app startup so every
+    request reuses the same keep-alive connection pool.
+    """
+    global _session
+    if _session is not None and not _session.closed:
+        return
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_SIZE,
+        limit_per_host=HTTP_POOL_SIZE_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+    )
+    _session = aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+    )
+
+
+async def close_client() -> None:
+    """
+    Close the shared upstream session (app shutdown).
+    """
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+def get_client() -> aiohttp.ClientSession:
+    if _session is None or _session.closed:
+        raise RuntimeError("Upstream client is not started; call start_client() on app startup")
+    return _session
+
+
+async def warm_up_client(connections: int, timeout: float) -> int:
+    """
+    Open `connections` keep-alive connections to the Roboflow host (DNS, TCP and TLS)
+    with concurrent HEAD requests to its origin, so the first detections do not pay
+    for the handshakes. Returns how many connections were opened; failures are ignored.
+    """
+    session = get_client()
+    origin = str(URL(ROBOFLOW_API_URL).origin())
+
+    async def connect() -> bool:
+        try:
+            # concurrent requests cannot share a connection, so each one opens its own
+            async with session.head(origin, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                await resp.read()
+            return True
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return False
+
+    return sum(await asyncio.gather(*(connect() for _ in range(connections))))
+
+
+class _BorrowedFile(io.RawIOBase):
+    """
+    Read-only view of an upload for one request body. aiohttp closes file payloads
+    once they are sent; closing this view leaves the upload open for retries.
+    """
+
+    def __init__(self, f: BinaryIO):
+        self._f = f
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        return self._f.read(size)
+
+    def readinto(self, buffer) -> int:
+        data = self._f.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._f.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._f.tell()
+
+    def fileno(self) -> int:
+        return self._f.fileno()
+
+
+def _retryable_status(status: int) -> bool:
+    # 5xx and 429 mean Roboflow is struggling; other statuses are about the request
+    return status >= 500 or status == 429
+
+
+def _retry_after(resp: aiohttp.ClientResponse) -> Optional[float]:
+    value = resp.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+async def _attempt(image: ImageData, filename: str, content_type: str, timeout: float) -> Dict[str, Any]:
+    """
+    One Roboflow call: circuit breaker check, admission, POST, JSON parse.
+    Raises UpstreamError; retryable is set for failures worth another attempt.
+    """
+    session = get_client()
+
+    if breaker is not None and not breaker.allow():
+        wait = max(1, math.ceil(breaker.retry_after()))
+        raise UpstreamError(503, "Roboflow is failing, circuit breaker open", headers={"Retry-After": str(wait)})
+
+    if not isinstance(image, (bytes, bytearray, memoryview)):
+        image.seek(0)
+        if isinstance(image, io.IOBase):
+            image = _BorrowedFile(image)
+        else:
+            # SpooledTemporaryFile is not an IOBase before Python 3.11; aiohttp can't stream it
+            image = image.read()
+
+    # multipart body: file name, bytes or file object, mime
+    form = aiohttp.FormData()
+    form.add_field("file", image, filename=filename, content_type=content_type)
+
+    if limiter is not None:
+        try:
+            with stage("queue"):
+                await limiter.acquire()
+        except Overloaded as e:
+            if breaker is not None:
+                breaker.release_probe()
+            UPSTREAM_REJECTED.inc(e.reason)
+            raise UpstreamError(503, str(e), headers={"Retry-After": str(e.retry_after)})
+        except BaseException:
+            if breaker is not None:
+                breaker.release_probe()
+            raise
+
+    UPSTREAM_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    healthy = False
+    finished = False
+    try:
+        async with session.post(
+            ROBOFLOW_API_URL, params={"api_key": ROBOFLOW_API_KEY}, data=form,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as resp:
+            body = await resp.read()
+        finished = True
+        healthy = not _retryable_status(resp.status)
+        record_stage("upstream", time.perf_counter() - start)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        finished = True
+        UPSTREAM_REQUESTS.inc("error")
+        raise UpstreamError(503, f"Roboflow request failed: {str(e) or type(e).__name__}", retryable=True)
+    finally:
+        elapsed = time.perf_counter() - start
+        UPSTREAM_IN_FLIGHT.dec()
+        # a cancelled call (lost hedge, client gone) says nothing about Roboflow's health
+        if limiter is not None:
+            if finished:
+                limiter.release(elapsed, healthy)
+            else:
+                limiter.cancel()
+        if breaker is not None:
+            if finished:
+                breaker.record(healthy)
+            else:
+                breaker.release_probe()
+
+    UPSTREAM_REQUESTS.inc(str(resp.status))
+    if resp.status != 200:
+        # forward Roboflow error for easier debugging
+        text = body.decode(resp.get_encoding() if resp.charset else "utf-8", errors="replace")
+        raise UpstreamError(
+            resp.status, f"Roboflow returned {resp.status}: {text}",
+            retryable=_retryable_status(resp.status), retry_after=_retry_after(resp),
+        )
+    latencies.add(elapsed)
+    try:
+        with stage("parse"):
+            return json.loads(body)
+    except ValueError:
+        raise UpstreamError(502, "Roboflow returned non-JSON response")
+
+
+def hedge_delay() -> Optional[float]:
+    """
+    How long to wait for the first call before sending a hedge: the recent
+    UPSTREAM_HEDGE_QUANTILE latency, or None while there are too few samples.
+    """
+    q = latencies.quantile(UPSTREAM_HEDGE_QUANTILE)
+    return None if q is None else max(q, UPSTREAM_HEDGE_MIN_DELAY)
+
+
+async def _hedged(image: ImageData, filename: str, content_type: str, timeout: float) -> Dict[str, Any]:
+    """
+    Start one call; if it has not answered after hedge_delay(), start a second one and
+    use whichever succeeds first. The other is cancelled. Fails only when both fail,
+    with the first call's error.
+    """
+    delay = hedge_delay()
+    if delay is None or delay >= timeout:
+        return await _attempt(image, filename, content_type, timeout)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    primary = asyncio.ensure_future(_attempt(image, filename, content_type, timeout))
+    pending = {primary}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return primary.result()
+
+        hedge = asyncio.ensure_future(
+            _attempt(image, filename, content_type, max(0.0, timeout - (loop.time() - started)))
+        )
+        UPSTREAM_HEDGES.inc("sent")
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            succeeded = [task for task in done if task.exception() is None]
+            if succeeded:
+                winner = primary if primary in succeeded else hedge
+                if winner is hedge:
+                    UPSTREAM_HEDGES.inc("won")
+                return winner.result()
+        # both failed
+        return primary.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def roboflow_detect(image: ImageData, filename: str, content_type: str) -> Dict[str, Any]:
+    """
+    Send one image to the Roboflow detect endpoint and return the parsed JSON.
+    File objects are streamed into the request body in chunks instead of being read whole
+    (unless hedging is on: two concurrent calls need their own copy of the body).
+
+    Each call goes through the circuit breaker and the admission limiter; when it cannot
+    be admitted it fails fast with a 503 carrying Retry-After. Connection errors, timeouts,
+    5xx and 429 are retried up to UPSTREAM_RETRIES times with jittered exponential backoff,
+    all within one REQUEST_TIMEOUT budget.
+    Raises UpstreamError on connection problems, non-200 replies or non-JSON bodies.
+    """
+    if UPSTREAM_HEDGE_ENABLED and not isinstance(image, (bytes, bytearray, memoryview)):
+        image.seek(0)
+        image = await asyncio.to_thread(image.read)
+    call = _hedged if UPSTREAM_HEDGE_ENABLED else _attempt
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + REQUEST_TIMEOUT
+    attempt = 0
+    while True:
+        try:
+            return await call(image, filename, content_type, deadline - loop.time())
+        except UpstreamError as e:
+            if not e.retryable or attempt >= UPSTREAM_RETRIES:
+                raise
+            delay = backoff_delay(attempt, UPSTREAM_RETRY_BACKOFF, UPSTREAM_RETRY_BACKOFF_MAX)
+            if e.retry_after is not None:
+                delay = max(delay, e.retry_after)
+            # no point retrying when the attempt would have no time left
+            if loop.time() + delay >= deadline - UPSTREAM_HEDGE_MIN_DELAY:
+                raise
+            attempt += 1
+            UPSTREAM_RETRIES_TOTAL.inc()
+            await asyncio.sleep(delay)
@@ -1,15 +1,53 @@
 # utils.py
-from typing import Any, Dict, List, Optional
+import os
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Union
 
-def normalize_roboflow_response(rf_json: Dict[str, Any]) -> List[Dict[str, Any]]:
+# an uploaded image: in-memory bytes, or a file object such as the spooled
+# temporary file behind an UploadFile (read in chunks, never copied whole)
+ImageData = Union[bytes, BinaryIO]
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def iter_image_chunks(image: ImageData, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Yield the image contents chunk by chunk. File objects are read from the start
+    and rewound afterwards, so they can be read again. Blocking for file objects.
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        yield image
+        return
+    image.seek(0)
+    try:
+        while True:
+            chunk = image.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        image.seek(0)
+
+
+def get_predictions(rf_json: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    The list of raw prediction dicts in a Roboflow response.
+    """
+    # common keys Roboflow uses: 'predictions', 'preds', 'objects'
+    return rf_json.get("predictions") or rf_json.get("preds") or rf_json.get("objects") or []
+
+
+def normalize_roboflow_response(rf_json: Dict[str, Any], include_raw: bool = True) -> List[Dict[str, Any]]:
     """
     Normalize various Roboflow community model output formats into a list of detections:
     Each detection: { label, confidence, x, y, width, height, raw }
     Coordinates are returned as center x,y and width,height if available.
+    With include_raw=False the per-detection `raw` copy of the prediction is not added.
     """
+    # a per-response schema / columnar fast path was measured and dropped: on the layout
+    # both backends return (class, confidence, x, y, width, height) the `or` chains stop
+    # at their first key and building the dicts dominates, so it was slower (see README)
     detections = []
-    # common keys Roboflow uses: 'predictions', 'preds', 'objects'
-    preds = rf_json.get("predictions") or rf_json.get("preds") or rf_json.get("objects") or []
+    preds = get_predictions(rf_json)
 
     for p in preds:
         # label
@@ -55,14 +93,58 @@ def normalize_roboflow_response(rf_json: Dict[str, Any]) -> List[Dict[str, Any]]
                 except Exception:
                     pass
 
-        detections.append({
+        detection = {
             "label": label,
             "confidence": conf,
             "x": x,
             "y": y,
             "width": w,
             "height": h,
-            "raw": p
-        })
+        }
+        if include_raw:
+            detection["raw"] = p
+        detections.append(detection)
+
+    return detections
+
+
+def rescale_detections(detections: List[Dict[str, Any]], scale_x: float, scale_y: float) -> List[Dict[str, Any]]:
+    """
+    Map detections from the (downscaled) image sent upstream back to original-image
+    coordinates. Modifies and returns the same list; missing coordinates stay None.
+    """
+    if scale_x == 1.0 and scale_y == 1.0:
+        return detections
+
+    for d in detections:
+        for key, scale in (("x", scale_x), ("width", scale_x), ("y", scale_y), ("height", scale_y)):
+            v = d.get(key)
+            if v is None:
+                continue
+            try:
+                d[key] = float(v) * scale
+            except (TypeError, ValueError):
+                pass
 
     return detections
+
+
+def attach_raw(detections: List[Dict[str, Any]], rf_json: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Copies of detections (as built with include_raw=False) with each one's original
+    prediction dict added back under `raw`. Detections and predictions match by position.
+    """
+    return [{**d, "raw": p} for d, p in zip(detections, get_predictions(rf_json))]
+
+
+def load_class_names(value: Optional[str]) -> List[str]:
+    """
+    ONNX_CLASS_NAMES / ROBOFLOW_CLASS_NAMES: a path to a file with one name per line,
+    or a comma-separated list.
+    """
+    if not value:
+        return []
+    if os.path.isfile(value):
+        with open(value, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    return [name.strip() for name in value.split(",") if name.strip()]
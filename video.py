@@ -0,0 +1,284 @@
+# video.py
+import asyncio
+import io
+from typing import IO, Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+try:
+    import av
+except ImportError:  # optional: only needed for video files; frame sequences work without it
+    av = None
+
+from descriptions import describe_sign
+from postprocess import box_iou
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".m4v", ".mkv", ".avi", ".webm", ".mpg", ".mpeg", ".ts")
+
+
+class Frame(NamedTuple):
+    index: int
+    time: float
+    # JPEG (or the original image file) sent to the detection backend
+    data: bytes
+    content_type: str
+    # 64-bit perceptual hash, see dhash()
+    hash: int
+
+
+def is_video(filename: str, content_type: Optional[str]) -> bool:
+    return (content_type or "").startswith("video/") or filename.lower().endswith(VIDEO_EXTENSIONS)
+
+
+def dhash(img: Image.Image) -> int:
+    """
+    64-bit difference hash: sign of horizontal brightness gradients on a 9x8 greyscale
+    thumbnail. Small changes (noise, compression, slight exposure shifts) flip few bits.
+    """
+    small = np.asarray(img.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class FrameSampler:
+    """
+    Keeps at most sample_fps frames per second of timeline (0 keeps every frame).
+    """
+
+    def __init__(self, sample_fps: float):
+        self.interval = 1.0 / sample_fps if sample_fps > 0 else 0.0
+        self._next = 0.0
+
+    def take(self, t: float) -> bool:
+        # small tolerance: frame timestamps are rounded to the stream time base
+        if t + 1e-3 < self._next:
+            return False
+        self._next = max(self._next + self.interval, t)
+        return True
+
+
+class DuplicateFilter:
+    """
+    Flags frames whose perceptual hash is within `threshold` bits of the last frame
+    that was analyzed, so near-identical consecutive frames are not sent for detection.
+    """
+
+    def __init__(self, threshold: int):
+        self.threshold = threshold
+        self._last_hash: Optional[int] = None
+        self._last_index: Optional[int] = None
+
+    def duplicate_of(self, frame: Frame) -> Optional[int]:
+        """
+        Index of the analyzed frame this one duplicates, or None (the frame becomes
+        the new reference).
+        """
+        if (
+            self.threshold >= 0
+            and self._last_hash is not None
+            and hamming(frame.hash, self._last_hash) <= self.threshold
+        ):
+            return self._last_index
+        self._last_hash, self._last_index = frame.hash, frame.index
+        return None
+
+
+def encode_frame(img: Image.Image, quality: int) -> bytes:
+    out = io.BytesIO()
+    img.convert("RGB").save(out, format="JPEG", quality=quality)
+    return out.getvalue()
+
+
+def iter_video_frames(fileobj: IO[bytes], sample_fps: float, max_frames: int, quality: int = 90) -> Iterator[Frame]:
+    """
+    Decode a video file and yield sampled frames as JPEGs with their timestamp
+    (seconds) and perceptual hash. Blocking; drive it from a thread.
+    Raises ValueError when the file cannot be decoded or has more than max_frames
+    sampled frames.
+    """
+    if av is None:
+        raise ValueError("Video decoding needs the av package (pip install av); upload the frames as images instead")
+    sampler = FrameSampler(sample_fps)
+    count = 0
+    try:
+        # explicit mode: av otherwise takes it from fileobj.mode, "w+b" for spooled uploads
+        with av.open(fileobj, mode="r") as container:
+            if not container.streams.video:
+                raise ValueError("No video stream found")
+            stream = container.streams.video[0]
+            # let FFmpeg use its own decoder threads (frame/slice threading)
+            stream.thread_type = "AUTO"
+            rate = float(stream.average_rate or 25)
+            for n, frame in enumerate(container.decode(stream)):
+                t = float(frame.time) if frame.time is not None else n / rate
+                if not sampler.take(t):
+                    continue
+                count += 1
+                if count > max_frames:
+                    raise ValueError(f"Video has more than {max_frames} sampled frames; lower sample_fps")
+                img = frame.to_image()
+                yield Frame(n, round(t, 3), encode_frame(img, quality), "image/jpeg", dhash(img))
+    except av.error.FFmpegError as e:
+        raise ValueError(f"Could not decode video: {e}")
+
+
+def image_frame(index: int, t: float, data: bytes, content_type: str) -> Frame:
+    """
+    A frame from an uploaded image file (frame sequences); the file is sent as is.
+    Raises ValueError for files that are not images. Blocking.
+    """
+    try:
+        img = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+        h = dhash(img)
+    except Exception:
+        raise ValueError("Could not decode image")
+    return Frame(index, round(t, 3), data, content_type, h)
+
+
+async def aiter_video_frames(
+    fileobj: IO[bytes], sample_fps: float, max_frames: int, quality: int = 90
+) -> AsyncIterator[Frame]:
+    """
+    Async wrapper around iter_video_frames: decoding, hashing and JPEG encoding run in a worker thread.
+    """
+    frames = iter_video_frames(fileobj, sample_fps, max_frames, quality)
+    done = object()
+    while True:
+        frame = await asyncio.to_thread(next, frames, done)
+        if frame is done:
+            return
+        yield frame
+
+
+def _xyxy(d: Dict[str, Any]) -> Optional[np.ndarray]:
+    try:
+        x, y, w, h = (float(d[k]) for k in ("x", "y", "width", "height"))
+    except (KeyError, TypeError, ValueError):
+        return None
+    return np.array([x - w / 2, y - h / 2, x + w / 2, y + h / 2])
+
+
+class Track:
+    __slots__ = ("id", "label", "first_seen", "last_seen", "first_frame", "last_frame", "hits", "best", "best_time", "box")
+
+    def __init__(self, track_id: int, label: str, frame: int, t: float, detection: Dict[str, Any], box: np.ndarray):
+        self.id = track_id
+        self.label = label
+        self.first_seen = self.last_seen = t
+        self.first_frame = self.last_frame = frame
+        self.hits = 1
+        self.best = detection
+        self.best_time = t
+        self.box = box
+
+    def update(self, frame: int, t: float, detection: Dict[str, Any], box: np.ndarray) -> None:
+        self.last_seen, self.last_frame = t, frame
+        self.hits += 1
+        self.box = box
+        if (detection.get("confidence") or 0) > (self.best.get("confidence") or 0):
+            self.best = detection
+            self.best_time = t
+
+    def to_record(self) -> Dict[str, Any]:
+        best = self.best
+        return {
+            "track_id": self.id,
+            "label": self.label,
+            "description": describe_sign(self.label) if self.label else None,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "first_frame": self.first_frame,
+            "last_frame": self.last_frame,
+            "frames": self.hits,
+            "confidence": best.get("confidence"),
+            # the box of the most confident sighting
+            "best": {"time": self.best_time, **{k: best.get(k) for k in ("x", "y", "width", "height")}},
+        }
+
+
+class IoUTracker:
+    """
+    Links detections across frames: a detection continues the active track of the same
+    label whose last box overlaps it most (IoU >= iou_threshold, greedy, best pairs first).
+    Unmatched detections start new tracks; a track not seen for more than max_gap seconds
+    is closed, so each physical sign is reported once with the time range it was visible.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_gap: float = 1.0):
+        self.iou_threshold = iou_threshold
+        self.max_gap = max_gap
+        self._active: List[Track] = []
+        self._next_id = 1
+        self._last_matched: List[Track] = []
+
+    def update(
+        self, frame: int, t: float, detections: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Returns (copies of the detections with `track_id` set, None for detections
+        without a box; records of the tracks that expired before this frame).
+        """
+        closed = self._expire(t)
+        detections = [dict(d) for d in detections]
+        boxes = [_xyxy(d) for d in detections]
+        candidates = []
+        for ti, track in enumerate(self._active):
+            idx = [di for di, d in enumerate(detections) if boxes[di] is not None and d.get("label") == track.label]
+            if not idx:
+                continue
+            ious = box_iou(track.box, np.stack([boxes[di] for di in idx]))
+            candidates.extend((iou, ti, di) for iou, di in zip(ious.tolist(), idx) if iou >= self.iou_threshold)
+
+        matched_tracks, matched_dets = set(), set()
+        self._last_matched = []
+        for _, ti, di in sorted(candidates, reverse=True):
+            if ti in matched_tracks or di in matched_dets:
+                continue
+            matched_tracks.add(ti)
+            matched_dets.add(di)
+            track = self._active[ti]
+            track.update(frame, t, detections[di], boxes[di])
+            detections[di]["track_id"] = track.id
+            self._last_matched.append(track)
+
+        for di, d in enumerate(detections):
+            if di in matched_dets:
+                continue
+            if boxes[di] is None:
+                d["track_id"] = None
+                continue
+            track = Track(self._next_id, d.get("label"), frame, t, d, boxes[di])
+            self._next_id += 1
+            self._active.append(track)
+            self._last_matched.append(track)
+            d["track_id"] = track.id
+        return detections, closed
+
+    def extend(self, frame: int, t: float) -> None:
+        """
+        A skipped duplicate frame: the signs of the last analyzed frame are still in view.
+        """
+        for track in self._last_matched:
+            track.last_seen, track.last_frame = t, frame
+
+    def _expire(self, t: float) -> List[Dict[str, Any]]:
+        expired = [track for track in self._active if t - track.last_seen > self.max_gap]
+        if not expired:
+            return []
+        self._active = [track for track in self._active if t - track.last_seen <= self.max_gap]
+        return [track.to_record() for track in expired]
+
+    def close_all(self) -> List[Dict[str, Any]]:
+        records = [track.to_record() for track in self._active]
+        self._active = []
+        self._last_matched = []
+        return records
+
+    @property
+    def total(self) -> int:
+        return self._next_id - 1
@@ -0,0 +1,59 @@
+# warmup.py
+import asyncio
+import io
+import time
+from typing import Dict, Iterable
+
+from PIL import Image
+
+from backends import DetectionBackend
+from descriptions import SIGN_DESCRIPTIONS, describe_sign
+from metrics import WARMUP_SECONDS
+
+# formats uploads usually come in; each is encoded and decoded once
+_CODECS = ("JPEG", "PNG", "WEBP")
+
+
+def warm_codecs() -> None:
+    """
+    Register Pillow's format plugins and run each common codec once, so the first
+    upload does not pay for plugin imports and codec initialisation. Blocking.
+    """
+    Image.init()
+    img = Image.new("RGB", (32, 32), (200, 30, 30))
+    for fmt in _CODECS:
+        out = io.BytesIO()
+        try:
+            img.save(out, format=fmt)
+            Image.open(io.BytesIO(out.getvalue())).load()
+        except (OSError, KeyError):
+            # codec not compiled into this Pillow build
+            pass
+
+
+def warm_descriptions(labels: Iterable[str] = ()) -> None:
+    """
+    Fill the describe_sign cache for every known label and the model's class names.
+    """
+    for label in (*SIGN_DESCRIPTIONS, *labels):
+        describe_sign(label)
+
+
+async def warm_up(backend: DetectionBackend) -> Dict[str, float]:
+    """
+    Run the warm-up steps concurrently (the backend's connections are network-bound,
+    the rest is CPU work in threads). Returns and records seconds per step.
+    """
+    async def timed(step: str, coro) -> None:
+        start = time.perf_counter()
+        await coro
+        timings[step] = round(time.perf_counter() - start, 4)
+        WARMUP_SECONDS.set(timings[step], step)
+
+    timings: Dict[str, float] = {}
+    await asyncio.gather(
+        timed("backend", backend.warm_up()),
+        timed("codecs", asyncio.to_thread(warm_codecs)),
+        timed("descriptions", asyncio.to_thread(warm_descriptions, backend.labels())),
+    )
+    return timings